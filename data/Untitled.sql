@@ -1,10 +1,11 @@
 CREATE TABLE "Card" (
-  "idCard" int PRIMARY KEY NOT NULL,
+  "idCard" int GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
   "layout" int NOT NULL,
   "name" VARCHAR(500) NOT NULL,
   "type" int NOT NULL,
-  "embed" vector(1024) NOT NULL,
-  "shortEmbed" vector(1024) NOT NULL,
+  "embed" vector(1024),
+  "shortEmbed" vector(1024),
+  "embedHash" bigint GENERATED ALWAYS AS (hashtextextended("embed"::text, 0)) STORED,
   "asciiName" VARCHAR(500),
   "convertedManaCost" float,
   "defense" int,
@@ -26,11 +27,32 @@ CREATE TABLE "Card" (
   "power" VARCHAR(500),
   "side" VARCHAR(500),
   "text" VARCHAR(10000),
-  "toughness" VARCHAR(500)
+  "toughness" VARCHAR(500),
+  "sourceHash" VARCHAR(64)
+);
+
+CREATE TABLE "EmbeddingJob" (
+  "idCard" int PRIMARY KEY NOT NULL,
+  "enqueuedAt" timestamptz NOT NULL DEFAULT now(),
+  "attempts" int NOT NULL DEFAULT 0,
+  "claimedAt" timestamptz
 );
 
+CREATE TABLE "CardDocument" (
+  "idCard" int PRIMARY KEY NOT NULL,
+  "document" jsonb NOT NULL
+);
+
+CREATE TABLE "DataVersion" (
+  "single" bool PRIMARY KEY DEFAULT true CHECK ("single"),
+  "version" bigint NOT NULL DEFAULT (extract(epoch FROM clock_timestamp()) * 1000000)::bigint,
+  "updatedAt" timestamptz NOT NULL DEFAULT now()
+);
+
+INSERT INTO "DataVersion" DEFAULT VALUES;
+
 CREATE TABLE "User" (
-  "idUser" int PRIMARY KEY NOT NULL,
+  "idUser" int GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
   "username" VARCHAR(500) NOT NULL,
   "password" VARCHAR(500) NOT NULL,
   "isAdmin" bool NOT NULL
@@ -43,7 +65,7 @@ CREATE TABLE "Favourite" (
 );
 
 CREATE TABLE "Color" (
-  "idColor" int PRIMARY KEY NOT NULL,
+  "idColor" int GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
   "colorName" VARCHAR(500) NOT NULL
 );
 
@@ -66,7 +88,7 @@ CREATE TABLE "ColorIndicator" (
 );
 
 CREATE TABLE "ForeignData" (
-  "idForeign" int PRIMARY KEY NOT NULL,
+  "idForeign" int GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
   "idCard" int NOT NULL,
   "language" VARCHAR(500) NOT NULL,
   "name" VARCHAR(500) NOT NULL,
@@ -77,7 +99,7 @@ CREATE TABLE "ForeignData" (
 );
 
 CREATE TABLE "Keyword" (
-  "idKeyword" int PRIMARY KEY NOT NULL,
+  "idKeyword" int GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
   "name" VARCHAR(500) NOT NULL
 );
 
@@ -88,24 +110,24 @@ CREATE TABLE "Keywords" (
 );
 
 CREATE TABLE "Set" (
-  "idSet" int PRIMARY KEY NOT NULL,
+  "idSet" int GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
   "name" VARCHAR(500) NOT NULL
 );
 
 CREATE TABLE "Layout" (
-  "idLayout" int PRIMARY KEY NOT NULL,
+  "idLayout" int GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
   "name" VARCHAR(500) NOT NULL
 );
 
 CREATE TABLE "LeadershipSkills" (
-  "idLeadership" int PRIMARY KEY NOT NULL,
+  "idLeadership" int GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
   "brawl" bool NOT NULL,
   "commander" bool NOT NULL,
   "oathbreaker" bool NOT NULL
 );
 
 CREATE TABLE "Legality" (
-  "idLegality" int PRIMARY KEY NOT NULL,
+  "idLegality" int GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
   "commander" int,
   "oathbreaker" int,
   "duel" int,
@@ -141,7 +163,7 @@ CREATE TABLE "Printings" (
 );
 
 CREATE TABLE "PurchaseURLs" (
-  "idPurchaseURLs" int PRIMARY KEY NOT NULL,
+  "idPurchaseURLs" int GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
   "idCard" int NOT NULL,
   "tcgplayer" VARCHAR(500),
   "cardKingdom" VARCHAR(500),
@@ -152,14 +174,14 @@ CREATE TABLE "PurchaseURLs" (
 );
 
 CREATE TABLE "Ruling" (
-  "idRuling" int PRIMARY KEY NOT NULL,
+  "idRuling" int GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
   "idCard" int NOT NULL,
   "date" date NOT NULL,
   "text" VARCHAR(10000) NOT NULL
 );
 
 CREATE TABLE "Subtype" (
-  "idSubtype" int PRIMARY KEY,
+  "idSubtype" int GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
   "name" VARCHAR(500)
 );
 
@@ -170,7 +192,7 @@ CREATE TABLE "Subtypes" (
 );
 
 CREATE TABLE "Supertype" (
-  "idSupertype" int PRIMARY KEY,
+  "idSupertype" int GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
   "name" VARCHAR(500)
 );
 
@@ -181,7 +203,7 @@ CREATE TABLE "Supertypes" (
 );
 
 CREATE TABLE "Type" (
-  "idType" int PRIMARY KEY,
+  "idType" int GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
   "name" VARCHAR(500)
 );
 
@@ -191,6 +213,114 @@ CREATE TABLE "Types" (
   PRIMARY KEY ("idType", "idCard")
 );
 
+-- The card as sent by the API (Card.show_card), stored in "CardDocument": empty values
+-- are left out and the lists are sorted
+CREATE OR REPLACE FUNCTION card_document(id int) RETURNS jsonb
+LANGUAGE sql STABLE AS $$
+SELECT jsonb_strip_nulls(jsonb_build_object(
+  'id_card', c."idCard",
+  'layout', l."name",
+  'name', c."name",
+  'type_line', t."name",
+  'ascii_name', c."asciiName",
+  'converted_mana_cost', c."convertedManaCost",
+  'defense', c."defense",
+  'edhrec_rank', c."edhrecRank",
+  'edhrec_saltiness', c."edhrecSaltiness",
+  'face_mana_value', c."faceManaValue",
+  'face_name', c."faceName",
+  'first_printing', fp."name",
+  'hand', c."hand",
+  'has_alternative_deck_limit', c."hasAlternativeDeckLimit",
+  'is_funny', c."isFunny",
+  'is_reserved', c."isReserved",
+  'life', c."life",
+  'loyalty', c."loyalty",
+  'mana_cost', c."manaCost",
+  'mana_value', c."manaValue",
+  'power', c."power",
+  'side', c."side",
+  'text', c."text",
+  'toughness', c."toughness",
+  'color_identity', (
+    SELECT jsonb_agg(co."colorName" ORDER BY co."colorName")
+    FROM "ColorIdentity" x JOIN "Color" co ON co."idColor" = x."idColor"
+    WHERE x."idCard" = c."idCard"),
+  'color_indicator', (
+    SELECT jsonb_agg(co."colorName" ORDER BY co."colorName")
+    FROM "ColorIndicator" x JOIN "Color" co ON co."idColor" = x."idColor"
+    WHERE x."idCard" = c."idCard"),
+  'colors', (
+    SELECT jsonb_agg(co."colorName" ORDER BY co."colorName")
+    FROM "Colors" x JOIN "Color" co ON co."idColor" = x."idColor"
+    WHERE x."idCard" = c."idCard"),
+  'keywords', (
+    SELECT jsonb_agg(k."name" ORDER BY k."name")
+    FROM "Keywords" x JOIN "Keyword" k ON k."idKeyword" = x."idKeyword"
+    WHERE x."idCard" = c."idCard"),
+  'printings', (
+    SELECT jsonb_agg(st."name" ORDER BY st."name")
+    FROM "Printings" x JOIN "Set" st ON st."idSet" = x."idSet"
+    WHERE x."idCard" = c."idCard"),
+  'rulings', (
+    SELECT jsonb_agg(jsonb_build_object('date', r."date", 'text', r."text")
+                     ORDER BY r."date", r."idRuling")
+    FROM "Ruling" r
+    WHERE r."idCard" = c."idCard"),
+  'subtypes', (
+    SELECT jsonb_agg(sb."name" ORDER BY sb."name")
+    FROM "Subtypes" x JOIN "Subtype" sb ON sb."idSubtype" = x."idSubtype"
+    WHERE x."idCard" = c."idCard"),
+  'supertypes', (
+    SELECT jsonb_agg(sp."name" ORDER BY sp."name")
+    FROM "Supertypes" x JOIN "Supertype" sp ON sp."idSupertype" = x."idSupertype"
+    WHERE x."idCard" = c."idCard"),
+  'types', (
+    SELECT jsonb_agg(ty."name" ORDER BY ty."name")
+    FROM "Types" x JOIN "Type" ty ON ty."idType" = x."idType"
+    WHERE x."idCard" = c."idCard"),
+  'foreignData', (
+    SELECT jsonb_agg(to_jsonb(f) - 'idForeign' - 'idCard' ORDER BY f."idForeign")
+    FROM "ForeignData" f
+    WHERE f."idCard" = c."idCard"),
+  'leadership_skills', (
+    SELECT jsonb_object_agg(e.key, e.value)
+    FROM "LeadershipSkills" ls
+    CROSS JOIN LATERAL jsonb_each(to_jsonb(ls) - 'idLeadership') e
+    WHERE ls."idLeadership" = c."leadershipSkills" AND e.value = 'true'::jsonb),
+  'legalities', (
+    SELECT jsonb_object_agg(e.key, lt."type")
+    FROM "Legality" lg
+    CROSS JOIN LATERAL jsonb_each_text(to_jsonb(lg) - 'idLegality') e
+    JOIN "LegalityType" lt ON lt."idLegalityType" = e.value::int
+    WHERE lg."idLegality" = c."legalities"),
+  'purchase_urls', (
+    SELECT jsonb_object_agg(e.key, e.value)
+    FROM "PurchaseURLs" p
+    CROSS JOIN LATERAL jsonb_each_text(to_jsonb(p) - 'idPurchaseURLs' - 'idCard') e
+    WHERE p."idCard" = c."idCard" AND e.value <> '')
+))
+FROM "Card" c
+JOIN "Layout" l ON l."idLayout" = c."layout"
+JOIN "Type" t ON t."idType" = c."type"
+LEFT JOIN "Set" fp ON fp."idSet" = c."firstPrinting"
+WHERE c."idCard" = id
+$$;
+
+ALTER TABLE "Color" ADD UNIQUE ("colorName");
+
+ALTER TABLE "Keyword" ADD UNIQUE ("name");
+
+ALTER TABLE "Layout" ADD UNIQUE ("name");
+
+ALTER TABLE "Set" ADD UNIQUE ("name");
+
+ALTER TABLE "Subtype" ADD UNIQUE ("name");
+
+ALTER TABLE "Supertype" ADD UNIQUE ("name");
+
+ALTER TABLE "Type" ADD UNIQUE ("name");
+
 ALTER TABLE "Card" ADD FOREIGN KEY ("layout") REFERENCES "Layout" ("idLayout");
 
 ALTER TABLE "Card" ADD FOREIGN KEY ("legalities") REFERENCES "Legality" ("idLegality");
@@ -201,25 +331,29 @@ ALTER TABLE "Card" ADD FOREIGN KEY ("type") REFERENCES "Type" ("idType");
 
 ALTER TABLE "Card" ADD FOREIGN KEY ("leadershipSkills") REFERENCES "LeadershipSkills" ("idLeadership");
 
+ALTER TABLE "EmbeddingJob" ADD FOREIGN KEY ("idCard") REFERENCES "Card" ("idCard") ON DELETE CASCADE;
+
+ALTER TABLE "CardDocument" ADD FOREIGN KEY ("idCard") REFERENCES "Card" ("idCard") ON DELETE CASCADE;
+
 ALTER TABLE "Favourite" ADD FOREIGN KEY ("idUser") REFERENCES "User" ("idUser");
 
-ALTER TABLE "Favourite" ADD FOREIGN KEY ("idCard") REFERENCES "Card" ("idCard");
+ALTER TABLE "Favourite" ADD FOREIGN KEY ("idCard") REFERENCES "Card" ("idCard") ON DELETE CASCADE;
 
-ALTER TABLE "Colors" ADD FOREIGN KEY ("idCard") REFERENCES "Card" ("idCard");
+ALTER TABLE "Colors" ADD FOREIGN KEY ("idCard") REFERENCES "Card" ("idCard") ON DELETE CASCADE;
 
 ALTER TABLE "Colors" ADD FOREIGN KEY ("idColor") REFERENCES "Color" ("idColor");
 
-ALTER TABLE "ColorIdentity" ADD FOREIGN KEY ("idCard") REFERENCES "Card" ("idCard");
+ALTER TABLE "ColorIdentity" ADD FOREIGN KEY ("idCard") REFERENCES "Card" ("idCard") ON DELETE CASCADE;
 
 ALTER TABLE "ColorIdentity" ADD FOREIGN KEY ("idColor") REFERENCES "Color" ("idColor");
 
-ALTER TABLE "ColorIndicator" ADD FOREIGN KEY ("idCard") REFERENCES "Card" ("idCard");
+ALTER TABLE "ColorIndicator" ADD FOREIGN KEY ("idCard") REFERENCES "Card" ("idCard") ON DELETE CASCADE;
 
 ALTER TABLE "ColorIndicator" ADD FOREIGN KEY ("idColor") REFERENCES "Color" ("idColor");
 
-ALTER TABLE "ForeignData" ADD FOREIGN KEY ("idCard") REFERENCES "Card" ("idCard");
+ALTER TABLE "ForeignData" ADD FOREIGN KEY ("idCard") REFERENCES "Card" ("idCard") ON DELETE CASCADE;
 
-ALTER TABLE "Keywords" ADD FOREIGN KEY ("idCard") REFERENCES "Card" ("idCard");
+ALTER TABLE "Keywords" ADD FOREIGN KEY ("idCard") REFERENCES "Card" ("idCard") ON DELETE CASCADE;
 
 ALTER TABLE "Keywords" ADD FOREIGN KEY ("idKeyword") REFERENCES "Keyword" ("idKeyword");
 
@@ -267,20 +401,36 @@ ALTER TABLE "Legality" ADD FOREIGN KEY ("oldschool") REFERENCES "LegalityType" (
 
 ALTER TABLE "Printings" ADD FOREIGN KEY ("idSet") REFERENCES "Set" ("idSet");
 
-ALTER TABLE "Printings" ADD FOREIGN KEY ("idCard") REFERENCES "Card" ("idCard");
+ALTER TABLE "Printings" ADD FOREIGN KEY ("idCard") REFERENCES "Card" ("idCard") ON DELETE CASCADE;
 
-ALTER TABLE "PurchaseURLs" ADD FOREIGN KEY ("idCard") REFERENCES "Card" ("idCard");
+ALTER TABLE "PurchaseURLs" ADD FOREIGN KEY ("idCard") REFERENCES "Card" ("idCard") ON DELETE CASCADE;
 
-ALTER TABLE "Ruling" ADD FOREIGN KEY ("idCard") REFERENCES "Card" ("idCard");
+ALTER TABLE "Ruling" ADD FOREIGN KEY ("idCard") REFERENCES "Card" ("idCard") ON DELETE CASCADE;
 
 ALTER TABLE "Subtypes" ADD FOREIGN KEY ("idSubtype") REFERENCES "Subtype" ("idSubtype");
 
-ALTER TABLE "Subtypes" ADD FOREIGN KEY ("idCard") REFERENCES "Card" ("idCard");
+ALTER TABLE "Subtypes" ADD FOREIGN KEY ("idCard") REFERENCES "Card" ("idCard") ON DELETE CASCADE;
 
 ALTER TABLE "Supertypes" ADD FOREIGN KEY ("idSupertype") REFERENCES "Supertype" ("idSupertype");
 
-ALTER TABLE "Supertypes" ADD FOREIGN KEY ("idCard") REFERENCES "Card" ("idCard");
+ALTER TABLE "Supertypes" ADD FOREIGN KEY ("idCard") REFERENCES "Card" ("idCard") ON DELETE CASCADE;
 
 ALTER TABLE "Types" ADD FOREIGN KEY ("idType") REFERENCES "Type" ("idType");
 
-ALTER TABLE "Types" ADD FOREIGN KEY ("idCard") REFERENCES "Card" ("idCard");
+ALTER TABLE "Types" ADD FOREIGN KEY ("idCard") REFERENCES "Card" ("idCard") ON DELETE CASCADE;
+
+CREATE INDEX ON "Card" ("embedHash");
+
+CREATE INDEX ON "Printings" ("idCard");
+
+CREATE INDEX ON "Subtypes" ("idCard");
+
+CREATE INDEX ON "Supertypes" ("idCard");
+
+CREATE INDEX ON "Types" ("idCard");
+
+CREATE INDEX ON "ForeignData" ("idCard");
+
+CREATE INDEX ON "PurchaseURLs" ("idCard");
+
+CREATE INDEX ON "Ruling" ("idCard");
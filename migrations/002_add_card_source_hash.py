@@ -0,0 +1,52 @@
+import sys
+import os
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+src_path = os.path.join(project_root, 'src')
+
+sys.path.insert(0, project_root)
+sys.path.insert(0, src_path)
+
+from db_connection import DBConnection
+
+
+def migrate():
+    """Add the sourceHash column used by sync_database.py to the Card table."""
+    conn = None
+    try:
+        print(" Connecting to the database via DBConnection...")
+
+        db = DBConnection()
+        conn = db.connection
+        cursor = conn.cursor()
+
+        cursor.execute('SET search_path TO defaultdb, public;')
+
+        print("Adding column sourceHash to Card...")
+        cursor.execute('ALTER TABLE "Card" ADD COLUMN IF NOT EXISTS "sourceHash" VARCHAR(64);')
+
+        conn.commit()
+        print(" Migration successful!")
+        print("   → The next run of sync_database.py will fill the column")
+
+        cursor.close()
+
+    except Exception as e:
+        print(f"Error: {e}")
+        if conn:
+            conn.rollback()
+        import traceback
+        traceback.print_exc()
+        raise
+    finally:
+        if conn:
+            conn.close()
+            print("Connection closed")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("  Migration: Add Card.sourceHash")
+    print("=" * 60)
+    migrate()
+    print("=" * 60)
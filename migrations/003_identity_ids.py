@@ -0,0 +1,88 @@
+import sys
+import os
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+src_path = os.path.join(project_root, 'src')
+
+sys.path.insert(0, project_root)
+sys.path.insert(0, src_path)
+
+from db_connection import DBConnection
+from utils.import_pipeline import IDENTITY_COLUMNS, reset_identities
+
+# Dimension tables whose name must be unique for the get-or-create of CardDao
+UNIQUE_NAMES = {"Color": "colorName", "Keyword": "name", "Layout": "name", "Set": "name",
+                "Subtype": "name", "Supertype": "name", "Type": "name"}
+
+
+def migrate():
+    """Generate the ids with identity columns, and make the names of the dimensions unique."""
+    conn = None
+    try:
+        print(" Connecting to the database via DBConnection...")
+
+        db = DBConnection()
+        conn = db.connection
+        cursor = conn.cursor()
+
+        cursor.execute('SET search_path TO defaultdb, public;')
+
+        for table, column in IDENTITY_COLUMNS.items():
+            cursor.execute("""
+                SELECT is_identity, column_default FROM information_schema.columns
+                WHERE table_schema = 'defaultdb' AND table_name = %s AND column_name = %s;
+            """, (table, column))
+            info = cursor.fetchone()
+            if info["is_identity"] == "YES":
+                print(f"✓ {table}.{column} is already an identity")
+                continue
+
+            if info["column_default"]:
+                # idUser uses the sequence of migrations/001_fix_user_table.py
+                cursor.execute(f'ALTER TABLE "{table}" ALTER COLUMN "{column}" DROP DEFAULT;')
+                cursor.execute(f'DROP SEQUENCE IF EXISTS "{table}_{column}_seq";')
+
+            cursor.execute(f'ALTER TABLE "{table}" ALTER COLUMN "{column}" SET NOT NULL;')
+            cursor.execute(
+                f'ALTER TABLE "{table}" ALTER COLUMN "{column}" '
+                f'ADD GENERATED BY DEFAULT AS IDENTITY;'
+            )
+            print(f"   ✓ {table}.{column} is now an identity")
+
+        reset_identities(cursor)
+        print("   ✓ Identities moved after the highest ids")
+
+        for table, column in UNIQUE_NAMES.items():
+            cursor.execute("""
+                SELECT 1 FROM information_schema.table_constraints
+                WHERE table_schema = 'defaultdb' AND table_name = %s
+                AND constraint_type = 'UNIQUE';
+            """, (table,))
+            if cursor.fetchone() is None:
+                cursor.execute(f'ALTER TABLE "{table}" ADD UNIQUE ("{column}");')
+                print(f"   ✓ {table}.{column} is now unique")
+
+        conn.commit()
+        print(" Migration successful!")
+
+        cursor.close()
+
+    except Exception as e:
+        print(f"Error: {e}")
+        if conn:
+            conn.rollback()
+        import traceback
+        traceback.print_exc()
+        raise
+    finally:
+        if conn:
+            conn.close()
+            print("Connection closed")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("  Migration: Identity ids and unique dimension names")
+    print("=" * 60)
+    migrate()
+    print("=" * 60)
@@ -0,0 +1,61 @@
+import sys
+import os
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+src_path = os.path.join(project_root, 'src')
+
+sys.path.insert(0, project_root)
+sys.path.insert(0, src_path)
+
+from db_connection import DBConnection
+
+
+def migrate():
+    """Let the embeddings be pending, and add the queue of the EmbeddingWorker."""
+    conn = None
+    try:
+        print(" Connecting to the database via DBConnection...")
+
+        db = DBConnection()
+        conn = db.connection
+        cursor = conn.cursor()
+
+        cursor.execute('SET search_path TO defaultdb, public;')
+
+        cursor.execute('ALTER TABLE "Card" ALTER COLUMN "embed" DROP NOT NULL;')
+        cursor.execute('ALTER TABLE "Card" ALTER COLUMN "shortEmbed" DROP NOT NULL;')
+        print("   ✓ Card embeddings can be pending (NULL)")
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS "EmbeddingJob" (
+                "idCard" int PRIMARY KEY NOT NULL REFERENCES "Card" ("idCard"),
+                "enqueuedAt" timestamptz NOT NULL DEFAULT now(),
+                "attempts" int NOT NULL DEFAULT 0
+            );
+        """)
+        print("   ✓ EmbeddingJob table created")
+
+        conn.commit()
+        print(" Migration successful!")
+
+        cursor.close()
+
+    except Exception as e:
+        print(f"Error: {e}")
+        if conn:
+            conn.rollback()
+        import traceback
+        traceback.print_exc()
+        raise
+    finally:
+        if conn:
+            conn.close()
+            print("Connection closed")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("  Migration: Asynchronous embedding jobs")
+    print("=" * 60)
+    migrate()
+    print("=" * 60)
@@ -0,0 +1,67 @@
+import sys
+import os
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+src_path = os.path.join(project_root, 'src')
+
+sys.path.insert(0, project_root)
+sys.path.insert(0, src_path)
+
+from db_connection import DBConnection
+
+
+def migrate():
+    """Recreate the foreign keys referencing "Card" with ON DELETE CASCADE."""
+    conn = None
+    try:
+        print(" Connecting to the database via DBConnection...")
+
+        db = DBConnection()
+        conn = db.connection
+        cursor = conn.cursor()
+
+        cursor.execute('SET search_path TO defaultdb, public;')
+
+        # confdeltype 'c' is ON DELETE CASCADE
+        cursor.execute("""
+            SELECT conname, conrelid::regclass::text AS "table", confdeltype
+            FROM pg_constraint
+            WHERE contype = 'f' AND confrelid = '"Card"'::regclass;
+        """)
+        for constraint in cursor.fetchall():
+            if constraint["confdeltype"] == "c":
+                print(f"✓ {constraint['table']} already cascades")
+                continue
+            cursor.execute(
+                f'ALTER TABLE {constraint["table"]} DROP CONSTRAINT "{constraint["conname"]}";'
+            )
+            cursor.execute(
+                f'ALTER TABLE {constraint["table"]} ADD CONSTRAINT "{constraint["conname"]}" '
+                f'FOREIGN KEY ("idCard") REFERENCES "Card" ("idCard") ON DELETE CASCADE;'
+            )
+            print(f"   ✓ {constraint['table']} now cascades")
+
+        conn.commit()
+        print(" Migration successful!")
+
+        cursor.close()
+
+    except Exception as e:
+        print(f"Error: {e}")
+        if conn:
+            conn.rollback()
+        import traceback
+        traceback.print_exc()
+        raise
+    finally:
+        if conn:
+            conn.close()
+            print("Connection closed")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("  Migration: Cascading card deletes")
+    print("=" * 60)
+    migrate()
+    print("=" * 60)
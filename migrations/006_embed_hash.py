@@ -0,0 +1,59 @@
+import sys
+import os
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+src_path = os.path.join(project_root, 'src')
+
+sys.path.insert(0, project_root)
+sys.path.insert(0, src_path)
+
+from db_connection import DBConnection
+
+
+def migrate():
+    """Add the indexed "embedHash" column used by exact embedding lookups."""
+    conn = None
+    try:
+        print(" Connecting to the database via DBConnection...")
+
+        db = DBConnection()
+        conn = db.connection
+        cursor = conn.cursor()
+
+        cursor.execute('SET search_path TO defaultdb, public;')
+
+        # Computed by the database: every writer of "embed" keeps it up to date
+        print(" Adding the embedHash column (rewrites the Card table)...")
+        cursor.execute("""
+            ALTER TABLE "Card" ADD COLUMN IF NOT EXISTS "embedHash" bigint
+            GENERATED ALWAYS AS (hashtextextended("embed"::text, 0)) STORED;
+        """)
+        print("   ✓ embedHash column ready")
+
+        cursor.execute('CREATE INDEX IF NOT EXISTS "Card_embedHash_idx" ON "Card" ("embedHash");')
+        print("   ✓ embedHash index ready")
+
+        conn.commit()
+        print(" Migration successful!")
+
+        cursor.close()
+
+    except Exception as e:
+        print(f"Error: {e}")
+        if conn:
+            conn.rollback()
+        import traceback
+        traceback.print_exc()
+        raise
+    finally:
+        if conn:
+            conn.close()
+            print("Connection closed")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("  Migration: Embedding hash column")
+    print("=" * 60)
+    migrate()
+    print("=" * 60)
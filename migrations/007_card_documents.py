@@ -0,0 +1,85 @@
+import sys
+import os
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+src_path = os.path.join(project_root, 'src')
+
+sys.path.insert(0, project_root)
+sys.path.insert(0, src_path)
+
+from db_connection import DBConnection
+from dao.card_dao import CardDao
+
+# Tables read by card_document without an index starting with "idCard"
+CARD_ID_INDEXES = [
+    "Printings", "Subtypes", "Supertypes", "Types", "ForeignData", "PurchaseURLs", "Ruling"
+]
+
+
+def card_document_sql() -> str:
+    """The CREATE FUNCTION card_document statement of data/Untitled.sql"""
+    with open(os.path.join(project_root, "data", "Untitled.sql"), encoding="utf-8") as schema:
+        schema_sql = schema.read()
+    start = schema_sql.index("CREATE OR REPLACE FUNCTION card_document")
+    end = schema_sql.index("$$;", start) + len("$$;")
+    return schema_sql[start:end]
+
+
+def migrate():
+    """Create the "CardDocument" table and fill it with the document of every card."""
+    conn = None
+    try:
+        print(" Connecting to the database via DBConnection...")
+
+        db = DBConnection()
+        conn = db.connection
+        cursor = conn.cursor()
+
+        cursor.execute('SET search_path TO defaultdb, public;')
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS "CardDocument" (
+                "idCard" int PRIMARY KEY NOT NULL
+                    REFERENCES "Card" ("idCard") ON DELETE CASCADE,
+                "document" jsonb NOT NULL
+            );
+        """)
+        print("   ✓ CardDocument table ready")
+
+        for table in CARD_ID_INDEXES:
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS "{table}_idCard_idx" ON "{table}" ("idCard");'
+            )
+        print("   ✓ idCard indexes ready")
+
+        cursor.execute(card_document_sql())
+        print("   ✓ card_document function ready")
+
+        CardDao().refresh_documents(cursor)
+        cursor.execute('SELECT COUNT(*) AS "count" FROM "CardDocument";')
+        print(f"   ✓ {cursor.fetchone()['count']} documents built")
+
+        conn.commit()
+        print(" Migration successful!")
+
+        cursor.close()
+
+    except Exception as e:
+        print(f"Error: {e}")
+        if conn:
+            conn.rollback()
+        import traceback
+        traceback.print_exc()
+        raise
+    finally:
+        if conn:
+            conn.close()
+            print("Connection closed")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("  Migration: Card documents")
+    print("=" * 60)
+    migrate()
+    print("=" * 60)
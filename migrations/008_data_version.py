@@ -0,0 +1,60 @@
+import sys
+import os
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+src_path = os.path.join(project_root, 'src')
+
+sys.path.insert(0, project_root)
+sys.path.insert(0, src_path)
+
+from db_connection import DBConnection
+
+
+def migrate():
+    """Create the "DataVersion" row bumped by every write to the cards."""
+    conn = None
+    try:
+        print(" Connecting to the database via DBConnection...")
+
+        db = DBConnection()
+        conn = db.connection
+        cursor = conn.cursor()
+
+        cursor.execute('SET search_path TO defaultdb, public;')
+
+        # Read by the API to build the ETag and Last-Modified headers of the card endpoints
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS "DataVersion" (
+              "single" bool PRIMARY KEY DEFAULT true CHECK ("single"),
+              "version" bigint NOT NULL
+                DEFAULT (extract(epoch FROM clock_timestamp()) * 1000000)::bigint,
+              "updatedAt" timestamptz NOT NULL DEFAULT now()
+            );
+        """)
+        cursor.execute('INSERT INTO "DataVersion" DEFAULT VALUES ON CONFLICT DO NOTHING;')
+        print("   ✓ DataVersion table ready")
+
+        conn.commit()
+        print(" Migration successful!")
+
+        cursor.close()
+
+    except Exception as e:
+        print(f"Error: {e}")
+        if conn:
+            conn.rollback()
+        import traceback
+        traceback.print_exc()
+        raise
+    finally:
+        if conn:
+            conn.close()
+            print("Connection closed")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("  Migration: Data version")
+    print("=" * 60)
+    migrate()
+    print("=" * 60)
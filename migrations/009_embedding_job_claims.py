@@ -0,0 +1,54 @@
+import sys
+import os
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+src_path = os.path.join(project_root, 'src')
+
+sys.path.insert(0, project_root)
+sys.path.insert(0, src_path)
+
+from db_connection import DBConnection
+
+
+def migrate():
+    """Let the EmbeddingWorker claim its jobs without holding a transaction open."""
+    conn = None
+    try:
+        print(" Connecting to the database via DBConnection...")
+
+        db = DBConnection()
+        conn = db.connection
+        cursor = conn.cursor()
+
+        cursor.execute('SET search_path TO defaultdb, public;')
+
+        # Set while a worker computes the embeddings of the job, outside of any transaction
+        cursor.execute(
+            'ALTER TABLE "EmbeddingJob" ADD COLUMN IF NOT EXISTS "claimedAt" timestamptz;'
+        )
+        print("   ✓ EmbeddingJob.claimedAt added")
+
+        conn.commit()
+        print(" Migration successful!")
+
+        cursor.close()
+
+    except Exception as e:
+        print(f"Error: {e}")
+        if conn:
+            conn.rollback()
+        import traceback
+        traceback.print_exc()
+        raise
+    finally:
+        if conn:
+            conn.close()
+            print("Connection closed")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("  Migration: Embedding job claims")
+    print("=" * 60)
+    migrate()
+    print("=" * 60)
@@ -1,15 +1,29 @@
 import logging
 
-from fastapi import FastAPI, HTTPException, Depends, Query
-from fastapi.responses import RedirectResponse
-from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Depends, Query, Request
+from fastapi.responses import RedirectResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from anyio import to_thread
+from pydantic import BaseModel, ValidationError
 from fastapi.security import OAuth2PasswordRequestForm
 from security.auth import create_access_token, verify_token, verify_admin
 from datetime import timedelta
-from typing import List, Union
+from typing import List, Optional, Union
 
 from service.user_service import UserService
-from service.card_service import CardService
+from service.card_service import CardService, in_flight
+from business_object.card import CARD_FIELDS
+from db_connection import POOL_SIZE, DBConnection
+from utils.card_cache import CardCache
+from utils.card_listener import CardChangeListener
+from utils.compression import (
+    CompressedCache, CompressionMiddleware, CompressionStats, choose_encoding
+)
+from utils.data_version import DataVersion
+from utils.embedding_worker import EmbeddingWorker
+from utils.fast_json import FastJSONResponse
+from utils.http_cache import conditional
 from utils.log_init import initialize_logs
 
 tags = [
@@ -38,9 +52,31 @@ tags = [
         "description": "Admin operations for user management",
     },
 ]
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Computes the embeddings of the created and updated cards in the background, and evicts
+    from the caches of this worker the cards changed by the other ones.
+
+    The routes are not async: they use psycopg and requests, which block, so Starlette runs
+    them in its thread pool. The pool gets as many threads as the connection pool of
+    DBConnection has connections.
+    """
+    to_thread.current_default_thread_limiter().total_tokens = POOL_SIZE
+    EmbeddingWorker().start()
+    CardChangeListener().start()
+    yield
+    CardChangeListener().stop()
+    EmbeddingWorker().stop()
+    DBConnection().pool.close()
+
+
 # SETTING UP THE API
 root_path = "/proxy/9877"
 app = FastAPI(
+    lifespan=lifespan,
     title="MagicSearch",
     root_path=root_path,
     docs_url="/docs",
@@ -48,6 +84,7 @@ app = FastAPI(
     openapi_url="/openapi.json",
     openapi_tags=tags
 )
+app.add_middleware(CompressionMiddleware)
 
 initialize_logs("WebserviceOK")
 
@@ -137,7 +174,7 @@ class userModel(BaseModel):
 # USER LOG IN
 # creating a user
 @app.post("/user/", tags=["User : sign up !"])
-async def create_user(j: userModel):
+def create_user(j: userModel):
     """Create a new user"""
     logging.info("creating a user")
 
@@ -158,7 +195,7 @@ async def create_user(j: userModel):
 
 # log in system with token
 @app.post("/login", tags=["User : log in !"])
-async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+def login(form_data: OAuth2PasswordRequestForm = Depends()):
     """
     Authentifie un utilisateur et renvoie un JWT.
     Compatible avec Swagger UI (OAuth2 password flow).
@@ -178,86 +215,170 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     return {"access_token": access_token, "token_type": "bearer"}
 
 
+def card_fields(
+    fields: Optional[str] = Query(
+        None,
+        description="Comma-separated fields of the cards to return (id_card is always returned)"
+                    ", e.g. name,mana_cost,type_line. All of them if not given"
+    )
+) -> Optional[List[str]]:
+    """Parses the fields query parameter of the card endpoints"""
+    if fields is None:
+        return None
+    wanted = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in wanted if field not in CARD_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return wanted
+
+
 # ROAMING IN THE MAGICSEARCH DATABASE
 # get a random card
 # Card_Service().view_random_card()
-@app.get("/card/", tags=["Roaming in the MagicSearch Database"])
-async def view_random():
+@app.get(
+    "/card/", tags=["Roaming in the MagicSearch Database"], response_class=FastJSONResponse
+)
+def view_random(fields: Optional[List[str]] = Depends(card_fields)):
     """get a random card"""
     logging.info("get a random card")
-    return card_service.view_random_card().show_card()
+    return FastJSONResponse(card_service.view_random_card(fields).show_card(fields))
 
 
 # get a card by its id
-# Card_Service().id_search(id)
-@app.get("/card/{id}", tags=["Roaming in the MagicSearch Database"])
-async def id_search(id: int):
+# Card_Service().card_document_json(id)
+@app.get(
+    "/card/{id}", tags=["Roaming in the MagicSearch Database"], response_class=FastJSONResponse
+)
+def id_search(
+    id: int, request: Request, fields: Optional[List[str]] = Depends(card_fields)
+):
     """Finds a card based on its id """
     logging.info("Finds a card based on its id ")
-    return card_service.id_search(id).show_card()
+    validator = DataVersion().card(id)
+    # If-None-Match: * asks whether the card exists: only then is the document read here
+    headers, not_modified = conditional(
+        request, validator,
+        exists=lambda: card_service.card_document_json(id, fields) is not None
+    )
+    if not_modified:
+        return not_modified
+    encoding = choose_encoding(request.headers.get("accept-encoding"))
+    if validator is None or encoding is None:
+        body, compressed = card_service.card_document_json(id, fields), False
+    else:
+        # Compressed once per version of the card, then sent as it is. A missing card gives
+        # None, which is never cached
+        body, compressed = CompressedCache().get_or_compress(
+            (id, request.url.query), validator[0], encoding,
+            lambda: card_service.card_document_json(id, fields)
+        )
+    if body is None:
+        raise HTTPException(status_code=404, detail="Card not found")
+    if compressed:
+        headers = {**headers, "Content-Encoding": encoding, "Vary": "Accept-Encoding"}
+    return FastJSONResponse(body, headers=headers)
 
 
 # get a card by its name
 # Card_Service().name_search(name)
-@app.get("/card/by-name/{name}", tags=["Roaming in the MagicSearch Database"])
-async def name_search(name: str):
+@app.get(
+    "/card/by-name/{name}", tags=["Roaming in the MagicSearch Database"],
+    response_class=FastJSONResponse
+)
+def name_search(
+    name: str, request: Request, fields: Optional[List[str]] = Depends(card_fields)
+):
     """Finds a card based on its name """
     logging.info("Finds a card based on its name")
-    cards = card_service.name_search(name)
+    headers, not_modified = conditional(request, DataVersion().all_cards())
+    if not_modified:
+        return not_modified
+    cards = card_service.name_search(name, fields)
     cards_as_dict = []
     for card in cards:
-        cards_as_dict.append(card.show_card())
-    return cards_as_dict
+        cards_as_dict.append(card.show_card(fields))
+    return FastJSONResponse(cards_as_dict, headers=headers)
 
 
 # get the result of a semantic search (Detailed Embed = normal)
 # Card_Service().semantic_search(search)
-@app.get("/card/semantic/recommended/{search}", tags=["Roaming in the MagicSearch Database"])
-async def semantic_search(search):
+@app.get(
+    "/card/semantic/recommended/{search}", tags=["Roaming in the MagicSearch Database"],
+    response_class=FastJSONResponse
+)
+def semantic_search(search, fields: Optional[List[str]] = Depends(card_fields)):
     """Finds a card based on its a semantic search"""
     logging.info("Finds a card based on its a semantic search (recommended)")
-    cards = card_service.semantic_search(search)
+    cards = card_service.semantic_search(search, fields)
     cards_as_dict = []
     for card in cards:
-        cards_as_dict.append(card.show_card())
-    return cards_as_dict
+        cards_as_dict.append(card.show_card(fields))
+    return FastJSONResponse(cards_as_dict)
 
 
 # get the result of a semantic search (shortEmbed = FO1a)
 # Card_Service().semantic_search(search)
-@app.get("/card/semantic/short/{search}", tags=["Roaming in the MagicSearch Database"])
-async def semantic_search_shortEmbed(search):
+@app.get(
+    "/card/semantic/short/{search}", tags=["Roaming in the MagicSearch Database"],
+    response_class=FastJSONResponse
+)
+def semantic_search_shortEmbed(
+    search, fields: Optional[List[str]] = Depends(card_fields)
+):
     """Finds a card based on its a semantic search"""
     logging.info("Finds a card based on its a semantic search")
-    cards = card_service.semantic_search_shortEmbed(search)
+    cards = card_service.semantic_search_shortEmbed(search, fields)
     cards_as_dict = []
     for card in cards:
-        cards_as_dict.append(card.show_card())
-    return cards_as_dict
+        cards_as_dict.append(card.show_card(fields))
+    return FastJSONResponse(cards_as_dict)
 
 
 # get a filtered list of cards : here instead of showing ALL the cards that match the filters we
 # page the result !
 # card_Service().filter_num_service(self, filter: Filter)
-@app.post("/card/filter/{filterModel, page}", tags=["Roaming in the MagicSearch Database"])
-async def filter_search(
+@app.post(
+    "/card/filter/{filterModel, page}", tags=["Roaming in the MagicSearch Database"],
+    response_class=FastJSONResponse
+)
+def filter_search(
     filters: List[FilterModel],
-    page: int = Query(1, ge=1, description="Page number")
+    page: int = Query(1, ge=1, description="Page number"),
+    fields: Optional[List[str]] = Depends(card_fields)
      ):
     """
     Filters with pagination - allows you to get the result of a filter quickly even if it returns
-    thousands of results
+    thousands of results. As a POST, a page is never answered with a 304 Not Modified.
     """
     logging.info(f"Filtering with {len(filters)} filters, page {page}")
+    result = card_service.filter_search(filters, page, fields)
+    return FastJSONResponse(result)
+
 
-    result = card_service.filter_search(filters, page)
-    return result
+# get all the cards matching the filters, streamed as NDJSON
+# card_Service().filter_export(filters, fields)
+@app.post("/card/export/filter", tags=["Roaming in the MagicSearch Database"])
+def filter_export(
+    filters: List[FilterModel], fields: Optional[List[str]] = Depends(card_fields)
+):
+    """
+    Streams every card matching the filters, one JSON document per line (NDJSON), in the order
+    of their ids: the filters run once, instead of once per page of /card/filter
+    """
+    logging.info(f"Exporting the cards matching {len(filters)} filters")
+    try:
+        chunks = card_service.filter_export(filters, fields)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if chunks is None:
+        raise HTTPException(status_code=500, detail="The export failed")
+    return StreamingResponse(chunks, media_type="application/x-ndjson")
 
 
 # FAVOURITE CARDS
 # add a favourite card
 @app.post("/user/add_to_favourite/{idCard}", tags=["Your very own favourite cards list"])
-async def Add_favourite_card(idCard: int, current_user=Depends(verify_token)):
+def Add_favourite_card(idCard: int, current_user=Depends(verify_token)):
     """Adds a card to the favourite cards of the current user"""
     logging.info("Adds a card to the favourite cards of the current user")
     user_id = current_user.user_id
@@ -265,7 +386,7 @@ async def Add_favourite_card(idCard: int, current_user=Depends(verify_token)):
 
 
 @app.get("/user/see_favourites/", tags=["Your very own favourite cards list"])
-async def List_favourite_cards(current_user=Depends(verify_token)):
+def List_favourite_cards(current_user=Depends(verify_token)):
     """List all the favourite cards of the current user"""
     logging.info("List all the favourite cards of the current user")
     user_id = current_user.user_id
@@ -273,7 +394,7 @@ async def List_favourite_cards(current_user=Depends(verify_token)):
 
 
 @app.delete("/user/delete_favourite/{idCard}", tags=["Your very own favourite cards list"])
-async def Delete_favourite_card(idCard: int, current_user=Depends(verify_token)):
+def Delete_favourite_card(idCard: int, current_user=Depends(verify_token)):
     """Delete the card "idCard" from the list of favourites of the current user"""
     logging.info("Delete the card 'idCard' from the list of favourites of the current user")
     user_id = current_user.user_id
@@ -283,7 +404,7 @@ async def Delete_favourite_card(idCard: int, current_user=Depends(verify_token))
 # DATABASE MANAGEMENT :CARDS
 # create a card
 @app.post("/card/create/cardModel", tags=["Database management : cards"])
-async def Create_card(card: cardModel, current_user=Depends(verify_admin)):
+def Create_card(card: cardModel, current_user=Depends(verify_admin)):
     """Creates a card in the Magicsearch database"""
     logging.info("Creates a card in the Magicsearch database")
     return card_service.create_card(card_service.cardModel_to_Card(card))
@@ -291,7 +412,7 @@ async def Create_card(card: cardModel, current_user=Depends(verify_admin)):
 
 # update a card
 @app.put("/card/update/cardModel", tags=["Database management : cards"])
-async def Update_card(card: cardModel, current_user=Depends(verify_admin)):
+def Update_card(card: cardModel, current_user=Depends(verify_admin)):
     """Updates a card in the Magicsearch database"""
     logging.info("Updates a card in the Magicsearch database")
     return card_service.update_card(card_service.cardModel_to_Card(card))
@@ -299,12 +420,102 @@ async def Update_card(card: cardModel, current_user=Depends(verify_admin)):
 
 # delete a card
 @app.delete("/card/delete/cardModel}", tags=["Database management : cards"])
-async def Delete_card(idcard: int, current_user=Depends(verify_admin)):
+def Delete_card(idcard: int, current_user=Depends(verify_admin)):
     """Deletes a card in the Magicsearch database"""
     logging.info("Deletes a card in the Magicsearch database")
     return card_service.delete_card(idcard)
 
 
+# create several cards
+@app.post("/card/create/bulk", tags=["Database management : cards"])
+def Create_cards(cards: List[cardModel], current_user=Depends(verify_admin)):
+    """Creates several cards in the Magicsearch database, with one result per card"""
+    logging.info(f"Creates {len(cards)} cards in the Magicsearch database")
+    return card_service.create_cards([card_service.cardModel_to_Card(card) for card in cards])
+
+
+# create several cards from a NDJSON body (one cardModel per line)
+@app.post("/card/create/ndjson", tags=["Database management : cards"])
+async def Create_cards_ndjson(request: Request, current_user=Depends(verify_admin)):
+    """
+    Creates the cards of a NDJSON body in the Magicsearch database. The lines that are not
+    a valid cardModel get an error result, the others are created.
+    """
+    cards = []
+    invalid = {}
+    index = 0
+    async for line in ndjson_lines(request):
+        try:
+            cards.append(card_service.cardModel_to_Card(cardModel.model_validate_json(line)))
+        except ValidationError as e:
+            invalid[index] = str(e)
+        index += 1
+    logging.info(f"Creates {len(cards)} cards in the Magicsearch database from NDJSON")
+
+    created = iter(
+        (await run_in_threadpool(card_service.create_cards, cards) or []) if cards else []
+    )
+    results = []
+    for line_index in range(index):
+        if line_index in invalid:
+            results.append({"index": line_index, "id_card": None, "status": "error",
+                            "error": invalid[line_index]})
+        else:
+            result = next(created, None) or {"id_card": None, "status": "error",
+                                             "error": "database error"}
+            results.append({**result, "index": line_index})
+    return results
+
+
+async def ndjson_lines(request: Request):
+    """Yields the non-empty lines of the body of the request as it is received"""
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+
+# update several cards
+@app.put("/card/update/bulk", tags=["Database management : cards"])
+def Update_cards(cards: List[cardModel], current_user=Depends(verify_admin)):
+    """Updates several cards in the Magicsearch database, with one result per card"""
+    logging.info(f"Updates {len(cards)} cards in the Magicsearch database")
+    return card_service.update_cards([card_service.cardModel_to_Card(card) for card in cards])
+
+
+# delete several cards
+@app.delete("/card/delete/bulk", tags=["Database management : cards"])
+def Delete_cards(ids: List[int] = Query(...), current_user=Depends(verify_admin)):
+    """Deletes several cards in the Magicsearch database, with one result per id"""
+    logging.info(f"Deletes {len(ids)} cards in the Magicsearch database")
+    return card_service.delete_cards(ids)
+
+
+# statistics of the card cache
+@app.get("/card/cache/stats", tags=["Database management : cards"])
+async def Card_cache_stats(current_user=Depends(verify_admin)):
+    """
+    Number of cards kept in memory by this process, memory used and hit rate, and number of
+    reads that shared the result of an identical one in flight
+    """
+    return {**CardCache().stats(), "in_flight": in_flight.stats()}
+
+
+# statistics of the compression
+@app.get("/card/compression/stats", tags=["Database management : cards"])
+async def Compression_stats(current_user=Depends(verify_admin)):
+    """
+    Bytes on the wire and CPU time per compressed response of this worker, and state of its
+    cache of compressed cards
+    """
+    return {**CompressionStats().stats(), "cache": CompressedCache().stats()}
+
+
 # DATABASE MANAGEMENT : USER
 # routes utilisateurs : get user et get user id
 # list the users
@@ -312,7 +523,7 @@ async def Delete_card(idcard: int, current_user=Depends(verify_admin)):
 # list all users
 
 @app.get("/user/", tags=["Database management : user"])
-async def list_all_users(current_user=Depends(verify_admin)):
+def list_all_users(current_user=Depends(verify_admin)):
     """List all users, only for admins."""
     logging.info(f"List all users requested by {getattr(current_user, 'username', current_user)}")
     return user_service.list_all(current_user)
@@ -320,7 +531,7 @@ async def list_all_users(current_user=Depends(verify_admin)):
 
 # delete a user
 @app.delete("/user/{username}", tags=["Database management : user"])
-async def delete_user(username: str, current_user=Depends(verify_admin)):
+def delete_user(username: str, current_user=Depends(verify_admin)):
     """Deleting a user, only for admins."""
     logging.info(f"Attempting to delete user: {username} by {current_user.username}")
     user = user_service.find_by_username(username)
@@ -340,7 +551,7 @@ async def delete_user(username: str, current_user=Depends(verify_admin)):
 
 # get a user by their id
 @app.get("/user/{user_id}", tags=["Database management : user"])
-async def user_by_id(user_id: int, current_user=Depends(verify_admin)):
+def user_by_id(user_id: int, current_user=Depends(verify_admin)):
     """Finds a user based on their id """
     logging.info(
         f"User with id {user_id} requested by {getattr(current_user, 'username', current_user)}"
@@ -0,0 +1,68 @@
+"""
+Latency of a card read by the API in three ways: built from the tables with an empty
+CardCache (CardService.id_search then Card.show_card), built from the cards already in the
+CardCache, and the ready-made document of "CardDocument" (the /card/{id} route, a single
+primary key lookup). Needs the database of the .env, which is only read.
+
+From the src folder :
+    python -m benchmark.bench_card_cache [number of cards]
+"""
+import random
+import sys
+import time
+
+from dao.card_dao import CardDao
+from service.card_service import CardService
+from utils.card_cache import CardCache
+
+
+def built_card(id_card: int) -> dict:
+    """The card built from the tables, or from the CardCache"""
+    return CardService().id_search(id_card).show_card()
+
+
+def document(id_card: int) -> dict:
+    """What the /card/{id} route does"""
+    return CardService().card_document(id_card)
+
+
+def mean_latency(function, ids: list[int], clear: bool = False) -> float:
+    """Mean duration of [function] in milliseconds, emptying the cache before every call"""
+    cache = CardCache()
+    elapsed = 0.0
+    for id_card in ids:
+        if clear:
+            cache.clear()
+        start = time.perf_counter()
+        function(id_card)
+        elapsed += time.perf_counter() - start
+    return 1000 * elapsed / len(ids)
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    highest_id = CardDao().get_highest_id()
+    ids = []
+    while len(ids) < count:
+        id_card = random.randint(1, highest_id)
+        # Ids left by deleted cards are skipped
+        if CardDao().id_search(id_card) is not None:
+            ids.append(id_card)
+
+    cold = mean_latency(built_card, ids, clear=True)
+    # Fills the cache, then the same cards are read again
+    mean_latency(built_card, ids)
+    cache = CardCache()
+    cache.hits = cache.misses = 0
+    warm = mean_latency(built_card, ids)
+    stored = mean_latency(document, ids)
+
+    stats = cache.stats()
+    print(f"{'cold (database)':20s} {cold:8.3f} ms")
+    print(f"{'warm (cache)':20s} {warm:8.3f} ms  ({cold / warm:.0f}x faster)")
+    print(f"{'document':20s} {stored:8.3f} ms  ({cold / stored:.0f}x faster)")
+    print(
+        f"{stats['cards']} cards cached in {stats['bytes'] / 1024:.0f} kB "
+        f"({stats['bytes'] / max(stats['cards'], 1) / 1024:.1f} kB per card), "
+        f"hit rate {stats['hit_rate']:.0%}"
+    )
@@ -0,0 +1,61 @@
+"""
+Bytes on the wire and CPU time per response of a page of the filter endpoint (50 cards, as
+built by CardService.filter_search) and of single cards of /card/{id}, for every encoding
+available (zstd and br need the zstandard and brotli packages), at the level used for every
+response and at the level of the bodies cached by CompressedCache. Needs the database of the
+.env, which is only read.
+
+From the src folder :
+    python -m benchmark.bench_compression [number of compressions per measure]
+"""
+import random
+import sys
+import time
+
+from dao.card_dao import CardDao
+from utils.compression import available_encodings, compress
+from utils.fast_json import dumps
+
+PAGE_SIZE = 50
+
+
+def cpu_per_call(function, count: int) -> float:
+    """Mean CPU time of [function] in milliseconds"""
+    function()
+    start = time.thread_time()
+    for _ in range(count):
+        function()
+    return 1000 * (time.thread_time() - start) / count
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    card_dao = CardDao()
+    highest_id = card_dao.get_highest_id()
+    cards = []
+    documents = []
+    while len(cards) < PAGE_SIZE:
+        id_card = random.randint(1, highest_id)
+        card = card_dao.id_search(id_card)
+        document = card_dao.get_document_json(id_card)
+        # Ids left by deleted cards are skipped
+        if card is not None and document is not None:
+            cards.append(card.show_card())
+            documents.append(document)
+    page = dumps({"count": 1000, "page": 1, "total_pages": 20, "cards": cards})
+
+    for name, bodies in (("filter page", [page]), ("single card", documents)):
+        size = sum(len(body) for body in bodies) / len(bodies)
+        print(f"{name}: {size / 1024:.1f} kB as it is")
+        for encoding in available_encodings():
+            for best in (False, True):
+                wire = sum(len(compress(body, encoding, best)) for body in bodies) / len(bodies)
+                cpu = sum(
+                    cpu_per_call(lambda: compress(body, encoding, best), count)
+                    for body in bodies[:10]
+                ) / len(bodies[:10])
+                level = "cached" if best else "per request"
+                print(
+                    f"  {encoding:5s} {level:12s} {wire / 1024:7.1f} kB on the wire"
+                    f"  ({wire / size:5.1%})  {cpu:7.3f} ms CPU per response"
+                )
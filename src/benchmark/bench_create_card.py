@@ -0,0 +1,55 @@
+"""
+Round trips and latency of CardDao.insert_card, the write path of create_card, for cards
+with more and more printings. Needs the database of the .env; every card is inserted in a
+transaction that is rolled back, so the database is left unchanged.
+
+From the src folder :
+    python -m benchmark.bench_create_card [number of cards per size]
+"""
+import json
+import sys
+import time
+
+from business_object.card import Card
+from dao.card_dao import CardDao
+from db_connection import DBConnection
+from utils.embed_batch import EMBED_DIMENSION
+from utils.query_counter import CountingCursor
+
+PRINTINGS = [1, 10, 40]
+
+
+def benchmark_card(printings: int) -> Card:
+    return Card(
+        id_card=None, layout="normal", name="Benchmark card", type_line="Creature — Elf Druid",
+        colors=["G"], color_identity=["G", "W"], keywords=["Reach", "Vigilance"],
+        types=["Creature"], subtypes=["Elf", "Druid"], supertypes=["Legendary"],
+        printings=[f"BENCH{i}" for i in range(printings)], first_printing="BENCH0",
+        legalities={"commander": "Legal", "modern": "Legal"},
+        rulings=[{"date": "2024-01-01", "text": "A ruling."}] * 3,
+        foreign_data=[{"language": "French", "name": "Carte de test"}] * 5,
+        purchase_urls={"tcgplayer": "https://example.com"}, text="Reach, vigilance"
+    )
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    embedding = json.dumps([0.0] * EMBED_DIMENSION)
+    connection = DBConnection().new_connection()
+    try:
+        for printings in PRINTINGS:
+            card = benchmark_card(printings)
+            queries = 0
+            start = time.perf_counter()
+            for _ in range(count):
+                with CountingCursor(connection) as cursor:
+                    CardDao().insert_card(cursor, card, None, embedding, embedding)
+                    queries += cursor.queries
+                connection.rollback()
+            elapsed = time.perf_counter() - start
+            print(
+                f"{printings:3d} printings : {queries / count:5.1f} round trips, "
+                f"{1000 * elapsed / count:7.2f} ms per card"
+            )
+    finally:
+        connection.close()
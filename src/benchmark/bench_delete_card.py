@@ -0,0 +1,48 @@
+"""
+Latency of the deletion of cards, one card per statement (CardDao.delete_card) against all
+the cards in one statement (CardDao.delete_cards). Needs the database of the .env; the cards
+are created and deleted in a transaction that is rolled back, so the database is left
+unchanged.
+
+From the src folder :
+    python -m benchmark.bench_delete_card [number of cards]
+"""
+import sys
+import time
+
+from benchmark.bench_create_card import benchmark_card
+from dao.card_dao import CardDao
+from db_connection import DBConnection
+from utils.query_counter import CountingCursor
+
+
+def timed_delete(connection, count: int, bulk: bool) -> tuple[int, float]:
+    """Creates [count] cards and deletes them, returns the round trips and seconds of the delete"""
+    with CountingCursor(connection) as cursor:
+        ids = CardDao().insert_cards(cursor, [benchmark_card(10) for _ in range(count)])
+        queries = cursor.queries
+        start = time.perf_counter()
+        if bulk:
+            CardDao().delete_cards_rows(cursor, ids)
+        else:
+            for id_card in ids:
+                CardDao().delete_cards_rows(cursor, [id_card])
+        elapsed = time.perf_counter() - start
+        queries = cursor.queries - queries
+    connection.rollback()
+    return queries, elapsed
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    connection = DBConnection().new_connection()
+    try:
+        for bulk in (False, True):
+            queries, elapsed = timed_delete(connection, count, bulk)
+            print(
+                f"{'bulk' if bulk else 'one by one':10s} : {queries:5d} round trips, "
+                f"{1000 * elapsed:8.2f} ms for {count} cards "
+                f"({1000 * elapsed / count:.3f} ms per card)"
+            )
+    finally:
+        connection.close()
@@ -0,0 +1,70 @@
+"""
+Latency and round trips of the hottest queries of the API, with and without server-side
+prepared statements: the queries of CardDao.read_card (the /card/{id} route),
+CardDao.get_similar_entries and UserDao.get_by_username. Needs the database of the .env,
+which is only read.
+
+From the src folder :
+    python -m benchmark.bench_hot_queries [number of calls per query]
+"""
+import random
+import sys
+import time
+
+import numpy as np
+
+from dao.card_dao import CardDao
+from dao.user_dao import UserDao
+from db_connection import DBConnection
+from utils.embed_batch import EMBED_DIMENSION
+from utils.query_counter import CountingCursor
+
+
+class TotalCountingCursor(CountingCursor):
+    """Adds the statements of every cursor of the connection to a single total"""
+    total = 0
+
+    def execute(self, query, params=None, **kwargs):
+        TotalCountingCursor.total += 1
+        return super().execute(query, params, **kwargs)
+
+
+def mean_latency(function, count: int) -> float:
+    """Mean duration of [function] in milliseconds, after a first call to warm up"""
+    function()
+    start = time.perf_counter()
+    for _ in range(count):
+        function()
+    return 1000 * (time.perf_counter() - start) / count
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    # A pool of one connection: the queries all run on the one measured here
+    pool = DBConnection().pool
+    pool.resize(1, 1)
+    with pool.connection() as connection:
+        pass
+    highest_id = CardDao().get_highest_id()
+    search_emb = np.random.rand(EMBED_DIMENSION).astype(np.float32)
+
+    hot_queries = {
+        # read_card skips the CardCache, which would answer after the first call
+        "read_card": lambda: CardDao().read_card(random.randint(1, highest_id)),
+        "get_similar_entries": lambda: CardDao().get_similar_entries(search_emb),
+        "get_by_username": lambda: UserDao(DBConnection()).get_by_username("admin"),
+    }
+
+    connection.cursor_factory = TotalCountingCursor
+    threshold = connection.prepare_threshold
+    print(f"{'query':20s} {'round trips':>12s} {'not prepared':>14s} {'prepared':>10s}")
+    for name, function in hot_queries.items():
+        TotalCountingCursor.total = 0
+        function()
+        round_trips = TotalCountingCursor.total
+        # None disables the prepared statements of the connection, even with prepare=True
+        connection.prepare_threshold = None
+        unprepared = mean_latency(function, count)
+        connection.prepare_threshold = threshold
+        prepared = mean_latency(function, count)
+        print(f"{name:20s} {round_trips:12d} {unprepared:11.3f} ms {prepared:7.3f} ms")
@@ -0,0 +1,79 @@
+"""
+Benchmark of the transformation step of the import (utils/import_pipeline.py) with 1, 2, 4
+and 8 worker processes, on synthetic cards shaped like AtomicCards.json.
+
+From the src folder :
+    python -m benchmark.bench_import [number of cards]
+
+The COPY step is not measured here since it needs a database; it is bound by the database
+and the network rather than by the cores of this machine.
+"""
+import os
+import random
+import sys
+import time
+
+from utils.import_pipeline import ImportPipeline
+
+CORES = [1, 2, 4, 8]
+COLORS = ["W", "U", "B", "R", "G"]
+FORMATS = ["commander", "legacy", "vintage", "modern", "pauper", "standard", "pioneer"]
+
+
+def synthetic_card(i: int, rng: random.Random) -> dict:
+    """A fake card with the fields and the typical size of a card of AtomicCards.json"""
+    colors = rng.sample(COLORS, rng.randint(0, 2))
+    return {
+        "name": f"Card {i}",
+        "layout": "normal",
+        "type": f"Creature — Type{i % 300}",
+        "types": ["Creature"],
+        "subtypes": [f"Type{i % 300}"],
+        "supertypes": ["Legendary"] if i % 20 == 0 else [],
+        "colors": colors,
+        "colorIdentity": colors,
+        "keywords": rng.sample(["Flying", "Trample", "Haste", "Vigilance"], rng.randint(0, 2)),
+        "manaCost": "{2}{G}",
+        "manaValue": 3.0,
+        "convertedManaCost": 3.0,
+        "power": "2",
+        "toughness": "2",
+        "text": " ".join(["When this creature enters, draw a card."] * rng.randint(1, 4)),
+        "edhrecRank": rng.randint(1, 30_000),
+        "firstPrinting": f"SET{i % 500}",
+        "printings": [f"SET{(i + k) % 500}" for k in range(rng.randint(1, 6))],
+        "legalities": {fmt: rng.choice(["Legal", "Banned", "Restricted"]) for fmt in FORMATS},
+        "foreignData": [
+            {"language": lang, "name": f"Card {i} ({lang})", "text": "Texte traduit.",
+             "type": "Créature"}
+            for lang in ["French", "German", "Spanish", "Italian"][:rng.randint(0, 4)]
+        ],
+        "rulings": [
+            {"date": "2020-01-01", "text": "A ruling about this card."}
+            for _ in range(rng.randint(0, 3))
+        ],
+        "purchaseUrls": {"tcgplayer": f"https://example.com/{i}"},
+    }
+
+
+def synthetic_data(count: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    return {"data": {f"Card {i}": [synthetic_card(i, rng)] for i in range(count)}}
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 30_000
+    data = synthetic_data(count)
+    embed_cards = [{"embed_detailed": "[0.1]", "embed_short": "[0.2]"}] * count
+
+    print(f"{count} cards, {os.cpu_count()} cores available")
+    reference = None
+    for cores in CORES:
+        start = time.perf_counter()
+        ImportPipeline(workers=cores).build_rows(data, embed_cards)
+        elapsed = time.perf_counter() - start
+        reference = reference or elapsed
+        print(
+            f"{cores} process(es) : {elapsed:6.2f}s, {count / elapsed:8.0f} cards/s, "
+            f"speedup x{reference / elapsed:.2f}"
+        )
@@ -0,0 +1,72 @@
+"""
+Serialization time of a page of the filter endpoint (50 cards, as built by
+CardService.filter_search) with the default path of FastAPI (jsonable_encoder then the json
+module), with FastJSONResponse (orjson when it is installed, the json module otherwise), and
+with the documents of "CardDocument" already encoded by the database. Needs the database of
+the .env, which is only read.
+
+From the src folder :
+    python -m benchmark.bench_json [number of pages encoded per method]
+"""
+import random
+import sys
+import time
+from unittest import mock
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from dao.card_dao import CardDao
+from utils import fast_json
+from utils.fast_json import FastJSONResponse
+
+PAGE_SIZE = 50
+
+
+def mean_duration(function, count: int) -> float:
+    """Mean duration of [function] in milliseconds"""
+    function()
+    start = time.perf_counter()
+    for _ in range(count):
+        function()
+    return 1000 * (time.perf_counter() - start) / count
+
+
+def encoders(page: dict, documents: list[bytes]) -> dict:
+    """The ways of encoding the page, each returning the body of the response"""
+    head = f'{{"count":{page["count"]},"page":1,"total_pages":{page["total_pages"]},"cards":['
+
+    def stdlib():
+        with mock.patch.object(fast_json, "orjson", None):
+            return FastJSONResponse(page).body
+
+    return {
+        "jsonable_encoder + json": lambda: JSONResponse(jsonable_encoder(page)).body,
+        "FastJSONResponse (json)": stdlib,
+        "FastJSONResponse": lambda: FastJSONResponse(page).body,
+        "stored documents": lambda: FastJSONResponse(
+            head.encode("utf-8") + b",".join(documents) + b"]}"
+        ).body,
+    }
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    card_dao = CardDao()
+    highest_id = card_dao.get_highest_id()
+    cards = []
+    documents = []
+    while len(cards) < PAGE_SIZE:
+        id_card = random.randint(1, highest_id)
+        card = card_dao.id_search(id_card)
+        document = card_dao.get_document_json(id_card)
+        # Ids left by deleted cards are skipped
+        if card is not None and document is not None:
+            cards.append(card.show_card())
+            documents.append(document)
+    page = {"count": 1000, "page": 1, "total_pages": 20, "cards": cards}
+
+    print(f"orjson installed: {fast_json.orjson is not None}")
+    for name, function in encoders(page, documents).items():
+        duration = mean_duration(function, count)
+        print(f"{name:25s} {duration:8.3f} ms  {len(function()) / 1024:6.1f} kB")
@@ -0,0 +1,92 @@
+"""
+Throughput of card reads (/card/{id} with random ids) sent [concurrency] at a time, when the
+route is async and calls the service on the event loop (how the routes were written before),
+and when it is a sync route run in the thread pool of Starlette, limited to DB_POOL_SIZE
+threads (how they are now). The requests go to the app through ASGI, without a server. Needs
+the database of the .env, which is only read.
+
+From the src folder :
+    python -m benchmark.bench_load [number of requests] [concurrency]
+"""
+import asyncio
+import random
+import sys
+import time
+
+from anyio import to_thread
+from fastapi import FastAPI
+
+from dao.card_dao import CardDao
+from db_connection import POOL_SIZE
+from service.card_service import CardService
+from utils.fast_json import FastJSONResponse
+
+card_service = CardService()
+bench_app = FastAPI()
+
+
+@bench_app.get("/async/{id}")
+async def async_read(id: int):
+    return FastJSONResponse(card_service.card_document_json(id))
+
+
+@bench_app.get("/sync/{id}")
+def sync_read(id: int):
+    return FastJSONResponse(card_service.card_document_json(id))
+
+
+async def request(path: str) -> None:
+    """Sends a GET to bench_app"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"},
+        "http_version": "1.1", "method": "GET", "scheme": "http", "path": path,
+        "raw_path": path.encode(), "query_string": b"", "root_path": "", "headers": [],
+        "client": ("127.0.0.1", 50000), "server": ("127.0.0.1", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    await bench_app(scope, receive, send)
+
+
+async def load(prefix: str, ids: list[int], concurrency: int) -> tuple[float, list[float]]:
+    """Reads the cards [concurrency] at a time, returns the duration and the latencies (s)"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def read(id_card):
+        async with semaphore:
+            start = time.perf_counter()
+            await request(f"{prefix}/{id_card}")
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(read(id_card) for id_card in ids))
+    return time.perf_counter() - start, sorted(latencies)
+
+
+async def main(count: int, concurrency: int) -> None:
+    to_thread.current_default_thread_limiter().total_tokens = POOL_SIZE
+    highest_id = CardDao().get_highest_id()
+    ids = [random.randint(1, highest_id) for _ in range(count)]
+
+    print(f"{count} requests, {concurrency} at a time")
+    for name, prefix in (
+        ("async route (event loop)", "/async"), (f"sync route ({POOL_SIZE} threads)", "/sync")
+    ):
+        # The threads open their connection on their first request
+        await load(prefix, ids[:concurrency], concurrency)
+        elapsed, latencies = await load(prefix, ids, concurrency)
+        p50 = 1000 * latencies[len(latencies) // 2]
+        p95 = 1000 * latencies[int(len(latencies) * 0.95)]
+        print(f"{name:28s} {count / elapsed:8.1f} req/s  p50 {p50:7.2f} ms  p95 {p95:7.2f} ms")
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    asyncio.run(main(count, concurrency))
@@ -0,0 +1,67 @@
+"""
+Serialization cost of a query vector, in the text and in the binary format of pgvector.
+
+Without argument, only the client side is measured: converting a 1024-dimension vector to the
+format sent to the server, and back from the format received. With --db, the latency of
+CardDao.get_similar_entries is also measured with the vector sent as text and as binary,
+against the database of the .env (which is only read).
+
+From the src folder :
+    python -m benchmark.bench_vector_transfer [--db]
+"""
+import sys
+import time
+
+import numpy as np
+from pgvector import Vector
+from psycopg.rows import tuple_row
+
+from db_connection import DBConnection
+from utils.embed_batch import EMBED_DIMENSION
+
+COUNT = 2_000
+
+
+def mean_microseconds(function, count: int = COUNT) -> float:
+    start = time.perf_counter()
+    for _ in range(count):
+        function()
+    return 1_000_000 * (time.perf_counter() - start) / count
+
+
+def client_side() -> None:
+    vector = np.random.rand(EMBED_DIMENSION).astype(np.float32)
+    text = Vector(vector).to_text()
+    binary = Vector(vector).to_binary()
+    print(f"size sent     : text {len(text.encode()):6d} bytes, binary {len(binary):6d} bytes")
+    print(
+        f"dump          : text {mean_microseconds(lambda: Vector(vector).to_text()):8.1f} µs, "
+        f"binary {mean_microseconds(lambda: Vector(vector).to_binary()):8.1f} µs"
+    )
+    print(
+        f"load          : text {mean_microseconds(lambda: Vector.from_text(text)):8.1f} µs, "
+        f"binary {mean_microseconds(lambda: Vector.from_binary(binary)):8.1f} µs"
+    )
+
+
+def database_side(count: int = 200) -> None:
+    search_emb = np.random.rand(EMBED_DIMENSION).astype(np.float32)
+    query = """
+        SELECT "idCard", "embed" <-> {} AS dst FROM "Card"
+        WHERE "embed" IS NOT NULL ORDER BY dst LIMIT 5
+    """
+    with DBConnection().connection as connection:
+        with connection.cursor(row_factory=tuple_row) as cursor:
+            for name, placeholder, binary in (("text", "%t", False), ("binary", "%b", True)):
+                def search():
+                    cursor.execute(query.format(placeholder), (search_emb,), binary=binary)
+                    cursor.fetchall()
+                search()
+                print(f"similarity query, vector as {name:6s} : "
+                      f"{mean_microseconds(search, count) / 1000:7.3f} ms")
+
+
+if __name__ == "__main__":
+    client_side()
+    if "--db" in sys.argv:
+        database_side()
@@ -1,3 +1,21 @@
+# Keys of Card.show_card, by kind of value
+LIST_COLUMNS = [
+    "color_identity", "color_indicator", "colors", "keywords", "printings",
+    "rulings", "subtypes", "supertypes", "types"
+]
+DICT_COLUMNS = ["leadership_skills", "legalities", "purchase_urls"]
+OTHER_COLUMNS = [
+    "ascii_name", "converted_mana_cost", "defense", "edhrec_rank", "edhrec_saltiness",
+    "face_mana_value", "face_name", "first_printing", "hand", "has_alternative_deck_limit",
+    "is_funny", "is_reserved", "life", "loyalty", "mana_cost", "mana_value", "power",
+    "side", "text", "toughness"
+]
+CARD_FIELDS = (
+    ["id_card", "layout", "name", "type_line"] + OTHER_COLUMNS + LIST_COLUMNS + ["foreignData"]
+    + DICT_COLUMNS
+)
+
+
 class Card:
     def __init__(
         self,
@@ -81,26 +99,19 @@ class Card:
         self._embedded = embedded
         self._short_embedded = short_embedded
 
-    def show_card(self):
+    def show_card(self, fields: list[str] = None):
+        """
+        The card as sent by the API. With [fields] (keys of CARD_FIELDS), only these keys and
+        "id_card" are sent.
+        """
         card_dict = {"id_card": self.id_card,
                      "layout": self.layout,
                      "name": self.name,
                      "type_line": self.type_line}
-        list_columns = [
-            "color_identity", "color_indicator", "colors", "keywords", "printings",
-            "rulings", "subtypes", "supertypes", "types"
-            ]
-        dict_columns = ["leadership_skills", "legalities", "purchase_urls"]
-        other_columns = [
-            "ascii_name", "converted_mana_cost", "defense", "edhrec_rank", "edhrec_saltiness",
-            "face_mana_value", "face_name", "first_printing", "hand", "has_alternative_deck_limit",
-            "is_funny", "is_reserved", "life", "loyalty", "mana_cost", "mana_value", "power",
-            "side", "text", "toughness"
-        ]
-        for column in other_columns:
+        for column in OTHER_COLUMNS:
             if getattr(self, column) is not None:
                 card_dict[column] = getattr(self, column)
-        for column in list_columns:
+        for column in LIST_COLUMNS:
             if len(getattr(self, column)) != 0:
                 card_dict[column] = getattr(self, column)
         if len(self.foreign_data) != 0:
@@ -112,13 +123,18 @@ class Card:
                         language_data[key] = language[key]
                 foreign_data.append(language_data)
             card_dict["foreignData"] = foreign_data
-        for column in dict_columns:
+        for column in DICT_COLUMNS:
             column_dict = {}
             for key in getattr(self, column):
                 if getattr(self, column)[key]:
                     column_dict[key] = getattr(self, column)[key]
             if column_dict != {}:
                 card_dict[column] = column_dict
+        if fields is not None:
+            card_dict = {
+                key: value for key, value in card_dict.items()
+                if key == "id_card" or key in fields
+            }
         return card_dict
 
     def __str__(self):
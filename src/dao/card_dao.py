@@ -1,20 +1,89 @@
 import logging
-from psycopg2 import sql
+import os
+import numpy as np
+from psycopg import sql
+from psycopg.rows import tuple_row
 
 from business_object.card import Card
 from db_connection import DBConnection
 from business_object.filter import Filter
+from utils.card_cache import CardCache
+from utils.card_listener import notify_cards_changed
 from utils.embed import embedding
+from utils.sql_batch import execute_values
+
+# Tables holding the rows that describe a card through "idCard", rewritten by
+# update_cards_rows. Their foreign keys are ON DELETE CASCADE: deleting the card removes them,
+# as well as its "Favourite", "EmbeddingJob" and "CardDocument" rows, which are not listed
+# here since a rewrite of the card must keep them.
+CARD_LINK_TABLES = [
+    "Colors", "ColorIdentity", "ColorIndicator", "Keywords", "Types", "Subtypes",
+    "Supertypes", "Printings", "PurchaseURLs", "ForeignData", "Ruling"
+]
+
+# Card attributes stored as is in a column of "Card"
+CARD_ATTRIBUTE_COLUMNS = {
+    "name": "name", "ascii_name": "asciiName", "converted_mana_cost": "convertedManaCost",
+    "defense": "defense", "edhrec_rank": "edhrecRank", "edhrec_saltiness": "edhrecSaltiness",
+    "face_mana_value": "faceManaValue", "face_name": "faceName", "hand": "hand",
+    "has_alternative_deck_limit": "hasAlternativeDeckLimit", "is_funny": "isFunny",
+    "is_reserved": "isReserved", "life": "life", "loyalty": "loyalty", "mana_cost": "manaCost",
+    "mana_value": "manaValue", "power": "power", "side": "side", "text": "text",
+    "toughness": "toughness"
+}
+# Card attributes stored in another table and referenced by an id column of "Card"
+CARD_REFERENCE_COLUMNS = {
+    "layout": "layout", "type_line": "type", "first_printing": "firstPrinting",
+    "leadership_skills": "leadershipSkills", "legalities": "legalities"
+}
+# SQL types of the columns of "Card", see card_row
+CARD_COLUMN_TYPES = {
+    "idCard": "int", "layout": "int", "name": "varchar", "type": "int", "embed": "vector",
+    "shortEmbed": "vector", "asciiName": "varchar", "convertedManaCost": "float",
+    "defense": "int", "edhrecRank": "int", "edhrecSaltiness": "float", "faceManaValue": "float",
+    "faceName": "varchar", "firstPrinting": "int", "hand": "int",
+    "hasAlternativeDeckLimit": "bool", "isFunny": "bool", "isReserved": "bool",
+    "leadershipSkills": "int", "legalities": "int", "life": "int", "loyalty": "varchar",
+    "manaCost": "varchar", "manaValue": "float", "power": "varchar", "side": "varchar",
+    "text": "varchar", "toughness": "varchar", "sourceHash": "varchar"
+}
+# Documents sent by the server-side cursor of export_documents per round trip
+EXPORT_BATCH = int(os.getenv("CARD_EXPORT_BATCH", "500"))
+# Last line of an export that failed after its first chunk
+EXPORT_ERROR = b'{"error": "The export failed before its end"}\n'
+
+# Card attributes stored in a link table: (link table, value table, id column, name column)
+CARD_LINKS = {
+    "colors": ("Colors", "Color", "idColor", "colorName"),
+    "color_identity": ("ColorIdentity", "Color", "idColor", "colorName"),
+    "color_indicator": ("ColorIndicator", "Color", "idColor", "colorName"),
+    "keywords": ("Keywords", "Keyword", "idKeyword", "name"),
+    "types": ("Types", "Type", "idType", "name"),
+    "subtypes": ("Subtypes", "Subtype", "idSubtype", "name"),
+    "supertypes": ("Supertypes", "Supertype", "idSupertype", "name"),
+    "printings": ("Printings", "Set", "idSet", "name"),
+}
+# Card attributes stored as rows of their own table, rewritten as a whole when they change
+CARD_ROWS = {"purchase_urls": "PurchaseURLs", "foreign_data": "ForeignData", "rulings": "Ruling"}
+
+# Queues an embedding job again when the card already has one, see enqueue_embedding
+REQUEUE = (
+    'ON CONFLICT ("idCard") DO UPDATE '
+    'SET "enqueuedAt" = now(), "attempts" = 0, "claimedAt" = NULL'
+)
+
+# Number of calls to update_card, and of those which had to queue new embeddings
+UPDATE_STATS = {"updates": 0, "reembedded": 0}
 
 
 class CardDao:
 
-    def _get_or_create_id(
-            self, cursor, table_name: str, id_column: str, name_column: str, value: str
-            ) -> int:
+    def _get_or_create_ids(
+            self, cursor, table_name: str, id_column: str, name_column: str, values: list
+            ) -> dict:
         """
-        Methods that either gets the id of the value in the table searched, or creates it if it
-        doesn't exist
+        Gets the ids of all the values in the table searched, creating the missing ones, in a
+        single query relying on the unique constraint of [name_column]
 
         Parameters
         ----------
@@ -25,34 +94,60 @@ class CardDao:
         id_column : str
             Name of the id column (ex: "idColor", "idKeyword")
         name_column : str
-            Name of the column that should contain the value (ex: "colorName", "name")
-        value : str
-            The value we want to know the id/create it
+            Name of the column that should contain the values (ex: "colorName", "name")
+        values : list
+            The values we want to know the id/create
 
         Returns
         -------
-        int
-            The id of the value, either found or created
+        dict
+            {value: id} for every value, either found or created
         """
-        cursor.execute(
-            f'SELECT "{id_column}" FROM "{table_name}" WHERE "{name_column}" = %(value)s',
-            {"value": value}
-        )
-        result = cursor.fetchone()
-
-        if result is None:
-            cursor.execute(f'SELECT MAX("{id_column}") FROM "{table_name}"')
-            id_max = cursor.fetchone()["max"]
+        if not values:
+            return {}
+
+        ids = {}
+        missing = list(dict.fromkeys(values))
+        # A value created at the same time by another transaction is skipped by ON CONFLICT
+        # but not visible to the SELECT of the same statement: a second query finds it
+        for _ in range(2):
             cursor.execute(
-                f'INSERT INTO "{table_name}"("{id_column}", "{name_column}") VALUES ({id_max + 1},'
-                f' %(value)s) RETURNING "{id_column}"',
-                {"value": value}
+                f"""
+                WITH wanted AS (
+                    SELECT unnest(%(values)s::varchar[]) AS value
+                ), created AS (
+                    INSERT INTO "{table_name}"("{name_column}")
+                    SELECT value FROM wanted
+                    ON CONFLICT ("{name_column}") DO NOTHING
+                    RETURNING "{id_column}" AS id, "{name_column}" AS value
+                )
+                SELECT id, value FROM created
+                UNION ALL
+                SELECT t."{id_column}" AS id, t."{name_column}" AS value
+                FROM "{table_name}" t
+                JOIN wanted w ON t."{name_column}" = w.value
+                """,
+                {"values": missing}
             )
-            result = cursor.fetchone()
-
-        return result[id_column]
+            for row in cursor.fetchall():
+                ids[row["value"]] = row["id"]
+            missing = [value for value in missing if value not in ids]
+            if not missing:
+                break
+        return ids
 
     def get_embed(self, card: Card):
+        text_to_embed, text_to_embed_short = self.get_embed_texts(card)
+
+        card_embedding = embedding(text_to_embed)
+        card_short_embedding = embedding(text_to_embed_short)
+
+        return (card_embedding, card_short_embedding)
+
+    def get_embed_texts(self, card: Card) -> tuple[str, str]:
+        """
+        Returns the detailed and the short texts whose embeddings describe the card
+        """
         fields = [
             card.name or "",
             card.type_line or "",
@@ -74,165 +169,236 @@ class CardDao:
         else:
             text_to_embed_short = card.name
 
-        card_embedding = embedding(text_to_embed)
-        card_short_embedding = embedding(text_to_embed_short)
+        return (text_to_embed, text_to_embed_short)
 
-        return (card_embedding, card_short_embedding)
+    def get_cards_for_embedding(
+        self, cursor, ids: list[int], lock: bool = False
+    ) -> list[Card]:
+        """
+        Loads, in a single query, the cards of [ids] with only the attributes used by
+        get_embed_texts. With [lock], their rows of "Card" are locked (FOR UPDATE) until the
+        end of the transaction.
+        """
+        def names(link_table, table, id_column, name_column):
+            return (
+                f'ARRAY(SELECT v."{name_column}" FROM "{link_table}" l '
+                f'JOIN "{table}" v ON v."{id_column}" = l."{id_column}" '
+                f'WHERE l."idCard" = c."idCard")'
+            )
+
+        cursor.execute(
+            f"""
+            SELECT c."idCard", c."name", t."name" AS "typeLine", c."text", c."manaCost",
+                   c."power", c."toughness", c."defense", c."loyalty",
+                   {names(*CARD_LINKS["supertypes"])} AS "supertypes",
+                   {names(*CARD_LINKS["types"])} AS "types",
+                   {names(*CARD_LINKS["subtypes"])} AS "subtypes",
+                   {names(*CARD_LINKS["colors"])} AS "colors"
+            FROM "Card" c
+            JOIN "Type" t ON t."idType" = c."type"
+            WHERE c."idCard" = ANY(%(ids)s)
+            {'ORDER BY c."idCard" FOR UPDATE OF c' if lock else ""}
+            """,
+            {"ids": list(ids)}
+        )
+        return [
+            Card(
+                id_card=row["idCard"], layout=None, name=row["name"],
+                type_line=row["typeLine"], text=row["text"], mana_cost=row["manaCost"],
+                power=row["power"], toughness=row["toughness"], defense=row["defense"],
+                loyalty=row["loyalty"], supertypes=row["supertypes"], types=row["types"],
+                subtypes=row["subtypes"], colors=row["colors"]
+            )
+            for row in cursor.fetchall()
+        ]
 
     def get_or_create_all_ids_from_foreign_keys(self, card):
         with DBConnection().connection as connection:
             with connection.cursor() as cursor:
-                cursor.execute('SET search_path TO defaultdb, public;')
-
-                id_layout = self._get_or_create_id(
-                    cursor, "Layout", "idLayout", "name", card.layout
-                    )
-
-                id_type = self._get_or_create_id(cursor, "Type", "idType", "name", card.type_line)
-
-                id_first_printing = None
-                if card.first_printing:
-                    id_first_printing = self._get_or_create_id(
-                        cursor, "Set", "idSet", "name", card.first_printing
-                        )
+                return self.get_foreign_key_ids(cursor, card)
 
-                id_leadership = None
-                if card.leadership_skills:
-                    cursor.execute(
-                        '''
-                        SELECT "idLeadership" FROM "LeadershipSkills"
-                        WHERE "brawl" = %(brawl)s
-                        AND "commander" = %(commander)s
-                        AND "oathbreaker" = %(oathbreaker)s
-                        ''',
-                        {
-                            "brawl": card.leadership_skills.get("brawl", False),
-                            "commander": card.leadership_skills.get("commander", False),
-                            "oathbreaker": card.leadership_skills.get("oathbreaker", False)
-                        }
-                    )
-                    res_leadership = cursor.fetchone()
-                    if res_leadership is None:
-                        cursor.execute(
-                            '''
-                            INSERT INTO "LeadershipSkills"("brawl", "commander", "oathbreaker")
-                            VALUES (%(brawl)s, %(commander)s, %(oathbreaker)s)
-                            RETURNING "idLeadership"
-                            ''',
-                            {
-                                "brawl": card.leadership_skills.get("brawl", False),
-                                "commander": card.leadership_skills.get("commander", False),
-                                "oathbreaker": card.leadership_skills.get("oathbreaker", False)
-                            }
-                        )
-                        res_leadership = cursor.fetchone()
-                    id_leadership = res_leadership["idLeadership"]
-
-                id_legalities = None
-                if card.legalities:
-                    cursor.execute('SELECT * FROM "LegalityType" ORDER BY "idLegalityType" ASC')
-                    res_legality_types = cursor.fetchall()
-                    legality_type_map = {
-                        lt["type"]: lt["idLegalityType"] for lt in res_legality_types
-                        }
-
-                    legality_ids = {}
-                    for format_name, legality_status in card.legalities.items():
-                        if legality_status in legality_type_map:
-                            legality_ids[format_name] = legality_type_map[legality_status]
-
-                    if legality_ids:
-                        where_clauses = ' AND '.join(
-                            [f'"{k}" = %({k})s' for k in legality_ids.keys()]
-                            )
-                        query = f'SELECT "idLegality" FROM "Legality" WHERE {where_clauses}'
-                        cursor.execute(query, legality_ids)
-                        res_legality = cursor.fetchone()
-
-                        if res_legality is None:
-                            columns = ', '.join([f'"{k}"' for k in legality_ids.keys()])
-                            placeholders = ', '.join([f'%({k})s' for k in legality_ids.keys()])
-                            query = f'''
-                                INSERT INTO "Legality"({columns})
-                                VALUES ({placeholders})
-                                RETURNING "idLegality"
-                            '''
-                            cursor.execute(query, legality_ids)
-                            res_legality = cursor.fetchone()
-                        id_legalities = res_legality["idLegality"]
-
-                color_ids = {}
-                if card.colors:
-                    for color in card.colors:
-                        color_ids[color] = self._get_or_create_id(
-                            cursor, "Color", "idColor", "colorName", color
-                            )
+    def get_dimension_values(self, card: Card) -> dict:
+        """
+        Returns {(table, id column, name column): values} for all the values of the card that
+        are stored in the dimension tables. The type line and the types share the table "Type",
+        the first printing and the printings the table "Set".
+        """
+        return {
+            ("Layout", "idLayout", "name"): [card.layout] if card.layout else [],
+            ("Type", "idType", "name"):
+                ([card.type_line] if card.type_line else []) + (card.types or []),
+            ("Set", "idSet", "name"):
+                ([card.first_printing] if card.first_printing else []) + (card.printings or []),
+            ("Color", "idColor", "colorName"):
+                (card.colors or []) + (card.color_identity or []) + (card.color_indicator or []),
+            ("Keyword", "idKeyword", "name"): card.keywords or [],
+            ("Subtype", "idSubtype", "name"): card.subtypes or [],
+            ("Supertype", "idSupertype", "name"): card.supertypes or [],
+        }
+
+    def get_dimension_ids(self, cursor, cards: list[Card]) -> dict:
+        """
+        Gets (or creates) the ids of the dimension values of all the cards with one query per
+        dimension table, whatever the number of cards
 
-                color_identity_ids = {}
-                if card.color_identity:
-                    for color in card.color_identity:
-                        if color not in color_ids:
-                            color_identity_ids[color] = self._get_or_create_id(
-                                cursor, "Color", "idColor", "colorName", color
-                                )
-                        else:
-                            color_identity_ids[color] = color_ids[color]
-
-                color_indicator_ids = {}
-                if card.color_indicator:
-                    for color in card.color_indicator:
-                        if color not in color_ids and color not in color_identity_ids:
-                            color_indicator_ids[color] = self._get_or_create_id(
-                                cursor, "Color", "idColor", "colorName", color
-                                )
-                        elif color in color_ids:
-                            color_indicator_ids[color] = color_ids[color]
-                        else:
-                            color_indicator_ids[color] = color_identity_ids[color]
-
-                keyword_ids = {}
-                if card.keywords:
-                    for keyword in card.keywords:
-                        keyword_ids[keyword] = self._get_or_create_id(
-                            cursor, "Keyword", "idKeyword", "name", keyword
-                            )
+        Returns
+        -------
+        dict
+            {table: {value: id}}, to give to get_foreign_key_ids
+        """
+        values = {}
+        for card in cards:
+            for key, card_values in self.get_dimension_values(card).items():
+                values.setdefault(key, []).extend(card_values)
+        return {
+            table: self._get_or_create_ids(cursor, table, id_column, name_column, table_values)
+            for (table, id_column, name_column), table_values in values.items()
+        }
+
+    def get_foreign_key_ids(self, cursor, card, dimension_ids: dict = None):
+        """
+        Gets (or creates) the ids of all the values of the card that are stored in other tables,
+        using the cursor given so that it can be part of a bigger transaction
 
-                type_ids = {}
-                if card.types:
-                    for type_name in card.types:
-                        type_ids[type_name] = self._get_or_create_id(
-                            cursor, "Type", "idType", "name", type_name
-                            )
+        Parameters
+        ----------
+        cursor : cursor
+            The cursor for the database
+        card : Card
+            The card whose values are looked for
+        dimension_ids : dict
+            Ids already resolved by get_dimension_ids for a batch of cards, None to query the
+            dimension tables for this card only
+        """
+        if dimension_ids is None:
+            dimension_ids = {
+                table: self._get_or_create_ids(cursor, table, id_column, name_column, values)
+                for (table, id_column, name_column), values
+                in self.get_dimension_values(card).items()
+            }
 
-                subtype_ids = {}
-                if card.subtypes:
-                    for subtype in card.subtypes:
-                        subtype_ids[subtype] = self._get_or_create_id(
-                            cursor, "Subtype", "idSubtype", "name", subtype
-                            )
+        id_layout = dimension_ids["Layout"][card.layout]
+        all_type_ids = dimension_ids["Type"]
+        id_type = all_type_ids[card.type_line]
+        set_ids = dimension_ids["Set"]
+        id_first_printing = set_ids.get(card.first_printing)
+
+        # In a batch, the cards with the same leadership skills or legalities share one lookup
+        known_rows = dimension_ids.setdefault("rows", {})
+        leadership_key = ("leadership", tuple(sorted((card.leadership_skills or {}).items())))
+        if leadership_key not in known_rows:
+            known_rows[leadership_key] = self.get_leadership_id(cursor, card)
+        id_leadership = known_rows[leadership_key]
+        legalities_key = ("legalities", tuple(sorted((card.legalities or {}).items())))
+        if legalities_key not in known_rows:
+            known_rows[legalities_key] = self.get_legalities_id(cursor, card)
+        id_legalities = known_rows[legalities_key]
+
+        all_color_ids = dimension_ids["Color"]
+        color_ids = {color: all_color_ids[color] for color in card.colors or []}
+        color_identity_ids = {color: all_color_ids[color] for color in card.color_identity or []}
+        color_indicator_ids = {
+            color: all_color_ids[color] for color in card.color_indicator or []
+            }
 
-                supertype_ids = {}
-                if card.supertypes:
-                    for supertype in card.supertypes:
-                        supertype_ids[supertype] = self._get_or_create_id(
-                            cursor, "Supertype", "idSupertype", "name", supertype
-                            )
+        keyword_ids = {
+            keyword: dimension_ids["Keyword"][keyword] for keyword in card.keywords or []
+            }
+        type_ids = {type_name: all_type_ids[type_name] for type_name in card.types or []}
+        subtype_ids = {
+            subtype: dimension_ids["Subtype"][subtype] for subtype in card.subtypes or []
+            }
+        supertype_ids = {
+            supertype: dimension_ids["Supertype"][supertype]
+            for supertype in card.supertypes or []
+            }
+        printing_ids = {printing: set_ids[printing] for printing in card.printings or []}
 
-                printing_ids = {}
-                if card.printings:
-                    for printing in card.printings:
-                        printing_ids[printing] = self._get_or_create_id(
-                            cursor, "Set", "idSet", "name", printing
-                            )
         return (
             id_layout, id_type, id_first_printing, id_leadership, id_legalities, color_ids,
             color_identity_ids, color_indicator_ids, keyword_ids, type_ids, subtype_ids,
             supertype_ids, printing_ids
             )
 
+    def get_leadership_id(self, cursor, card: Card):
+        """
+        Gets (or creates) the id of the leadership skills of the card, None if it has none
+        """
+        id_leadership = None
+        if card.leadership_skills:
+            cursor.execute(
+                '''
+                SELECT "idLeadership" FROM "LeadershipSkills"
+                WHERE "brawl" = %(brawl)s
+                AND "commander" = %(commander)s
+                AND "oathbreaker" = %(oathbreaker)s
+                ''',
+                {
+                    "brawl": card.leadership_skills.get("brawl", False),
+                    "commander": card.leadership_skills.get("commander", False),
+                    "oathbreaker": card.leadership_skills.get("oathbreaker", False)
+                }
+            )
+            res_leadership = cursor.fetchone()
+            if res_leadership is None:
+                cursor.execute(
+                    '''
+                    INSERT INTO "LeadershipSkills"("brawl", "commander", "oathbreaker")
+                    VALUES (%(brawl)s, %(commander)s, %(oathbreaker)s)
+                    RETURNING "idLeadership"
+                    ''',
+                    {
+                        "brawl": card.leadership_skills.get("brawl", False),
+                        "commander": card.leadership_skills.get("commander", False),
+                        "oathbreaker": card.leadership_skills.get("oathbreaker", False)
+                    }
+                )
+                res_leadership = cursor.fetchone()
+            id_leadership = res_leadership["idLeadership"]
+        return id_leadership
+
+    def get_legalities_id(self, cursor, card: Card):
+        """
+        Gets (or creates) the id of the legalities of the card, None if it has none
+        """
+        id_legalities = None
+        if card.legalities:
+            cursor.execute('SELECT * FROM "LegalityType" ORDER BY "idLegalityType" ASC')
+            res_legality_types = cursor.fetchall()
+            legality_type_map = {
+                lt["type"]: lt["idLegalityType"] for lt in res_legality_types
+                }
+
+            legality_ids = {}
+            for format_name, legality_status in card.legalities.items():
+                if legality_status in legality_type_map:
+                    legality_ids[format_name] = legality_type_map[legality_status]
+
+            if legality_ids:
+                where_clauses = ' AND '.join(
+                    [f'"{k}" = %({k})s' for k in legality_ids.keys()]
+                    )
+                query = f'SELECT "idLegality" FROM "Legality" WHERE {where_clauses}'
+                cursor.execute(query, legality_ids)
+                res_legality = cursor.fetchone()
+
+                if res_legality is None:
+                    columns = ', '.join([f'"{k}"' for k in legality_ids.keys()])
+                    placeholders = ', '.join([f'%({k})s' for k in legality_ids.keys()])
+                    query = f'''
+                        INSERT INTO "Legality"({columns})
+                        VALUES ({placeholders})
+                        RETURNING "idLegality"
+                    '''
+                    cursor.execute(query, legality_ids)
+                    res_legality = cursor.fetchone()
+                id_legalities = res_legality["idLegality"]
+        return id_legalities
+
     def create_card(self, card: Card) -> bool:
         """
-        Add a card to the database
+        Add a card to the database. It is committed right away, with its embeddings pending
+        until the EmbeddingWorker computes them.
 
         Parameters
         ----------
@@ -244,231 +410,474 @@ class CardDao:
         bool
             True if creation succeeded, False otherwise
         """
-        next_card_id = self.get_highest_id() + 1
-        card_embedding, card_short_embedding = CardDao().get_embed(card)
+        with DBConnection().connection as connection:
+            with connection.cursor() as cursor:
+                if not self.insert_card(cursor, card, None, None, None):
+                    return False
+                connection.commit()
+                return True
+
+    def insert_card(
+        self, cursor, card: Card, id_card: int, card_embedding, card_short_embedding,
+        source_hash: str = None
+    ) -> bool:
+        """
+        Inserts a card and all its linked rows with the cursor given, without committing
+
+        Parameters
+        ----------
+        cursor : cursor
+            The cursor for the database
+        card : Card
+            The card to add
+        id_card : int
+            The id given to the new card, None to take the next one of the identity
+        card_embedding, card_short_embedding : list | str
+            The detailed and short embeddings of the card. When they are None, an embedding
+            job is queued for the card.
+        source_hash : str
+            Hash of the card in AtomicCards.json, None for cards created through the API
 
+        Returns
+        -------
+        bool
+            True if the card was inserted, False otherwise
+        """
+        foreign_key_ids = self.get_foreign_key_ids(cursor, card)
         (
             id_layout, id_type, id_first_printing, id_leadership, id_legalities, color_ids,
             color_identity_ids, color_indicator_ids, keyword_ids, type_ids, subtype_ids,
             supertype_ids, printing_ids
-        ) = CardDao().get_or_create_all_ids_from_foreign_keys(card)
+        ) = foreign_key_ids
 
-        with DBConnection().connection as connection:
-            with connection.cursor() as cursor:
-                cursor.execute('SET search_path TO defaultdb, public;')
+        cursor.execute(
+            """
+            INSERT INTO "Card" (
+                "idCard", "layout", "name", "type", "embed", "shortEmbed",
+                "asciiName", "convertedManaCost", "defense", "edhrecRank",
+                "edhrecSaltiness", "faceManaValue", "faceName", "firstPrinting",
+                "hand", "hasAlternativeDeckLimit", "isFunny", "isReserved",
+                "leadershipSkills", "legalities", "life", "loyalty", "manaCost",
+                "manaValue", "power", "side", "text", "toughness", "sourceHash"
+            ) VALUES (
+                COALESCE(%(idCard)s, nextval(pg_get_serial_sequence('"Card"', 'idCard'))),
+                %(layout)s, %(name)s, %(type)s, %(embed)s, %(shortEmbed)s,
+                %(asciiName)s, %(convertedManaCost)s, %(defense)s, %(edhrecRank)s,
+                %(edhrecSaltiness)s, %(faceManaValue)s, %(faceName)s,
+                %(firstPrinting)s, %(hand)s, %(hasAlternativeDeckLimit)s,
+                %(isFunny)s, %(isReserved)s, %(leadershipSkills)s,
+                %(legalities)s, %(life)s, %(loyalty)s, %(manaCost)s,
+                %(manaValue)s, %(power)s, %(side)s, %(text)s, %(toughness)s,
+                %(sourceHash)s
+            ) RETURNING "idCard";
+            """,
+            self.card_row(
+                card, id_card, foreign_key_ids, card_embedding, card_short_embedding, source_hash
+            )
+        )
+        result = cursor.fetchone()
 
-                cursor.execute(
-                    """
-                    INSERT INTO "Card" (
-                        "idCard", "layout", "name", "type", "embed", "shortEmbed",
-                        "asciiName", "convertedManaCost", "defense", "edhrecRank",
-                        "edhrecSaltiness", "faceManaValue", "faceName", "firstPrinting",
-                        "hand", "hasAlternativeDeckLimit", "isFunny", "isReserved",
-                        "leadershipSkills", "legalities", "life", "loyalty", "manaCost",
-                        "manaValue", "power", "side", "text", "toughness"
-                    ) VALUES (
-                        %(idCard)s, %(layout)s, %(name)s, %(type)s, %(embed)s, %(shortEmbed)s,
-                        %(asciiName)s, %(convertedManaCost)s, %(defense)s, %(edhrecRank)s,
-                        %(edhrecSaltiness)s, %(faceManaValue)s, %(faceName)s,
-                        %(firstPrinting)s, %(hand)s, %(hasAlternativeDeckLimit)s,
-                        %(isFunny)s, %(isReserved)s, %(leadershipSkills)s,
-                        %(legalities)s, %(life)s, %(loyalty)s, %(manaCost)s,
-                        %(manaValue)s, %(power)s, %(side)s, %(text)s, %(toughness)s
-                    ) RETURNING "idCard";
-                    """,
-                    {
-                        "idCard": next_card_id,
-                        "layout": id_layout,
-                        "name": card.name,
-                        "type": id_type,
-                        "embed": card_embedding,
-                        "shortEmbed": card_short_embedding,
-                        "asciiName": card.ascii_name,
-                        "convertedManaCost": card.converted_mana_cost,
-                        "defense": card.defense,
-                        "edhrecRank": card.edhrec_rank,
-                        "edhrecSaltiness": card.edhrec_saltiness,
-                        "faceManaValue": card.face_mana_value,
-                        "faceName": card.face_name,
-                        "firstPrinting": id_first_printing,
-                        "hand": card.hand,
-                        "hasAlternativeDeckLimit": card.has_alternative_deck_limit,
-                        "isFunny": card.is_funny,
-                        "isReserved": card.is_reserved,
-                        "leadershipSkills": id_leadership,
-                        "legalities": id_legalities,
-                        "life": card.life,
-                        "loyalty": card.loyalty,
-                        "manaCost": card.mana_cost,
-                        "manaValue": card.mana_value,
-                        "power": card.power,
-                        "side": card.side,
-                        "text": card.text,
-                        "toughness": card.toughness
-                    }
-                )
-                result = cursor.fetchone()
+        if result is None:
+            return False
 
-                if result is None:
-                    return False
+        self.insert_card_links(cursor, result["idCard"], card, foreign_key_ids)
+        self.refresh_documents(cursor, [result["idCard"]])
+        if card_embedding is None:
+            self.enqueue_embedding(cursor, result["idCard"])
+        # A new card changes the results of the searches
+        notify_cards_changed(cursor, [result["idCard"]])
+        return True
+
+    def card_row(
+        self, card: Card, id_card: int, foreign_key_ids: tuple, card_embedding,
+        card_short_embedding, source_hash: str = None
+    ) -> dict:
+        """
+        Returns the values of the columns of "Card" for the card
+        """
+        (
+            id_layout, id_type, id_first_printing, id_leadership, id_legalities, *_
+        ) = foreign_key_ids
+        return {
+            "idCard": id_card,
+            "layout": id_layout,
+            "name": card.name,
+            "type": id_type,
+            "embed": card_embedding,
+            "shortEmbed": card_short_embedding,
+            "asciiName": card.ascii_name,
+            "convertedManaCost": card.converted_mana_cost,
+            "defense": card.defense,
+            "edhrecRank": card.edhrec_rank,
+            "edhrecSaltiness": card.edhrec_saltiness,
+            "faceManaValue": card.face_mana_value,
+            "faceName": card.face_name,
+            "firstPrinting": id_first_printing,
+            "hand": card.hand,
+            "hasAlternativeDeckLimit": card.has_alternative_deck_limit,
+            "isFunny": card.is_funny,
+            "isReserved": card.is_reserved,
+            "leadershipSkills": id_leadership,
+            "legalities": id_legalities,
+            "life": card.life,
+            "loyalty": card.loyalty,
+            "manaCost": card.mana_cost,
+            "manaValue": card.mana_value,
+            "power": card.power,
+            "side": card.side,
+            "text": card.text,
+            "toughness": card.toughness,
+            "sourceHash": source_hash
+        }
+
+    def insert_cards(
+        self, cursor, cards: list[Card], dimension_ids: dict = None, embeddings: list = None,
+        source_hashes: list = None, notify: bool = True
+    ) -> list[int]:
+        """
+        Inserts several new cards and all their linked rows with the cursor given, without
+        committing. The number of queries does not depend on the number of cards (except for
+        the leadership skills and legalities not seen before in the batch).
 
-                id_card = result["idCard"]
+        Parameters
+        ----------
+        cursor : cursor
+            The cursor for the database
+        cards : list[Card]
+            The cards to add
+        dimension_ids : dict
+            The ids returned by get_dimension_ids for these cards, None to get them here
+        embeddings : list
+            (card_embedding, card_short_embedding) of every card, in the same order. When it is
+            None, embedding jobs are queued for the cards.
+        source_hashes : list
+            Hash of every card in AtomicCards.json, None for cards created through the API
+        notify : bool
+            False when the caller notifies the change itself, with other ones
 
-                for color, id_color in color_ids.items():
-                    cursor.execute(
-                        '''INSERT INTO "Colors"("idCard", "idColor")
-                        VALUES (%(idCard)s, %(idColor)s)''',
-                        {"idCard": id_card, "idColor": id_color}
-                    )
+        Returns
+        -------
+        list[int]
+            The ids given to the cards, in the same order
+        """
+        if not cards:
+            return []
+        if dimension_ids is None:
+            dimension_ids = self.get_dimension_ids(cursor, cards)
+        if embeddings is None:
+            embeddings = [(None, None)] * len(cards)
+            queue_embeddings = True
+        else:
+            queue_embeddings = False
+        if source_hashes is None:
+            source_hashes = [None] * len(cards)
 
-                for color, id_color in color_identity_ids.items():
-                    cursor.execute(
-                        '''INSERT INTO "ColorIdentity"("idCard", "idColor")
-                        VALUES (%(idCard)s, %(idColor)s)''',
-                        {"idCard": id_card, "idColor": id_color}
-                    )
+        cursor.execute(
+            """
+            SELECT nextval(pg_get_serial_sequence('"Card"', 'idCard')) AS "idCard"
+            FROM generate_series(1, %(count)s)
+            """,
+            {"count": len(cards)}
+        )
+        ids = [row["idCard"] for row in cursor.fetchall()]
+
+        rows = []
+        links = []
+        for id_card, card, (embed, short_embed), source_hash in zip(
+            ids, cards, embeddings, source_hashes
+        ):
+            foreign_key_ids = self.get_foreign_key_ids(cursor, card, dimension_ids)
+            rows.append(
+                self.card_row(card, id_card, foreign_key_ids, embed, short_embed, source_hash)
+            )
+            links.append((id_card, card, foreign_key_ids))
+
+        columns = list(rows[0])
+        column_names = ", ".join(f'"{column}"' for column in columns)
+        execute_values(
+            cursor,
+            f'INSERT INTO "Card" ({column_names}) VALUES %s',
+            rows,
+            template="(" + ", ".join(f"%({column})s" for column in columns) + ")"
+        )
+        self.insert_cards_links(cursor, links)
+        self.refresh_documents(cursor, ids)
+        if queue_embeddings:
+            execute_values(
+                cursor,
+                'INSERT INTO "EmbeddingJob"("idCard") VALUES %s ' + REQUEUE,
+                [(id_card,) for id_card in ids]
+            )
+        if notify:
+            notify_cards_changed(cursor, ids)
+        return ids
 
-                for color, id_color in color_indicator_ids.items():
-                    cursor.execute(
-                        '''INSERT INTO "ColorIndicator"("idCard", "idColor")
-                        VALUES (%(idCard)s, %(idColor)s)''',
-                        {"idCard": id_card, "idColor": id_color}
-                    )
+    def create_cards(self, cards: list[Card]) -> list[dict]:
+        """
+        Adds several cards to the database in a single transaction. The cards are inserted
+        together; if that fails, they are inserted again one by one so that only the invalid
+        ones are left out.
 
-                for keyword, id_keyword in keyword_ids.items():
-                    cursor.execute(
-                        '''INSERT INTO "Keywords"("idCard", "idKeyword")
-                        VALUES (%(idCard)s, %(idKeyword)s)''',
-                        {"idCard": id_card, "idKeyword": id_keyword}
-                    )
+        Parameters
+        ----------
+        cards : list[Card]
+            The cards to add
 
-                for type_name, id_t in type_ids.items():
-                    cursor.execute(
-                        '''INSERT INTO "Types"("idCard", "idType")
-                        VALUES (%(idCard)s, %(idType)s)''',
-                        {"idCard": id_card, "idType": id_t}
-                    )
+        Returns
+        -------
+        list[dict]
+            For every card, in the same order: {"index", "id_card", "status", "error"} where
+            status is "created" or "error"
+        """
+        if not cards:
+            return []
 
-                for subtype, id_subtype in subtype_ids.items():
-                    cursor.execute(
-                        '''INSERT INTO "Subtypes"("idCard", "idSubtype")
-                        VALUES (%(idCard)s, %(idSubtype)s)''',
-                        {"idCard": id_card, "idSubtype": id_subtype}
-                    )
+        with DBConnection().connection as connection:
+            with connection.cursor() as cursor:
+                try:
+                    dimension_ids = self.get_dimension_ids(cursor, cards)
+                except Exception as e:
+                    connection.rollback()
+                    logging.error(f"Error creating cards: {e}")
+                    return [
+                        {"index": index, "id_card": None, "status": "error", "error": str(e)}
+                        for index in range(len(cards))
+                    ]
+
+                cursor.execute("SAVEPOINT create_cards")
+                try:
+                    ids = self.insert_cards(cursor, cards, dimension_ids)
+                    results = [
+                        {"index": index, "id_card": id_card, "status": "created", "error": None}
+                        for index, id_card in enumerate(ids)
+                    ]
+                except Exception as e:
+                    logging.warning(f"Bulk insert failed ({e}), inserting the cards one by one")
+                    cursor.execute("ROLLBACK TO SAVEPOINT create_cards")
+                    results = []
+                    for index, card in enumerate(cards):
+                        cursor.execute("SAVEPOINT create_card")
+                        try:
+                            (id_card,) = self.insert_cards(cursor, [card], dimension_ids)
+                            cursor.execute("RELEASE SAVEPOINT create_card")
+                            results.append(
+                                {"index": index, "id_card": id_card, "status": "created",
+                                 "error": None}
+                            )
+                        except Exception as card_error:
+                            cursor.execute("ROLLBACK TO SAVEPOINT create_card")
+                            results.append(
+                                {"index": index, "id_card": None, "status": "error",
+                                 "error": str(card_error)}
+                            )
+                connection.commit()
+        return results
+
+    def refresh_documents(self, cursor, ids: list[int] = None) -> None:
+        """
+        Builds again the rows of "CardDocument" (the cards as sent by the API, see the SQL
+        function card_document) with the cursor given, without committing. Must run after
+        all the rows of the cards are written.
+
+        Parameters
+        ----------
+        cursor : cursor
+            The cursor for the database
+        ids : list[int]
+            The ids of the cards to refresh, None for all the cards
+        """
+        if ids is not None and not ids:
+            return
+        where = 'WHERE "idCard" = ANY(%(ids)s)' if ids is not None else ""
+        cursor.execute(
+            f"""
+            INSERT INTO "CardDocument" ("idCard", "document")
+            SELECT "idCard", card_document("idCard") FROM "Card" {where}
+            ON CONFLICT ("idCard") DO UPDATE SET "document" = EXCLUDED."document"
+            """,
+            {"ids": list(ids)} if ids is not None else None
+        )
+
+    def get_document(self, id_card: int) -> dict | None:
+        """
+        Returns the card as sent by the API, ready-made in "CardDocument", None if the card
+        does not exist
+        """
+        with DBConnection().connection as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT "document" FROM "CardDocument" WHERE "idCard" = %(idCard)s',
+                    {"idCard": id_card},
+                    prepare=True
+                )
+                res = cursor.fetchone()
+        return res["document"] if res else None
 
-                for supertype, id_supertype in supertype_ids.items():
+    def get_document_json(self, id_card: int, fields: list[str] = None) -> bytes | None:
+        """
+        Returns the document of the card already encoded as JSON, to be sent without being
+        decoded and encoded again, None if the card does not exist. With [fields], only
+        these keys of the document (and "id_card") are kept, by the database.
+        """
+        with DBConnection().connection as connection:
+            with connection.cursor() as cursor:
+                if fields is None:
                     cursor.execute(
-                        '''INSERT INTO "Supertypes"("idCard", "idSupertype")
-                        VALUES (%(idCard)s, %(idSupertype)s)''',
-                        {"idCard": id_card, "idSupertype": id_supertype}
+                        'SELECT "document"::text AS "document" FROM "CardDocument" '
+                        'WHERE "idCard" = %(idCard)s',
+                        {"idCard": id_card},
+                        prepare=True
                     )
-
-                for printing, id_printing in printing_ids.items():
+                else:
                     cursor.execute(
-                        '''INSERT INTO "Printings"("idCard", "idSet")
-                        VALUES (%(idCard)s, %(idSet)s)''',
-                        {"idCard": id_card, "idSet": id_printing}
+                        """
+                        SELECT (
+                            SELECT jsonb_object_agg(key, value) FROM jsonb_each("document")
+                            WHERE key = 'id_card' OR key = ANY(%(fields)s::text[])
+                        )::text AS "document"
+                        FROM "CardDocument"
+                        WHERE "idCard" = %(idCard)s
+                        """,
+                        {"idCard": id_card, "fields": list(fields)},
+                        prepare=True
                     )
+                res = cursor.fetchone()
+        return res["document"].encode("utf-8") if res else None
 
-                if card.purchase_urls:
-                    CardDao().insert_purchase_url(cursor, id_card, card)
+    def enqueue_embedding(self, cursor, id_card: int) -> None:
+        """
+        Queues the computation of the embeddings of a card, see utils/embedding_worker.py. A
+        job already queued gets a new "enqueuedAt" and is released: a worker embedding the
+        previous text sees it and neither writes its vectors nor deletes the job.
+        """
+        cursor.execute(
+            'INSERT INTO "EmbeddingJob"("idCard") VALUES (%(idCard)s) ' + REQUEUE,
+            {"idCard": id_card}
+        )
 
-                if card.foreign_data:
-                    for foreign in card.foreign_data:
-                        CardDao().insert_foreign_data(cursor, id_card, foreign)
+    def insert_card_links(self, cursor, id_card: int, card: Card, foreign_key_ids: tuple):
+        """
+        Inserts the rows of all the tables linked to the card (colors, keywords, types,
+        printings, purchase urls, foreign data and rulings)
+        """
+        self.insert_cards_links(cursor, [(id_card, card, foreign_key_ids)])
 
-                if card.rulings:
-                    for ruling in card.rulings:
-                        CardDao().insert_ruling(cursor, id_card, ruling)
+    def insert_cards_links(self, cursor, cards: list[tuple]):
+        """
+        Inserts the rows linked to several cards, with one multi-row insert per table
 
-                connection.commit()
-                return True
+        Parameters
+        ----------
+        cursor : cursor
+            The cursor for the database
+        cards : list[tuple]
+            (idCard, card, foreign key ids returned by get_foreign_key_ids) for every card
+        """
+        link_rows = {}
+        for id_card, card, foreign_key_ids in cards:
+            (
+                id_layout, id_type, id_first_printing, id_leadership, id_legalities, color_ids,
+                color_identity_ids, color_indicator_ids, keyword_ids, type_ids, subtype_ids,
+                supertype_ids, printing_ids
+            ) = foreign_key_ids
+
+            links = [
+                ("Colors", "idColor", color_ids),
+                ("ColorIdentity", "idColor", color_identity_ids),
+                ("ColorIndicator", "idColor", color_indicator_ids),
+                ("Keywords", "idKeyword", keyword_ids),
+                ("Types", "idType", type_ids),
+                ("Subtypes", "idSubtype", subtype_ids),
+                ("Supertypes", "idSupertype", supertype_ids),
+                ("Printings", "idSet", printing_ids),
+            ]
+            for table, id_column, ids in links:
+                link_rows.setdefault((table, id_column), []).extend(
+                    (id_card, id_value) for id_value in dict.fromkeys(ids.values())
+                )
 
-    def insert_purchase_url(self, cursor, id_card, card):
-        cursor.execute(
-            '''
-            SELECT MAX("idPurchaseURLs")
-            FROM "PurchaseURLs"
-            '''
+        for (table, id_column), rows in link_rows.items():
+            if rows:
+                execute_values(
+                    cursor,
+                    f'INSERT INTO "{table}"("idCard", "{id_column}") VALUES %s',
+                    rows
+                )
+
+        self.insert_purchase_urls(
+            cursor, [(id_card, card.purchase_urls) for id_card, card, _ in cards]
         )
-        id_max_purchase_url = cursor.fetchone()["max"]
-        cursor.execute(
-            """
-            INSERT INTO "PurchaseURLs"(
-                "idPurchaseURLs", "idCard", "tcgplayer", "cardKingdom", "cardmarket",
-                "cardKingdomFoil", "cardKingdomEtched", "tcgplayerEtched"
-            ) VALUES (
-                %(idPurchaseURLs)s, %(idCard)s, %(tcgplayer)s, %(cardKingdom)s,
-                %(cardmarket)s, %(cardKingdomFoil)s, %(cardKingdomEtched)s,
-                %(tcgplayerEtched)s
-            )
-            """,
-            {
-                "idPurchaseURLs": id_max_purchase_url + 1,
-                "idCard": id_card,
-                "tcgplayer": card.purchase_urls.get("tcgplayer"),
-                "cardKingdom": card.purchase_urls.get("cardKingdom"),
-                "cardmarket": card.purchase_urls.get("cardmarket"),
-                "cardKingdomFoil": card.purchase_urls.get("cardKingdomFoil"),
-                "cardKingdomEtched": card.purchase_urls.get("cardKingdomEtched"),
-                "tcgplayerEtched": card.purchase_urls.get("tcgplayerEtched")
-            }
+        self.insert_foreign_data(
+            cursor, [(id_card, card.foreign_data) for id_card, card, _ in cards]
         )
+        self.insert_rulings(cursor, [(id_card, card.rulings) for id_card, card, _ in cards])
+
+    def insert_purchase_urls(self, cursor, purchase_urls: list[tuple]):
+        """Inserts the purchase urls of (idCard, purchase_urls) pairs with a multi-row insert"""
+        rows = [
+            (
+                id_card, urls.get("tcgplayer"), urls.get("cardKingdom"), urls.get("cardmarket"),
+                urls.get("cardKingdomFoil"), urls.get("cardKingdomEtched"),
+                urls.get("tcgplayerEtched")
+            )
+            for id_card, urls in purchase_urls
+            if urls
+        ]
+        if rows:
+            execute_values(
+                cursor,
+                """
+                INSERT INTO "PurchaseURLs"(
+                    "idCard", "tcgplayer", "cardKingdom", "cardmarket", "cardKingdomFoil",
+                    "cardKingdomEtched", "tcgplayerEtched"
+                ) VALUES %s
+                """,
+                rows
+            )
 
-    def insert_foreign_data(self, cursor, id_card, foreign):
-        cursor.execute(
-            '''
-            SELECT MAX("idForeign")
-            FROM "ForeignData"
-            '''
-        )
-        id_max_foreign = cursor.fetchone()["max"]
-        cursor.execute(
-            """
-            INSERT INTO "ForeignData"(
-                "idForeign", "idCard", "language", "name", "faceName",
-                "flavorText", "text", "type"
-            ) VALUES (
-                %(idForeign)s, %(idCard)s, %(language)s, %(name)s, %(faceName)s,
-                %(flavorText)s, %(text)s, %(type)s
+    def insert_foreign_data(self, cursor, foreign_data: list[tuple]):
+        """Inserts the translations of (idCard, foreign_data) pairs with a multi-row insert"""
+        rows = [
+            (
+                id_card, foreign.get("language"), foreign.get("name"),
+                foreign.get("faceName"), foreign.get("flavorText"), foreign.get("text"),
+                foreign.get("type")
+            )
+            for id_card, card_foreign_data in foreign_data
+            for foreign in card_foreign_data or []
+        ]
+        if rows:
+            execute_values(
+                cursor,
+                """
+                INSERT INTO "ForeignData"(
+                    "idCard", "language", "name", "faceName", "flavorText", "text", "type"
+                ) VALUES %s
+                """,
+                rows
             )
-            """,
-            {
-                "idForeign": id_max_foreign + 1,
-                "idCard": id_card,
-                "language": foreign.get("language"),
-                "name": foreign.get("name"),
-                "faceName": foreign.get("faceName"),
-                "flavorText": foreign.get("flavorText"),
-                "text": foreign.get("text"),
-                "type": foreign.get("type")
-            }
-        )
 
-    def insert_ruling(self, cursor, id_card, ruling):
-        cursor.execute(
-            '''
-            SELECT MAX("idRuling")
-            FROM "Ruling"
-            '''
-        )
-        id_max_ruling = cursor.fetchone()["max"]
-        cursor.execute(
-            """
-            INSERT INTO "Ruling"("idRuling", "idCard", "date", "text")
-            VALUES (%(idRuling)s, %(idCard)s, %(date)s, %(text)s)
-            """,
-            {
-                "idRuling": id_max_ruling + 1,
-                "idCard": id_card,
-                "date": ruling.get("date"),
-                "text": ruling.get("text")
-            }
-        )
+    def insert_rulings(self, cursor, rulings: list[tuple]):
+        """Inserts the rulings of (idCard, rulings) pairs with a multi-row insert"""
+        rows = [
+            (id_card, ruling.get("date"), ruling.get("text"))
+            for id_card, card_rulings in rulings
+            for ruling in card_rulings or []
+        ]
+        if rows:
+            execute_values(
+                cursor,
+                """
+                INSERT INTO "Ruling"("idCard", "date", "text") VALUES %s
+                """,
+                rows
+            )
 
     def update_card(self, card: Card) -> bool:
         """
-        Update an existing card in the database
+        Update an existing card in the database. Only the columns and the linked rows that
+        changed are written. If the text of the embeddings changed, they are set as pending
+        and the EmbeddingWorker computes them later.
 
         Parameters
         ----------
@@ -480,167 +889,320 @@ class CardDao:
         bool
             True if update succeeded, False otherwise
         """
-        card_embedding, card_short_embedding = CardDao().get_embed(card)
-
-        (
-            id_layout, id_type, id_first_printing, id_leadership, id_legalities, color_ids,
-            color_identity_ids, color_indicator_ids, keyword_ids, type_ids, subtype_ids,
-            supertype_ids, printing_ids
-        ) = CardDao().get_or_create_all_ids_from_foreign_keys(card)
-
         with DBConnection().connection as connection:
             with connection.cursor() as cursor:
-                cursor.execute('SET search_path TO defaultdb, public;')
+                # Read in the transaction writing the changes, not from the CardCache: a write
+                # of another process may not have invalidated its copy yet
+                current = self.read_card(card.id_card, cursor=cursor)
+                if current is None:
+                    return False
 
-                cursor.execute(
-                    """
-                    UPDATE "Card"
-                    SET "layout"               = %(layout)s,
-                        "name"                 = %(name)s,
-                        "type"                 = %(type)s,
-                        "embed"                = %(embed)s,
-                        "shortEmbed"           = %(shortEmbed)s,
-                        "asciiName"            = %(asciiName)s,
-                        "convertedManaCost"    = %(convertedManaCost)s,
-                        "defense"              = %(defense)s,
-                        "edhrecRank"           = %(edhrecRank)s,
-                        "edhrecSaltiness"      = %(edhrecSaltiness)s,
-                        "faceManaValue"        = %(faceManaValue)s,
-                        "faceName"             = %(faceName)s,
-                        "firstPrinting"        = %(firstPrinting)s,
-                        "hand"                 = %(hand)s,
-                        "hasAlternativeDeckLimit" = %(hasAlternativeDeckLimit)s,
-                        "isFunny"              = %(isFunny)s,
-                        "isReserved"           = %(isReserved)s,
-                        "leadershipSkills"     = %(leadershipSkills)s,
-                        "legalities"           = %(legalities)s,
-                        "life"                 = %(life)s,
-                        "loyalty"              = %(loyalty)s,
-                        "manaCost"             = %(manaCost)s,
-                        "manaValue"            = %(manaValue)s,
-                        "power"                = %(power)s,
-                        "side"                 = %(side)s,
-                        "text"                 = %(text)s,
-                        "toughness"            = %(toughness)s
-                    WHERE "idCard" = %(idCard)s;
-                    """,
-                    {
-                        "idCard": card.id_card,
-                        "layout": id_layout,
-                        "name": card.name,
-                        "type": id_type,
-                        "embed": card_embedding,
-                        "shortEmbed": card_short_embedding,
-                        "asciiName": card.ascii_name,
-                        "convertedManaCost": card.converted_mana_cost,
-                        "defense": card.defense,
-                        "edhrecRank": card.edhrec_rank,
-                        "edhrecSaltiness": card.edhrec_saltiness,
-                        "faceManaValue": card.face_mana_value,
-                        "faceName": card.face_name,
-                        "firstPrinting": id_first_printing,
-                        "hand": card.hand,
-                        "hasAlternativeDeckLimit": card.has_alternative_deck_limit,
-                        "isFunny": card.is_funny,
-                        "isReserved": card.is_reserved,
-                        "leadershipSkills": id_leadership,
-                        "legalities": id_legalities,
-                        "life": card.life,
-                        "loyalty": card.loyalty,
-                        "manaCost": card.mana_cost,
-                        "manaValue": card.mana_value,
-                        "power": card.power,
-                        "side": card.side,
-                        "text": card.text,
-                        "toughness": card.toughness
-                    }
-                )
+                changes, reembed = self.prepare_update(current, card)
+                if not changes:
+                    return True
 
-                id_card = card.id_card
+                self.update_card_changes(cursor, card, changes, reembed)
+                connection.commit()
+        CardCache().invalidate([card.id_card])
+        return True
 
-                CardDao().delete_from_table(cursor, "Colors", id_card)
-                for color, id_color in color_ids.items():
-                    cursor.execute(
-                        '''INSERT INTO "Colors"("idCard", "idColor")
-                        VALUES (%(idCard)s, %(idColor)s)''',
-                        {"idCard": id_card, "idColor": id_color}
-                    )
+    def prepare_update(self, current: Card, card: Card) -> tuple[dict, bool]:
+        """
+        Compares the stored card with its new version and counts the update in UPDATE_STATS
 
-                CardDao().delete_from_table(cursor, "ColorIdentity", id_card)
-                for color, id_color in color_identity_ids.items():
-                    cursor.execute(
-                        '''INSERT INTO "ColorIdentity"("idCard", "idColor")
-                        VALUES (%(idCard)s, %(idColor)s)''',
-                        {"idCard": id_card, "idColor": id_color}
-                    )
+        Returns
+        -------
+        tuple[dict, bool]
+            The changes returned by diff_card, and True if the embeddings must be computed again
+        """
+        changes = self.diff_card(current, card)
+        reembed = self.get_embed_texts(current) != self.get_embed_texts(card)
+
+        UPDATE_STATS["updates"] += 1
+        if reembed:
+            UPDATE_STATS["reembedded"] += 1
+        logging.info(
+            f"Card {card.id_card} updated: {len(changes)} changed attributes, "
+            f"{'embeddings queued' if reembed else 'embeddings kept'} "
+            f"({self.update_embedding_skip_rate():.0%} of the updates kept their embeddings)"
+        )
+        return changes, reembed
 
-                CardDao().delete_from_table(cursor, "ColorIndicator", id_card)
-                for color, id_color in color_indicator_ids.items():
-                    cursor.execute(
-                        '''INSERT INTO "ColorIndicator"("idCard", "idColor")
-                        VALUES (%(idCard)s, %(idColor)s)''',
-                        {"idCard": id_card, "idColor": id_color}
-                    )
+    def update_cards(self, cards: list[Card]) -> list[dict]:
+        """
+        Updates several existing cards in a single transaction. Like update_card, only what
+        changed is written; a card that cannot be updated is rolled back alone and the others
+        are kept.
 
-                CardDao().delete_from_table(cursor, "Keywords", id_card)
-                for keyword, id_keyword in keyword_ids.items():
-                    cursor.execute(
-                        '''INSERT INTO "Keywords"("idCard", "idKeyword")
-                        VALUES (%(idCard)s, %(idKeyword)s)''',
-                        {"idCard": id_card, "idKeyword": id_keyword}
-                    )
+        Parameters
+        ----------
+        cards : list[Card]
+            The cards with updated information
 
-                CardDao().delete_from_table(cursor, "Types", id_card)
-                for type_name, id_t in type_ids.items():
-                    cursor.execute(
-                        '''INSERT INTO "Types"("idCard", "idType")
-                        VALUES (%(idCard)s, %(idType)s)''',
-                        {"idCard": id_card, "idType": id_t}
-                    )
+        Returns
+        -------
+        list[dict]
+            For every card, in the same order: {"index", "id_card", "status", "error"} where
+            status is "updated", "unchanged", "not_found" or "error"
+        """
+        results = []
+        with DBConnection().connection as connection:
+            with connection.cursor() as cursor:
+                for index, card in enumerate(cards):
+                    result = {"index": index, "id_card": card.id_card, "error": None}
+                    results.append(result)
+                    # Read in the transaction, not from the CardCache, like update_card
+                    current = self.read_card(card.id_card, cursor=cursor)
+                    if current is None:
+                        result["status"] = "not_found"
+                        continue
+
+                    changes, reembed = self.prepare_update(current, card)
+                    if not changes:
+                        result["status"] = "unchanged"
+                        continue
+
+                    cursor.execute("SAVEPOINT update_card")
+                    try:
+                        self.update_card_changes(cursor, card, changes, reembed)
+                        cursor.execute("RELEASE SAVEPOINT update_card")
+                        result["status"] = "updated"
+                    except Exception as e:
+                        cursor.execute("ROLLBACK TO SAVEPOINT update_card")
+                        result["status"] = "error"
+                        result["error"] = str(e)
+                connection.commit()
+        CardCache().invalidate(
+            [result["id_card"] for result in results if result["status"] == "updated"]
+        )
+        return results
 
-                CardDao().delete_from_table(cursor, "Subtypes", id_card)
-                for subtype, id_subtype in subtype_ids.items():
-                    cursor.execute(
-                        '''INSERT INTO "Subtypes"("idCard", "idSubtype")
-                        VALUES (%(idCard)s, %(idSubtype)s)''',
-                        {"idCard": id_card, "idSubtype": id_subtype}
-                    )
+    def update_embedding_skip_rate(self) -> float:
+        """Proportion of the updates that did not need to compute the embeddings again"""
+        if UPDATE_STATS["updates"] == 0:
+            return 0.0
+        return 1 - UPDATE_STATS["reembedded"] / UPDATE_STATS["updates"]
 
-                CardDao().delete_from_table(cursor, "Supertypes", id_card)
-                for supertype, id_supertype in supertype_ids.items():
-                    cursor.execute(
-                        '''INSERT INTO "Supertypes"("idCard", "idSupertype")
-                        VALUES (%(idCard)s, %(idSupertype)s)''',
-                        {"idCard": id_card, "idSupertype": id_supertype}
-                    )
+    def _comparable(self, attribute: str, value):
+        """
+        Normalises the value of an attribute of a Card, so that two values storing the same
+        rows compare equal (order of the lists, missing keys, dates as strings...)
+        """
+        if attribute in CARD_LINKS:
+            return set(value or [])
+        if attribute == "leadership_skills":
+            if not value:
+                return None
+            skills = ("brawl", "commander", "oathbreaker")
+            return tuple(value.get(skill, False) for skill in skills)
+        if attribute == "legalities":
+            return {
+                format_name: status for format_name, status in (value or {}).items()
+                if status in ("Legal", "Banned", "Restricted")
+            }
+        if attribute == "purchase_urls":
+            return {url: link for url, link in (value or {}).items() if link is not None}
+        if attribute == "foreign_data":
+            columns = ("language", "name", "faceName", "flavorText", "text", "type")
+            return sorted(
+                (tuple(foreign.get(column) for column in columns) for foreign in value or []),
+                key=repr
+            )
+        if attribute == "rulings":
+            return sorted((str(ruling.get("date")), ruling.get("text")) for ruling in value or [])
+        return value
 
-                CardDao().delete_from_table(cursor, "Printings", id_card)
-                for printing, id_printing in printing_ids.items():
-                    cursor.execute(
-                        '''INSERT INTO "Printings"("idCard", "idSet")
-                        VALUES (%(idCard)s, %(idSet)s)''',
-                        {"idCard": id_card, "idSet": id_printing}
-                    )
+    def diff_card(self, current: Card, card: Card) -> dict:
+        """
+        Compares the card stored in the database with its new version
+
+        Returns
+        -------
+        dict
+            {attribute: change} for every attribute that changed. The change is the
+            (added values, removed values) pair for the attributes stored in a link table, the
+            new value otherwise.
+        """
+        changes = {}
+        attributes = (
+            list(CARD_ATTRIBUTE_COLUMNS) + list(CARD_REFERENCE_COLUMNS) + list(CARD_LINKS)
+            + list(CARD_ROWS)
+        )
+        for attribute in attributes:
+            old_value = self._comparable(attribute, getattr(current, attribute))
+            new_value = self._comparable(attribute, getattr(card, attribute))
+            if old_value == new_value:
+                continue
+            if attribute in CARD_LINKS:
+                changes[attribute] = (
+                    [value for value in dict.fromkeys(getattr(card, attribute) or [])
+                     if value not in old_value],
+                    sorted(old_value - new_value)
+                )
+            else:
+                changes[attribute] = getattr(card, attribute)
+        return changes
+
+    def update_card_changes(
+        self, cursor, card: Card, changes: dict, reembed: bool = False
+    ) -> None:
+        """
+        Writes the changes found by diff_card with the cursor given, without committing
 
-                CardDao().delete_from_table(cursor, "PurchaseURLs", id_card)
-                if card.purchase_urls:
-                    CardDao().insert_purchase_url(cursor, id_card, card)
+        Parameters
+        ----------
+        cursor : cursor
+            The cursor for the database
+        card : Card
+            The new version of the card
+        changes : dict
+            The changes returned by diff_card
+        reembed : bool
+            True to set the embeddings as pending and queue their computation
+        """
+        if reembed:
+            # Queued before the card row is locked, in the order the EmbeddingWorker locks
+            # them when it writes (job, then card), so that the two never deadlock. A worker
+            # embedding the old text then finds a new "enqueuedAt" and keeps the job for the
+            # new text
+            self.enqueue_embedding(cursor, card.id_card)
+
+        columns = {}
+        for attribute, column in CARD_ATTRIBUTE_COLUMNS.items():
+            if attribute in changes:
+                columns[column] = changes[attribute]
+        if "layout" in changes:
+            columns["layout"] = self._get_or_create_ids(
+                cursor, "Layout", "idLayout", "name", [card.layout]
+                )[card.layout]
+        if "type_line" in changes:
+            columns["type"] = self._get_or_create_ids(
+                cursor, "Type", "idType", "name", [card.type_line]
+                )[card.type_line]
+        if "first_printing" in changes:
+            columns["firstPrinting"] = None
+            if card.first_printing:
+                columns["firstPrinting"] = self._get_or_create_ids(
+                    cursor, "Set", "idSet", "name", [card.first_printing]
+                    )[card.first_printing]
+        if "leadership_skills" in changes:
+            columns["leadershipSkills"] = self.get_leadership_id(cursor, card)
+        if "legalities" in changes:
+            columns["legalities"] = self.get_legalities_id(cursor, card)
+        if reembed:
+            columns["embed"], columns["shortEmbed"] = None, None
+
+        if columns:
+            assignments = ", ".join(f'"{column}" = %({column})s' for column in columns)
+            cursor.execute(
+                f'UPDATE "Card" SET {assignments} WHERE "idCard" = %(idCard)s',
+                {**columns, "idCard": card.id_card}
+            )
+        notify_cards_changed(cursor, [card.id_card])
 
-                CardDao().delete_from_table(cursor, "ForeignData", id_card)
-                if card.foreign_data:
-                    for foreign in card.foreign_data:
-                        CardDao().insert_foreign_data(cursor, id_card, foreign)
+        for attribute, (link_table, table, id_column, name_column) in CARD_LINKS.items():
+            if attribute not in changes:
+                continue
+            added, removed = changes[attribute]
+            if removed:
+                cursor.execute(
+                    f"""
+                    DELETE FROM "{link_table}" l
+                    USING "{table}" t
+                    WHERE l."idCard" = %(idCard)s
+                      AND l."{id_column}" = t."{id_column}"
+                      AND t."{name_column}" = ANY(%(values)s)
+                    """,
+                    {"idCard": card.id_card, "values": removed}
+                )
+            if added:
+                ids = self._get_or_create_ids(cursor, table, id_column, name_column, added)
+                execute_values(
+                    cursor,
+                    f'INSERT INTO "{link_table}"("idCard", "{id_column}") VALUES %s',
+                    [(card.id_card, ids[value]) for value in added]
+                )
 
-                CardDao().delete_from_table(cursor, "Ruling", id_card)
-                if card.rulings:
-                    for ruling in card.rulings:
-                        CardDao().insert_ruling(cursor, id_card, ruling)
+        for attribute, table in CARD_ROWS.items():
+            if attribute not in changes:
+                continue
+            self.delete_from_table(cursor, table, card.id_card)
+            if attribute == "purchase_urls":
+                self.insert_purchase_urls(cursor, [(card.id_card, card.purchase_urls)])
+            elif attribute == "foreign_data":
+                self.insert_foreign_data(cursor, [(card.id_card, card.foreign_data)])
+            else:
+                self.insert_rulings(cursor, [(card.id_card, card.rulings)])
+        self.refresh_documents(cursor, [card.id_card])
+
+    def update_cards_rows(
+        self, cursor, cards: list[Card], embeddings: list, source_hashes: list = None,
+        notify: bool = True
+    ) -> None:
+        """
+        Updates several cards and rewrites all their linked rows with the cursor given,
+        without committing: one UPDATE per page of cards, then the linked rows are deleted and
+        inserted again for all the cards at once. A source hash is only changed when one is
+        given.
 
-                connection.commit()
-                return True
+        Parameters
+        ----------
+        cursor : cursor
+            The cursor for the database
+        cards : list[Card]
+            The new versions of the cards, with their id
+        embeddings : list
+            (card_embedding, card_short_embedding) of every card, in the same order
+        source_hashes : list
+            Hash of every card in AtomicCards.json, None to keep the stored one
+        notify : bool
+            False when the caller notifies the change itself, with other ones
+        """
+        if not cards:
+            return
+        if source_hashes is None:
+            source_hashes = [None] * len(cards)
+        dimension_ids = self.get_dimension_ids(cursor, cards)
+
+        rows = []
+        links = []
+        for card, (embed, short_embed), source_hash in zip(cards, embeddings, source_hashes):
+            foreign_key_ids = self.get_foreign_key_ids(cursor, card, dimension_ids)
+            rows.append(
+                self.card_row(card, card.id_card, foreign_key_ids, embed, short_embed, source_hash)
+            )
+            links.append((card.id_card, card, foreign_key_ids))
+
+        # The values are typed: a column of the VALUES list with only NULLs or strings would
+        # be text, which is not assignable to the int and vector columns
+        columns = list(rows[0])
+        column_names = ", ".join(f'"{column}"' for column in columns)
+        assignments = ", ".join(
+            f'"{column}" = v."{column}"' for column in columns
+            if column not in ("idCard", "sourceHash")
+        )
+        execute_values(
+            cursor,
+            f'UPDATE "Card" c SET {assignments}, '
+            f'"sourceHash" = COALESCE(v."sourceHash", c."sourceHash") '
+            f'FROM (VALUES %s) AS v({column_names}) '
+            f'WHERE c."idCard" = v."idCard"',
+            rows,
+            template="(" + ", ".join(
+                f"%({column})s::{CARD_COLUMN_TYPES[column]}" for column in columns
+            ) + ")"
+        )
+
+        ids = [card.id_card for card in cards]
+        for table in CARD_LINK_TABLES:
+            cursor.execute(f'DELETE FROM "{table}" WHERE "idCard" = ANY(%(ids)s)', {"ids": ids})
+        self.insert_cards_links(cursor, links)
+        self.refresh_documents(cursor, ids)
+        if notify:
+            notify_cards_changed(cursor, ids)
 
     def delete_from_table(self, cursor, table, id_card):
-        cursor.execute(f'DELETE FROM "{table}" WHERE "idCard" = {id_card};')
+        cursor.execute(f'DELETE FROM "{table}" WHERE "idCard" = %(idCard)s;', {"idCard": id_card})
 
     def delete_card(self, id_card: int) -> bool:
         """
@@ -657,35 +1219,88 @@ class CardDao:
             True if deletion succeeded, False otherwise
         """
         try:
-            column_with_foreign_key = [
-                "Colors", "ColorIdentity", "ColorIndicator", "Keywords", "Types", "Subtypes",
-                "Supertypes", "Printings", "PurchaseURLs", "ForeignData", "Ruling"
-            ]
             with DBConnection().connection as connection:
                 with connection.cursor() as cursor:
-                    cursor.execute('SET search_path TO defaultdb, public;')
-                    for column in column_with_foreign_key:
-                        CardDao().delete_from_table(cursor, column, id_card)
-                    cursor.execute(
-                        'DELETE FROM "Card" WHERE "idCard" = %(idCard)s;',
-                        {"idCard": id_card}
-                    )
-                    return cursor.rowcount > 0
+                    deleted = self.delete_cards_rows(cursor, [id_card])
         except Exception as e:
             logging.error(f"Error deleting card: {e}")
             return False
+        CardCache().invalidate(deleted)
+        return len(deleted) > 0
+
+    def delete_cards(self, ids: list[int]) -> list[dict]:
+        """
+        Deletes several cards from the database in a single transaction
+
+        Parameters
+        ----------
+        ids : list[int]
+            IDs of the cards to delete
+
+        Returns
+        -------
+        list[dict]
+            For every id, in the same order: {"index", "id_card", "status", "error"} where
+            status is "deleted", "not_found" or "error"
+        """
+        try:
+            with DBConnection().connection as connection:
+                with connection.cursor() as cursor:
+                    deleted = set(self.delete_cards_rows(cursor, ids))
+                    connection.commit()
+        except Exception as e:
+            logging.error(f"Error deleting cards: {e}")
+            return [
+                {"index": index, "id_card": id_card, "status": "error", "error": str(e)}
+                for index, id_card in enumerate(ids)
+            ]
+        CardCache().invalidate(deleted)
+        return [
+            {"index": index, "id_card": id_card,
+             "status": "deleted" if id_card in deleted else "not_found", "error": None}
+            for index, id_card in enumerate(ids)
+        ]
+
+    def delete_cards_rows(self, cursor, ids: list[int], notify: bool = True) -> list[int]:
+        """
+        Deletes cards with the cursor given, without committing, in a single statement: their
+        linked rows, favourites and embedding jobs go with them through ON DELETE CASCADE.
+        With notify=False, the caller notifies the change itself.
+
+        Returns
+        -------
+        list[int]
+            The ids of the cards that were deleted
+        """
+        if not ids:
+            return []
+        cursor.execute(
+            'DELETE FROM "Card" WHERE "idCard" = ANY(%(ids)s) RETURNING "idCard";',
+            {"ids": list(ids)}
+        )
+        deleted = [row["idCard"] for row in cursor.fetchall()]
+        if notify:
+            notify_cards_changed(cursor, deleted)
+        return deleted
 
     def find_by_embedding(self, embed: list) -> list[float]:
+        """
+        Returns the card whose detailed embedding is exactly [embed], None if there is none.
+        The B-tree index on "embedHash" (a 64-bit hash of "embed" computed by the database)
+        narrows the search down to a few rows, the vectors are then compared for real.
+        """
         with DBConnection().connection as connection:
             with connection.cursor() as cursor:
-                cursor.execute('SET search_path TO defaultdb, public;')
                 cursor.execute(
                     '''
                     SELECT "idCard"
                     FROM "Card"
-                    WHERE "embed" = %(embed)s
+                    WHERE "embedHash" = hashtextextended(%(embed)s::text, 0)
+                      AND "embed" = %(embed)s
                     ''',
-                    {"embed": embed}
+                    # Sent in the binary format of pgvector instead of 1024 decimal numbers
+                    {"embed": np.asarray(embed, dtype=np.float32)},
+                    binary=True
                 )
                 res = cursor.fetchone()
         if res:
@@ -693,177 +1308,267 @@ class CardDao:
         else:
             return None
 
-    def id_search(self, id_card: int) -> Card:
+    def id_search(self, id_card: int, fields: list[str] = None) -> Card:
         """
-        Returns all the information about the Card that has id_card as an id
+        Returns all the information about the Card that has id_card as an id, from the
+        CardCache if it is there. Cards that do not exist are not cached.
+
+        Parameters
+        ----------
+        id_card : int
+            The id of the card
+        fields : list[str]
+            The fields of Card.show_card needed, None for all of them. The other linked rows
+            are not read, and the partial cards are not cached.
         """
-        with DBConnection().connection as connection:
-            with connection.cursor() as cursor:
-                cursor.execute('SET search_path TO defaultdb, public;')
-                cursor.execute(
-                    'SELECT "idCard", "asciiName", "convertedManaCost", "defense", "edhrecRank", '
-                    '"edhrecSaltiness", "embed", "faceManaValue", "faceName", "hand", '
-                    '"hasAlternativeDeckLimit", "isFunny", "isReserved", "life", "loyalty", '
-                    '"manaCost", "manaValue", c."name", "power", "shortEmbed", "side", "text", '
-                    '"toughness", l."name" layout, t."name" type'
-                    '  FROM "Card" c       '
-                    '  JOIN "Layout" l ON l."idLayout" = c."layout"'
-                    '  JOIN "Type" t ON t."idType" = c."type"'
-                    '  WHERE "idCard" = %(idCard)s',
-                    {"idCard": id_card}
-                )
-                res_card = cursor.fetchone()
-                if res_card is None:
-                    return None
-                cursor.execute(
-                    '''
-                    SELECT "colorName"
-                    FROM "Color" c
-                    JOIN "ColorIdentity" ci ON ci."idColor" = c."idColor"
-                    WHERE "idCard" = %(idCard)s
-                    ''',
-                    {"idCard": id_card}
-                )
-                res_color_identity = cursor.fetchall()
-                cursor.execute(
-                    '''
-                    SELECT "colorName"
-                    FROM "Color" c
-                    JOIN "ColorIndicator" ci ON ci."idColor" = c."idColor"
-                    WHERE "idCard" = %(idCard)s
-                    ''',
-                    {"idCard": id_card}
-                )
-                res_color_indicator = cursor.fetchall()
-                cursor.execute(
-                    '''
-                    SELECT "colorName"
-                    FROM "Color" c
-                    JOIN "Colors" cs ON cs."idColor" = c."idColor"
-                    WHERE "idCard" = %(idCard)s
-                    ''',
-                    {"idCard": id_card}
-                )
-                res_colors = cursor.fetchall()
-                cursor.execute(
-                    '''
-                    SELECT s."name"
-                    FROM "Set" s
-                    JOIN "Card" c ON c."firstPrinting" = s."idSet"
-                    WHERE "idCard" = %(idCard)s
-                    ''',
-                    {"idCard": id_card}
-                )
-                res_first_printing = cursor.fetchone()
-                cursor.execute(
-                    '''
-                    SELECT "language", "name", "faceName", "flavorText", "text", "type"
-                    FROM "ForeignData"
-                    WHERE "idCard" = %(idCard)s
-                    ''',
-                    {"idCard": id_card}
-                )
-                res_foreign_data = cursor.fetchall()
-                cursor.execute(
-                    '''
-                    SELECT "name"
-                    FROM "Keyword" k
-                    JOIN "Keywords" ks ON ks."idKeyword" = k."idKeyword"
-                    WHERE "idCard" = %(idCard)s
-                    ''',
-                    {"idCard": id_card}
-                )
-                res_keyword = cursor.fetchall()
-                cursor.execute(
-                    '''
-                    SELECT "brawl", "commander", "oathbreaker"
-                    FROM "LeadershipSkills" ls
-                    JOIN "Card" c ON c."leadershipSkills" = ls."idLeadership"
-                    WHERE "idCard" = %(idCard)s
-                    ''',
-                    {"idCard": id_card}
-                )
-                res_leadership_skills = cursor.fetchone()
-                cursor.execute(
-                    '''
-                    SELECT *
-                    FROM "LegalityType"
-                    ORDER BY "idLegalityType" ASC
-                    '''
-                )
-                res_legality_type = cursor.fetchall()
-                cursor.execute(
-                    '''
-                    SELECT "commander", "oathbreaker", "duel", "legacy", "vintage", "modern",
-                    "penny", "timeless", "brawl", "historic", "gladiator", "pioneer", "predh",
-                    "paupercommander", "pauper", "premodern", "future", "standardbrawl", "standard",
-                    "alchemy", "oldschool"
-                    FROM "Legality" l
-                    JOIN "Card" c ON c."legalities" = l."idLegality"
-                    WHERE "idCard" = %(idCard)s
-                    ''',
-                    {"idCard": id_card}
-                )
-                res_legalities = cursor.fetchone()
-                cursor.execute(
-                    '''
-                    SELECT s."name"
-                    FROM "Set" s
-                    JOIN "Printings" p ON p."idSet" = s."idSet"
-                    WHERE "idCard" = %(idCard)s
-                    ''',
-                    {"idCard": id_card}
-                )
-                res_printings = cursor.fetchall()
-                cursor.execute(
-                    '''
-                    SELECT "tcgplayer", "cardKingdom", "cardmarket", "cardKingdomFoil",
-                    "cardKingdomEtched", "tcgplayerEtched"
-                    FROM "PurchaseURLs"
-                    WHERE "idCard" = %(idCard)s
-                    ''',
-                    {"idCard": id_card}
-                )
-                res_purchase_urls = cursor.fetchone()
-                cursor.execute(
-                    '''
-                    SELECT "date", "text"
-                    FROM "Ruling"
-                    WHERE "idCard" = %(idCard)s
-                    ''',
-                    {"idCard": id_card}
-                )
-                res_rulings = cursor.fetchall()
-                cursor.execute(
-                    '''
-                    SELECT "name"
-                    FROM "Subtype" s
-                    JOIN "Subtypes" ss ON ss."idSubtype" = s."idSubtype"
-                    WHERE "idCard" = %(idCard)s
-                    ''',
-                    {"idCard": id_card}
-                )
-                res_subtypes = cursor.fetchall()
-                cursor.execute(
-                    '''
-                    SELECT "name"
-                    FROM "Supertype" s
-                    JOIN "Supertypes" ss ON ss."idSupertype" = s."idSupertype"
-                    WHERE "idCard" = %(idCard)s
-                    ''',
-                    {"idCard": id_card}
-                )
-                res_supertypes = cursor.fetchall()
-                cursor.execute(
-                    '''
-                    SELECT "name"
-                    FROM "Type" s
-                    JOIN "Types" ss ON ss."idType" = s."idType"
-                    WHERE "idCard" = %(idCard)s
-                    ''',
-                    {"idCard": id_card}
-                )
-                res_types = cursor.fetchall()
+        cache = CardCache()
+        card = cache.get(id_card)
+        if card is None:
+            generation = cache.generation
+            card = self.read_card(id_card, fields)
+            if card is not None and fields is None:
+                cache.put(id_card, card, generation)
+        return card
+
+    def read_card(self, id_card: int, fields: list[str] = None, cursor=None) -> Card:
+        """
+        Reads the Card that has id_card as an id from the database. Its queries are the
+        hottest of the API: they are prepared on the server once per connection. With
+        [fields], only the linked rows needed by these fields of Card.show_card are read.
+        With [cursor], the card is read in the transaction of the caller.
+        The lists are sorted like in the SQL function card_document (names in alphabetical
+        order, rulings by date, translations by id): the card is the same as its document.
+        """
+        if cursor is None:
+            with DBConnection().connection as connection:
+                with connection.cursor() as cursor:
+                    return self.read_card(id_card, fields, cursor)
+
+        def wanted(field):
+            return fields is None or field in fields
+
+        cursor.execute(
+            'SELECT "idCard", "asciiName", "convertedManaCost", "defense", "edhrecRank", '
+            '"edhrecSaltiness", "embed", "faceManaValue", "faceName", "hand", '
+            '"hasAlternativeDeckLimit", "isFunny", "isReserved", "life", "loyalty", '
+            '"manaCost", "manaValue", c."name", "power", "shortEmbed", "side", "text", '
+            '"toughness", l."name" layout, t."name" type'
+            '  FROM "Card" c       '
+            '  JOIN "Layout" l ON l."idLayout" = c."layout"'
+            '  JOIN "Type" t ON t."idType" = c."type"'
+            '  WHERE "idCard" = %(idCard)s',
+            {"idCard": id_card},
+            prepare=True,
+            # The embeddings come back in the binary format of pgvector
+            binary=True
+        )
+        res_card = cursor.fetchone()
+        if res_card is None:
+            return None
+        res_color_identity = []
+        if wanted("color_identity"):
+            cursor.execute(
+                '''
+                SELECT "colorName"
+                FROM "Color" c
+                JOIN "ColorIdentity" ci ON ci."idColor" = c."idColor"
+                WHERE "idCard" = %(idCard)s
+                ORDER BY "colorName"
+                ''',
+                {"idCard": id_card},
+                prepare=True
+            )
+            res_color_identity = cursor.fetchall()
+        res_color_indicator = []
+        if wanted("color_indicator"):
+            cursor.execute(
+                '''
+                SELECT "colorName"
+                FROM "Color" c
+                JOIN "ColorIndicator" ci ON ci."idColor" = c."idColor"
+                WHERE "idCard" = %(idCard)s
+                ORDER BY "colorName"
+                ''',
+                {"idCard": id_card},
+                prepare=True
+            )
+            res_color_indicator = cursor.fetchall()
+        res_colors = []
+        if wanted("colors"):
+            cursor.execute(
+                '''
+                SELECT "colorName"
+                FROM "Color" c
+                JOIN "Colors" cs ON cs."idColor" = c."idColor"
+                WHERE "idCard" = %(idCard)s
+                ORDER BY "colorName"
+                ''',
+                {"idCard": id_card},
+                prepare=True
+            )
+            res_colors = cursor.fetchall()
+        res_first_printing = None
+        if wanted("first_printing"):
+            cursor.execute(
+                '''
+                SELECT s."name"
+                FROM "Set" s
+                JOIN "Card" c ON c."firstPrinting" = s."idSet"
+                WHERE "idCard" = %(idCard)s
+                ''',
+                {"idCard": id_card},
+                prepare=True
+            )
+            res_first_printing = cursor.fetchone()
+        res_foreign_data = []
+        if wanted("foreignData"):
+            cursor.execute(
+                '''
+                SELECT "language", "name", "faceName", "flavorText", "text", "type"
+                FROM "ForeignData"
+                WHERE "idCard" = %(idCard)s
+                ORDER BY "idForeign"
+                ''',
+                {"idCard": id_card},
+                prepare=True
+            )
+            res_foreign_data = cursor.fetchall()
+        res_keyword = []
+        if wanted("keywords"):
+            cursor.execute(
+                '''
+                SELECT "name"
+                FROM "Keyword" k
+                JOIN "Keywords" ks ON ks."idKeyword" = k."idKeyword"
+                WHERE "idCard" = %(idCard)s
+                ORDER BY k."name"
+                ''',
+                {"idCard": id_card},
+                prepare=True
+            )
+            res_keyword = cursor.fetchall()
+        res_leadership_skills = None
+        if wanted("leadership_skills"):
+            cursor.execute(
+                '''
+                SELECT "brawl", "commander", "oathbreaker"
+                FROM "LeadershipSkills" ls
+                JOIN "Card" c ON c."leadershipSkills" = ls."idLeadership"
+                WHERE "idCard" = %(idCard)s
+                ''',
+                {"idCard": id_card},
+                prepare=True
+            )
+            res_leadership_skills = cursor.fetchone()
+        res_legality_type = []
+        if wanted("legalities"):
+            cursor.execute(
+                '''
+                SELECT *
+                FROM "LegalityType"
+                ORDER BY "idLegalityType" ASC
+                ''',
+                prepare=True
+            )
+            res_legality_type = cursor.fetchall()
+        res_legalities = None
+        if wanted("legalities"):
+            cursor.execute(
+                '''
+                SELECT "commander", "oathbreaker", "duel", "legacy", "vintage", "modern",
+                "penny", "timeless", "brawl", "historic", "gladiator", "pioneer", "predh",
+                "paupercommander", "pauper", "premodern", "future", "standardbrawl",
+                "standard", "alchemy", "oldschool"
+                FROM "Legality" l
+                JOIN "Card" c ON c."legalities" = l."idLegality"
+                WHERE "idCard" = %(idCard)s
+                ''',
+                {"idCard": id_card},
+                prepare=True
+            )
+            res_legalities = cursor.fetchone()
+        res_printings = []
+        if wanted("printings"):
+            cursor.execute(
+                '''
+                SELECT s."name"
+                FROM "Set" s
+                JOIN "Printings" p ON p."idSet" = s."idSet"
+                WHERE "idCard" = %(idCard)s
+                ORDER BY s."name"
+                ''',
+                {"idCard": id_card},
+                prepare=True
+            )
+            res_printings = cursor.fetchall()
+        res_purchase_urls = None
+        if wanted("purchase_urls"):
+            cursor.execute(
+                '''
+                SELECT "tcgplayer", "cardKingdom", "cardmarket", "cardKingdomFoil",
+                "cardKingdomEtched", "tcgplayerEtched"
+                FROM "PurchaseURLs"
+                WHERE "idCard" = %(idCard)s
+                ''',
+                {"idCard": id_card},
+                prepare=True
+            )
+            res_purchase_urls = cursor.fetchone()
+        res_rulings = []
+        if wanted("rulings"):
+            cursor.execute(
+                '''
+                SELECT "date", "text"
+                FROM "Ruling"
+                WHERE "idCard" = %(idCard)s
+                ORDER BY "date", "idRuling"
+                ''',
+                {"idCard": id_card},
+                prepare=True
+            )
+            res_rulings = cursor.fetchall()
+        res_subtypes = []
+        if wanted("subtypes"):
+            cursor.execute(
+                '''
+                SELECT "name"
+                FROM "Subtype" s
+                JOIN "Subtypes" ss ON ss."idSubtype" = s."idSubtype"
+                WHERE "idCard" = %(idCard)s
+                ORDER BY s."name"
+                ''',
+                {"idCard": id_card},
+                prepare=True
+            )
+            res_subtypes = cursor.fetchall()
+        res_supertypes = []
+        if wanted("supertypes"):
+            cursor.execute(
+                '''
+                SELECT "name"
+                FROM "Supertype" s
+                JOIN "Supertypes" ss ON ss."idSupertype" = s."idSupertype"
+                WHERE "idCard" = %(idCard)s
+                ORDER BY s."name"
+                ''',
+                {"idCard": id_card},
+                prepare=True
+            )
+            res_supertypes = cursor.fetchall()
+        res_types = []
+        if wanted("types"):
+            cursor.execute(
+                '''
+                SELECT "name"
+                FROM "Type" s
+                JOIN "Types" ss ON ss."idType" = s."idType"
+                WHERE "idCard" = %(idCard)s
+                ORDER BY s."name"
+                ''',
+                {"idCard": id_card},
+                prepare=True
+            )
+            res_types = cursor.fetchall()
 
         color_identity = CardDao().get_list_from_fetchall(res_color_identity, 'colorName')
         color_indicator = CardDao().get_list_from_fetchall(res_color_indicator, 'colorName')
@@ -936,9 +1641,10 @@ class CardDao:
             returned_list.append(value[column_name])
         return returned_list
 
-    def name_search(self, name: str) -> list:
+    def name_search(self, name: str, fields: list[str] = None) -> list:
         """
-        Returns all the information about the Cards that has name as their name
+        Returns all the information about the Cards that has name as their name (only what
+        [fields] of Card.show_card need, if given)
 
         Returns:
         --------
@@ -947,7 +1653,6 @@ class CardDao:
         """
         with DBConnection().connection as connection:
             with connection.cursor() as cursor:
-                cursor.execute('SET search_path TO defaultdb, public;')
                 cursor.execute(
                     '''
                     SELECT "idCard"
@@ -960,9 +1665,92 @@ class CardDao:
 
         cards = []
         for card in res:
-            cards.append(CardDao().id_search(card["idCard"]))
+            cards.append(CardDao().id_search(card["idCard"], fields))
         return cards
 
+    def filter_query(self, filter: Filter) -> tuple:
+        """
+        The query selecting the "idCard" of the cards matching the filter, and its parameters
+        (see filter_dao)
+        """
+        variable_filtered = filter.variable_filtered
+        type_of_filtering = filter.type_of_filtering
+        filtering_value = filter.filtering_value
+
+        sql_query = None
+        sql_parameter = []
+
+        if type_of_filtering in ["positive", "negative"]:  # categorical filter
+
+            if type_of_filtering == "positive":
+                sql_comparator = 'ILIKE'
+            else:
+                sql_comparator = 'NOT ILIKE'
+
+            if variable_filtered == 'color':
+                sql_query = sql.SQL(
+                    'SELECT "idCard" '
+                    'FROM "Card" c '
+                    'JOIN "Colors" a USING("idCard")'
+                    'JOIN "Color" b USING ("idColor")'
+                    'WHERE b."colorName" {} %s'
+                    ).format(
+                    sql.SQL(sql_comparator)
+                )
+                sql_parameter = [f"%{filtering_value}%"]
+
+            else:  # variable_filtered is type
+                sql_query = sql.SQL(
+                    'SELECT "idCard"'
+                    'FROM "Card" c '
+                    'JOIN "Type" t ON c."type" = t."idType"'
+                    'WHERE t."name" {} %s'
+                    ).format(
+                    sql.SQL(sql_comparator)
+                )
+                sql_parameter = [f"%{filtering_value}%"]
+
+        else:  # numerical filter
+            if type_of_filtering == "higher_than":
+                sql_comparator = ">"
+            elif type_of_filtering == "equal_to":
+                sql_comparator = "="
+            else:
+                sql_comparator = "<"
+
+            if variable_filtered == "power":
+                sql_query = sql.SQL(
+                    'SELECT "idCard" '
+                    'FROM "Card" c '
+                    'WHERE (CASE WHEN c."power" ~  %s THEN c."power"::int ELSE NULL END) {} %s'
+                ).format(
+                    sql.SQL(sql_comparator)
+                )
+                sql_parameter = [r'^\d+$', filtering_value]
+
+            elif variable_filtered == "toughness":
+                sql_query = sql.SQL(
+                    'SELECT "idCard" '
+                    'FROM "Card" c '
+                    'WHERE (CASE WHEN c."toughness" ~  %s '
+                    'THEN c."toughness"::int ELSE NULL END) {} %s'
+                ).format(
+                    sql.SQL(sql_comparator)
+                )
+                sql_parameter = [r'^\d+$', filtering_value]
+
+            else:
+                sql_query = sql.SQL(
+                    'SELECT "idCard" '
+                    'FROM "Card" WHERE {} {} %s'
+                    ).format(
+                    sql.Identifier(variable_filtered),
+                    sql.SQL(sql_comparator)
+                )
+                sql_parameter = [filtering_value]
+
+        return sql_query, sql_parameter
+
     def filter_dao(self, filter: Filter) -> list[int]:
         """"
         This method selects in the database the elements
@@ -985,81 +1773,7 @@ class CardDao:
             list th ids of all the cards corresponding to the filter
         """
         try:
-            variable_filtered = filter.variable_filtered
-            type_of_filtering = filter.type_of_filtering
-            filtering_value = filter.filtering_value
-
-            sql_query = None
-            sql_parameter = []
-
-            if type_of_filtering in ["positive", "negative"]:  # categorical filter
-
-                if type_of_filtering == "positive":
-                    sql_comparator = 'ILIKE'
-                else:
-                    sql_comparator = 'NOT ILIKE'
-
-                if variable_filtered == 'color':
-                    sql_query = sql.SQL(
-                        'SELECT "idCard" '
-                        'FROM "Card" c '
-                        'JOIN "Colors" a USING("idCard")'
-                        'JOIN "Color" b USING ("idColor")'
-                        'WHERE b."colorName" {} %s'
-                        ).format(
-                        sql.SQL(sql_comparator)
-                    )
-                    sql_parameter = [f"%{filtering_value}%"]
-
-                else:  # variable_filtered is type
-                    sql_query = sql.SQL(
-                        'SELECT "idCard"'
-                        'FROM "Card" c '
-                        'JOIN "Type" t ON c."type" = t."idType"'
-                        'WHERE t."name" {} %s'
-                        ).format(
-                        sql.SQL(sql_comparator)
-                    )
-                    sql_parameter = [f"%{filtering_value}%"]
-
-            else:  # numerical filter
-                if type_of_filtering == "higher_than":
-                    sql_comparator = ">"
-                elif type_of_filtering == "equal_to":
-                    sql_comparator = "="
-                else:
-                    sql_comparator = "<"
-
-                if variable_filtered == "power":
-                    sql_query = sql.SQL(
-                        'SELECT "idCard" '
-                        'FROM "Card" c '
-                        'WHERE (CASE WHEN c."power" ~  %s THEN c."power"::int ELSE NULL END) {} %s'
-                    ).format(
-                        sql.SQL(sql_comparator)
-                    )
-                    sql_parameter = [r'^\d+$', filtering_value]
-
-                elif variable_filtered == "toughness":
-                    sql_query = sql.SQL(
-                        'SELECT "idCard" '
-                        'FROM "Card" c '
-                        'WHERE (CASE WHEN c."toughness" ~  %s '
-                        'THEN c."toughness"::int ELSE NULL END) {} %s'
-                    ).format(
-                        sql.SQL(sql_comparator)
-                    )
-                    sql_parameter = [r'^\d+$', filtering_value]
-
-                else:
-                    sql_query = sql.SQL(
-                        'SELECT "idCard" '
-                        'FROM "Card" WHERE {} {} %s'
-                        ).format(
-                        sql.Identifier(variable_filtered),
-                        sql.SQL(sql_comparator)
-                    )
-                    sql_parameter = [filtering_value]
+            sql_query, sql_parameter = self.filter_query(filter)
 
             with DBConnection().connection as connection:
                 with connection.cursor() as cursor:
@@ -1073,8 +1787,6 @@ class CardDao:
                             f"Executing SQL (mocked connection): {sql_query} "
                             f"with params {sql_parameter}"
                         )
-                    print(cursor.mogrify(sql_query, sql_parameter))
-                    cursor.execute('SET search_path TO defaultdb, public;')
                     cursor.execute(sql_query, sql_parameter)
                     res = cursor.fetchall()
             card_ids = [card["idCard"] for card in res]
@@ -1083,13 +1795,93 @@ class CardDao:
             logging.error(f"Error in filter_dao : {e}")
             return False
 
+    def export_documents(
+        self, filters: list[Filter], fields: list[str] = None, batch_size: int = EXPORT_BATCH
+    ):
+        """
+        The documents (see "CardDocument") of all the cards matching every filter, in the
+        order of their ids, as NDJSON: one chunk of lines per batch of [batch_size] cards.
+        The filters are compiled into a single query (the INTERSECT of the queries of
+        filter_query) read through a server-side cursor, on a connection of the pool which is
+        given back once the chunks end: only one batch is in memory at a time.
+
+        The query is executed before returning, so that an error is known before the response
+        starts. If reading the rows fails afterwards, the last line is EXPORT_ERROR.
+
+        Parameters
+        ----------
+        filters : list[Filter]
+            The filters, already checked (see CardService.check_filter)
+        fields : list[str]
+            The keys of the documents to send (and "id_card"), None for all of them
+        batch_size : int
+            Number of documents fetched per round trip
+
+        Returns
+        -------
+        Iterator[bytes] | None
+            The chunks, read from the database as they are consumed, None if the query failed
+        """
+        queries = [self.filter_query(filter) for filter in filters]
+        parameters = [
+            parameter for _, query_parameters in queries for parameter in query_parameters
+        ]
+        document = sql.SQL('d."document"')
+        if fields is not None:
+            document = sql.SQL(
+                "(SELECT jsonb_object_agg(key, value) FROM jsonb_each(d.\"document\") "
+                "WHERE key = 'id_card' OR key = ANY(%s::text[]))"
+            )
+            parameters = [list(fields)] + parameters
+        query = sql.SQL(
+            'SELECT {document}::text AS "document" FROM "CardDocument" d '
+            'WHERE d."idCard" IN ({filters}) ORDER BY d."idCard"'
+        ).format(
+            document=document,
+            filters=sql.SQL(" INTERSECT ").join(
+                sql.SQL("({})").format(filter_query) for filter_query, _ in queries
+            )
+        )
+
+        # Taken from the pool for the whole export: it counts against DB_POOL_SIZE
+        pool = DBConnection().pool
+        connection = pool.getconn()
+        try:
+            # Named cursor: the rows stay on the server until they are fetched
+            cursor = connection.cursor(name="card_export")
+            cursor.execute(query, parameters)
+        except Exception as e:
+            logging.error(f"Error in export_documents : {e}")
+            pool.putconn(connection)
+            return None
+        return self.stream_documents(pool, connection, cursor, batch_size)
+
+    def stream_documents(self, pool, connection, cursor, batch_size: int):
+        """
+        Yields the rows of the cursor opened by export_documents as chunks of NDJSON, then
+        gives its connection back to the pool, which rolls back an unfinished export
+        """
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield "".join(row["document"] + "\n" for row in rows).encode("utf-8")
+            cursor.close()
+            connection.commit()
+        except Exception as e:
+            # The response has already started: its last line tells the client it is cut
+            logging.error(f"Error in export_documents : {e}")
+            yield EXPORT_ERROR
+        finally:
+            pool.putconn(connection)
+
     def get_highest_id(self) -> int:
         """
         Returns the highest id currently in the database
         """
         with DBConnection().connection as connection:
             with connection.cursor() as cursor:
-                cursor.execute('SET search_path TO defaultdb, public;')
                 cursor.execute(
                     'SELECT MAX("idCard") '
                     '  FROM "Card"       '
@@ -1098,18 +1890,16 @@ class CardDao:
 
         return res['max']
 
-    def get_similar_entries(self, conn, search_emb, use_short_embed=False):
+    def get_similar_entries(self, search_emb, use_short_embed=False):
         """
         Returns the 5 entries from the database with the embedding closest to the given
-        [search_emb].
+        [search_emb], as (idCard, distance) tuples. Cards whose embeddings are still pending
+        are left out.
 
         Args:
-            conn: Database connection
             search_emb: The embedding vector to search for
             use_short_embed: If True, uses 'shortEmbed' column, otherwise uses 'embed' column
         """
-        conn.execute('SET search_path TO defaultdb, public;')
-
         embed_column = '"shortEmbed"' if use_short_embed else '"embed"'
 
         query = f"""
@@ -1117,12 +1907,16 @@ class CardDao:
                 "idCard",
                 {embed_column} <-> %s as dst
             FROM "Card"
+            WHERE {embed_column} IS NOT NULL
             ORDER BY dst
             LIMIT 5
         """
 
-        results = conn.execute(query, (search_emb,))
-        return results.fetchall()
+        with DBConnection().connection as connection:
+            with connection.cursor(row_factory=tuple_row) as cursor:
+                # The vector is sent in the binary format of pgvector
+                cursor.execute(query, (search_emb,), prepare=True, binary=True)
+                return cursor.fetchall()
 
     def add_favourite_card(self, user_id: int, idCard: int) -> str:
         """
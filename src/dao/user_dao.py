@@ -6,7 +6,6 @@ from db_connection import DBConnection
 import logging
 from business_object.user import User
 from psycopg import sql
-from psycopg2.extras import DictCursor
 from dao.card_dao import CardDao
 
 
@@ -21,7 +20,7 @@ class UserDao:
         rows = []
         try:
             with self.db.connection as conn:
-                with conn.cursor(cursor_factory=DictCursor) as cursor:
+                with conn.cursor() as cursor:
                     cursor.execute(query)
                     rows = cursor.fetchall()
         except Exception as e:
@@ -32,11 +31,12 @@ class UserDao:
         """Return user corresponding to the username"""
         try:
             with self.db.connection as connection:
-                with connection.cursor(cursor_factory=DictCursor) as cursor:
+                with connection.cursor() as cursor:
                     cursor.execute(
                         'SELECT "idUser", "username", "password", "isAdmin" '
                         'FROM defaultdb."User" WHERE "username" = %s;',
                         (username,),
+                        prepare=True
                     )
                     res = cursor.fetchone()
             if not res:
@@ -163,7 +163,7 @@ class UserDao:
         res = None
         try:
             with DBConnection().connection as connection:
-                with connection.cursor(cursor_factory=DictCursor) as cursor:
+                with connection.cursor() as cursor:
                     query = """
                         SELECT "idUser", "username", "password", "isAdmin"
                         FROM defaultdb."User"
@@ -195,7 +195,7 @@ class UserDao:
         """
         try:
             with DBConnection().connection as connection:
-                with connection.cursor(cursor_factory=DictCursor) as cursor:
+                with connection.cursor() as cursor:
                     query = """
                         SELECT "idUser", "username", "password", "isAdmin"
                         FROM defaultdb."User"
@@ -228,7 +228,7 @@ class UserDao:
 
         try:
             with DBConnection().connection as connection:
-                with connection.cursor(cursor_factory=DictCursor) as cursor:
+                with connection.cursor() as cursor:
 
                     # Vérifier si l'utilisateur existe
                     check_query = """
@@ -1,34 +1,116 @@
 import os
 import dotenv
-import psycopg2
+import psycopg
 
-from psycopg2.extras import RealDictCursor
+from pgvector.psycopg import register_vector
+from psycopg.rows import dict_row
+from psycopg_pool import ConnectionPool
 from utils.singleton import Singleton
 
 
+class Connection(psycopg.Connection):
+    """
+    Connexion psycopg 3 qui garde le comportement des connexions psycopg2 dans un bloc with :
+    à la sortie, la transaction est validée (ou annulée en cas d'erreur) mais la connexion
+    reste ouverte, pour pouvoir être réutilisée
+    """
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.closed:
+            return
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+
+
+# Nombre de threads de l'API qui exécutent les requêtes, et de connexions de son pool
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+
+
 class DBConnection(metaclass=Singleton):
     """
     Classe de connexion à la base de données
-    Elle permet de n'ouvrir qu'une seule et unique connexion
+    Les requêtes prennent une connexion du pool (au plus POOL_SIZE connexions, exports
+    compris) le temps de leur transaction, puis la rendent : deux requêtes de l'API exécutées
+    en même temps ne partagent jamais une transaction, et les connexions restent ouvertes
+    avec leurs requêtes préparées.
     """
 
     def __init__(self):
-        """Ouverture de la connexion"""
+        """Ouverture du pool de connexions"""
         dotenv.load_dotenv()
 
-        self.__connection = psycopg2.connect(
-            host=os.environ["POSTGRES_HOST"],
-            port=os.environ["POSTGRES_PORT"],
-            database=os.environ["POSTGRES_DATABASE"],
-            user=os.environ["POSTGRES_USER"],
-            password=os.environ["POSTGRES_PASSWORD"],
-            options=f"-c search_path={os.environ['POSTGRES_SCHEMA']}",
-            cursor_factory=RealDictCursor,
+        self.pool = self.new_pool()
+
+    def connection_kwargs(self) -> dict:
+        """
+        Paramètres des connexions : les lignes sont renvoyées sous forme de dict, et une
+        requête exécutée plus de DB_PREPARE_THRESHOLD fois (ou avec prepare=True) est préparée
+        côté serveur. Le search_path (POSTGRES_SCHEMA puis public, pour le type vector) est
+        fixé une fois à l'ouverture : les requêtes n'ont pas à le redéfinir. Les scripts qui
+        travaillent sur un autre schéma utilisent SET LOCAL, qui ne dure que le temps de leur
+        transaction.
+        """
+        return {
+            "host": os.environ["POSTGRES_HOST"],
+            "port": os.environ["POSTGRES_PORT"],
+            "dbname": os.environ["POSTGRES_DATABASE"],
+            "user": os.environ["POSTGRES_USER"],
+            "password": os.environ["POSTGRES_PASSWORD"],
+            "options": f"-c search_path={os.environ['POSTGRES_SCHEMA']},public",
+            "row_factory": dict_row,
+            "prepare_threshold": int(os.getenv("DB_PREPARE_THRESHOLD", "5")),
+        }
+
+    def configure(self, connection):
+        """
+        Prépare une connexion qui vient d'être ouverte : elle garde en cache ses
+        DB_PREPARED_MAX dernières requêtes préparées, et échange les vecteurs au format binaire
+        de pgvector
+        """
+        connection.prepared_max = int(os.getenv("DB_PREPARED_MAX", "100"))
+        try:
+            register_vector(connection)
+        except psycopg.ProgrammingError:
+            # L'extension n'existe pas encore (première initialisation de la base)
+            pass
+        # Termine la transaction ouverte par la recherche du type vector
+        connection.rollback()
+
+    def new_pool(self) -> ConnectionPool:
+        """
+        Ouvre le pool de l'API. Sa première connexion est attendue : une base injoignable est
+        signalée dès le démarrage.
+        """
+        pool = ConnectionPool(
+            connection_class=Connection,
+            kwargs=self.connection_kwargs(),
+            configure=self.configure,
+            min_size=1,
+            max_size=POOL_SIZE,
+            open=True,
         )
+        pool.wait()
+        return pool
+
+    def new_connection(self):
+        """
+        Ouvre une connexion hors du pool, pour les traitements qui la gardent tout le temps
+        de leur exécution (écoute des notifications, worker des embeddings, import de la
+        base). C'est à l'appelant de la fermer.
+        """
+        connection = Connection.connect(**self.connection_kwargs())
+        self.configure(connection)
+        return connection
 
     @property
     def connection(self):
-        return self.__connection
+        """
+        Une connexion du pool, à utiliser dans un bloc with : à la sortie, la transaction est
+        validée (ou annulée en cas d'erreur) et la connexion est rendue au pool
+        """
+        return self.pool.connection()
 
 
 dotenv.load_dotenv()
@@ -2,30 +2,23 @@ from business_object.card import Card
 from dao.card_dao import CardDao
 from business_object.filter import Filter
 
-from dotenv import load_dotenv
 import random
-import psycopg
 import logging
-from pgvector.psycopg import register_vector
-import os
 import numpy as np
 from utils.embed import embedding
+from utils.fast_json import dumps
+from utils.single_flight import SingleFlight
 from typing import List
 
 
-# Set the following env. variables for this to work: PGUSER, PGPASSWORD, PGHOST, PGPORT, PGDATABASE
-# conn = psycopg.connect(dbname="defaultdb", autocommit=True)
-load_dotenv()
+# Concurrent identical reads (a card everyone looks at, the same semantic search) share a
+# single call to the embedding API and to the database
+in_flight = SingleFlight()
 
-conn = psycopg.connect(
-    host=os.getenv("POSTGRES_HOST"),
-    port=os.getenv("POSTGRES_PORT"),
-    dbname=os.getenv("POSTGRES_DATABASE"),
-    user=os.getenv("POSTGRES_USER"),
-    password=os.getenv("POSTGRES_PASSWORD"),
-    autocommit=True
-)
-register_vector(conn)
+
+def flight_key(*args, fields: list[str] = None) -> tuple:
+    """Key of a read in in_flight"""
+    return (*args, tuple(fields) if fields is not None else None)
 
 
 class CardService():
@@ -76,7 +69,48 @@ class CardService():
             print(f"Failed to delete card from DB: {e}")
             return None
 
-    def id_search(self, id: int) -> Card:
+    def create_cards(self, cards: list[Card]) -> list[dict] | None:
+        """
+        Creates several cards in the database, see CardDao.create_cards.
+        Returns one result per card, None if input is invalid or DB fails.
+        """
+        if not all(isinstance(card, Card) for card in cards):
+            print("Invalid input: must be a list of Card instances.")
+            return None
+
+        try:
+            return CardDao().create_cards(cards)
+        except Exception as e:
+            print(f"Failed to create cards in DB: {e}")
+            return None
+
+    def update_cards(self, cards: list[Card]) -> list[dict] | None:
+        """
+        Updates several cards in the database, see CardDao.update_cards.
+        Returns one result per card, None if input is invalid or DB fails.
+        """
+        if not all(isinstance(card, Card) for card in cards):
+            print("Invalid input: must be a list of Card instances.")
+            return None
+
+        try:
+            return CardDao().update_cards(cards)
+        except Exception as e:
+            print(f"Failed to update cards in DB: {e}")
+            return None
+
+    def delete_cards(self, ids: list[int]) -> list[dict] | None:
+        """
+        Deletes several cards from the database, see CardDao.delete_cards.
+        Returns one result per id, None if input is invalid.
+        """
+        if not all(isinstance(id_card, int) for id_card in ids):
+            print("Invalid input: ids must be the ids of the cards you want to delete.")
+            return None
+
+        return CardDao().delete_cards(ids)
+
+    def id_search(self, id: int, fields: list[str] = None) -> Card:
         """
         Searches for a card based on its id
 
@@ -84,6 +118,8 @@ class CardService():
         ===========
         id: int
             The id of the searched card
+        fields: list[str]
+            The fields of Card.show_card needed, None for all of them (see CardDao.id_search)
 
         Returns:
         ========
@@ -109,13 +145,77 @@ class CardService():
             return None
 
         try:
-            card = CardDao().id_search(id)
+            card = CardDao().id_search(id, fields)
             return card
         except Exception as e:
             print(f"Failed to fetch card from DB: {e}")
             return None
 
-    def name_search(self, name: str) -> list[Card]:
+    def card_document(self, id: int) -> dict:
+        """
+        Returns the card with the given id as sent by the API (like Card.show_card), with a
+        single query on the documents precomputed in the database
+
+        Parameters:
+        ===========
+        id: int
+            The id of the searched card
+
+        Returns:
+        ========
+        dict
+            The card, None if the id is not valid
+        """
+        if not isinstance(id, int):
+            print("Invalid id type: must be an integer.")
+            return None
+
+        try:
+            document = CardDao().get_document(id)
+        except Exception as e:
+            print(f"Failed to fetch card document from DB: {e}")
+            return None
+
+        if document is None:
+            # Not built yet (database created before the documents): built from the tables
+            card = self.id_search(id)
+            return card.show_card() if card is not None else None
+        return document
+
+    def card_document_json(self, id: int, fields: list[str] = None) -> bytes:
+        """
+        Same as card_document, but returns the card already encoded as JSON: the stored
+        document is sent as the database gives it, without being decoded. With [fields], the
+        database only sends these keys of the document (and "id_card").
+
+        Returns:
+        ========
+        bytes
+            The card as JSON, None if the id is not valid
+        """
+        if not isinstance(id, int):
+            print("Invalid id type: must be an integer.")
+            return None
+
+        return in_flight.do(
+            flight_key("card_document_json", id, fields=fields), self.read_document_json, id,
+            fields
+        )
+
+    def read_document_json(self, id: int, fields: list[str] = None) -> bytes:
+        """card_document_json, without the coalescing of concurrent calls"""
+        try:
+            document = CardDao().get_document_json(id, fields)
+        except Exception as e:
+            print(f"Failed to fetch card document from DB: {e}")
+            return None
+
+        if document is None:
+            card = self.id_search(id, fields)
+            return dumps(card.show_card(fields)) if card is not None else None
+        return document
+
+    def name_search(self, name: str, fields: list[str] = None) -> list[Card]:
         """
         Searches for a card based on its name
 
@@ -123,6 +223,8 @@ class CardService():
         ===========
         name: str
             The name of the searched card
+        fields: list[str]
+            The fields of Card.show_card needed, None for all of them
 
         Returns:
         ========
@@ -138,13 +240,13 @@ class CardService():
             return None
 
         try:
-            card = CardDao().name_search(name)
+            card = CardDao().name_search(name, fields)
             return card
         except Exception as e:
             print(f"Failed to fetch card from DB: {e}")
             return None
 
-    def semantic_search(self, search: str) -> list[Card]:
+    def semantic_search(self, search: str, fields: list[str] = None) -> list[Card]:
         """
         Given a search as a sentence (for example "Blue bird with 5 mana"), returns the 5 closest
         cards to the reasearch
@@ -153,21 +255,20 @@ class CardService():
         -----------
         search: str
             The research the user made as an str
+        fields: list[str]
+            The fields of Card.show_card needed, None for all of them
 
         Returns:
         --------
         list[Card]
             The 5 closest cards to match the description made by the user
         """
-        search_emb = np.array(embedding(search))
-
-        cards = []
-        for entry in CardDao().get_similar_entries(conn, search_emb, False):
-            cards.append(CardService().id_search(entry[0]))
-
-        return (cards)
+        return in_flight.do(
+            flight_key("semantic_search", search, False, fields=fields), self.similar_cards,
+            search, False, fields
+        )
 
-    def semantic_search_shortEmbed(self, search: str) -> list[Card]:
+    def semantic_search_shortEmbed(self, search: str, fields: list[str] = None) -> list[Card]:
         """
         Given a search as a sentence (for example "Blue bird with 5 mana"), returns the 5 closest
         cards to the reasearch
@@ -176,23 +277,37 @@ class CardService():
         -----------
         search: str
             The research the user made as an str
+        fields: list[str]
+            The fields of Card.show_card needed, None for all of them
 
         Returns:
         --------
         list[Card]
             The 5 closest cards to match the description made by the user
         """
+        return in_flight.do(
+            flight_key("semantic_search", search, True, fields=fields), self.similar_cards,
+            search, True, fields
+        )
+
+    def similar_cards(
+        self, search: str, use_short_embed: bool, fields: list[str] = None
+    ) -> list[Card]:
+        """
+        The semantic searches, without the coalescing of concurrent calls: embeds the search
+        then reads the 5 cards whose embedding (or short embedding) is the closest
+        """
         search_emb = np.array(embedding(search))
 
         cards = []
-        for entry in CardDao().get_similar_entries(conn, search_emb, True):
-            cards.append(CardService().id_search(entry[0]))
+        for entry in CardDao().get_similar_entries(search_emb, use_short_embed):
+            cards.append(CardService().id_search(entry[0], fields))
 
         return (cards)
 
-    def view_random_card(self) -> Card:
+    def view_random_card(self, fields: list[str] = None) -> Card:
         """
-        Allows to show a random card
+        Allows to show a random card, with only [fields] of Card.show_card if given
 
         Returns:
         --------
@@ -202,9 +317,46 @@ class CardService():
         idmax = CardDao().get_highest_id()
         idrand = random.randint(0, idmax)
 
-        return self.id_search(idrand)
+        return self.id_search(idrand, fields)
 
-    def filter_search(self, filters: list[Filter], page: int = 1) -> dict:
+    def check_filter(self, filter: Filter) -> None:
+        """
+        Raises a ValueError or a TypeError if the filter is not valid
+        """
+        variable_filtered = filter.variable_filtered
+        type_of_filtering = filter.type_of_filtering
+        filtering_value = filter.filtering_value
+
+        if type_of_filtering in ["positive", "negative"]:  # categorical filter
+            if variable_filtered not in ["type", "color"]:
+                raise ValueError(
+                    "variable_filtered must be in the following list : 'type', 'color'")
+            if not isinstance(filtering_value, str):
+                raise TypeError(
+                    "filtering_value must be a string")
+
+        if type_of_filtering in [
+            "higher_than", "lower_than", "equal_to"
+        ]:  # numerical filter
+            if variable_filtered not in [
+                "manaValue", "defense", "edhrecRank", "toughness", "power", "type"
+            ]:
+                raise ValueError(
+                    "variable_filtered must be in the following list :'manaValue', "
+                    "'defense', 'edhrecRank', 'toughness', 'power'"
+                )
+
+        if type_of_filtering not in [
+            "higher_than", "lower_than", "equal_to", "positive", "negative"
+        ]:
+            raise ValueError(
+                "This is not a filter : type_of_filtering can only take "
+                "'higher_than', 'lower_than', 'equal_to', 'positive' or 'negative' as input"
+                )
+
+    def filter_search(
+        self, filters: list[Filter], page: int = 1, fields: list[str] = None
+    ) -> dict:
         """
         Service method for searching by filtering : checks if it is a valid filter and if it is,
         calls the filtering DAO method for each filter un the list and only keeps the cards common
@@ -219,6 +371,8 @@ class CardService():
             starts at 1
         page_size : int
             number of cards per page
+        fields : list[str]
+            the fields of Card.show_card sent for each card, None for all of them
 
         Return :
         --------
@@ -232,36 +386,7 @@ class CardService():
                 raise TypeError("'page' must be an integer")
             # we check if the filters are valid
             for filter in filters:
-                variable_filtered = filter.variable_filtered
-                type_of_filtering = filter.type_of_filtering
-                filtering_value = filter.filtering_value
-
-                if type_of_filtering in ["positive", "negative"]:  # categorical filter
-                    if variable_filtered not in ["type", "color"]:
-                        raise ValueError(
-                            "variable_filtered must be in the following list : 'type', 'color'")
-                    if not isinstance(filtering_value, str):
-                        raise TypeError(
-                            "filtering_value must be a string")
-
-                if type_of_filtering in [
-                    "higher_than", "lower_than", "equal_to"
-                ]:  # numerical filter
-                    if variable_filtered not in [
-                        "manaValue", "defense", "edhrecRank", "toughness", "power", "type"
-                    ]:
-                        raise ValueError(
-                            "variable_filtered must be in the following list :'manaValue', "
-                            "'defense', 'edhrecRank', 'toughness', 'power'"
-                        )
-
-                if type_of_filtering not in [
-                    "higher_than", "lower_than", "equal_to", "positive", "negative"
-                ]:
-                    raise ValueError(
-                        "This is not a filter : type_of_filtering can only take "
-                        "'higher_than', 'lower_than', 'equal_to', 'positive' or 'negative' as input"
-                        )
+                self.check_filter(filter)
                 if not filters:
                     logging.warning("Empty filters list")
                     return {"count": 0, "page": page, "total_pages": 0, "cards": []}
@@ -292,9 +417,9 @@ class CardService():
             # only getting the cards of the page we're on
             page_cards = []
             for card_id in page_ids:
-                card = CardDao().id_search(card_id)
+                card = CardDao().id_search(card_id, fields)
                 if card:
-                    page_cards.append(card.show_card())
+                    page_cards.append(card.show_card(fields))
                 logging.info(f"Returned {len(page_cards)} cards from {total_count} total")
             return {
                 "count": total_count,
@@ -307,6 +432,30 @@ class CardService():
             logging.error(f"Error in filter_search: {e}")
             return {"error": str(e), "count": 0, "cards": []}
 
+    def filter_export(self, filters: list[Filter], fields: list[str] = None):
+        """
+        All the cards matching the filters, as NDJSON chunks to stream (see
+        CardDao.export_documents). The filters are checked before anything is read.
+
+        Parameters :
+        ------------
+        filters : list[Filter]
+            the filters the cards must all match, at least one
+        fields : list[str]
+            the fields of Card.show_card sent for each card, None for all of them
+
+        Return :
+        --------
+        Iterator[bytes] | None
+            the chunks of NDJSON, read from the database as they are consumed, None if the
+            query failed
+        """
+        if not filters:
+            raise ValueError("At least one filter is needed")
+        for filter in filters:
+            self.check_filter(filter)
+        return CardDao().export_documents(filters, fields)
+
     def add_favourite_card(self, user_id: int, idCard: int) -> bool:
         """"Check whether the idCard exists and adds it to the list of
         favourite cards of the user corresponding to idUser
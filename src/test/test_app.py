@@ -0,0 +1,72 @@
+import datetime
+from unittest.mock import MagicMock, patch
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from utils.compression import CompressedCache
+
+
+@pytest.fixture(scope="module")
+def app_module():
+    """The app, imported without a database and without writing its log files"""
+    with patch("db_connection.DBConnection.new_pool", return_value=MagicMock()), \
+            patch("utils.log_init.initialize_logs"):
+        import app
+    return app
+
+
+def make_request(path, accept_encoding=None, if_none_match=None):
+    headers = [(b"accept-encoding", accept_encoding.encode())] if accept_encoding else []
+    if if_none_match:
+        headers.append((b"if-none-match", if_none_match.encode()))
+    return Request({
+        "type": "http", "method": "GET", "path": path, "query_string": b"",
+        "headers": headers, "scheme": "http", "server": ("test", 80)
+    })
+
+
+@pytest.mark.parametrize("accept_encoding", [None, "gzip"])
+def test_id_search_of_a_missing_card_is_a_404(app_module, accept_encoding):
+    """No 200 "null" with a cacheable ETag, whether the body goes through the cache or not"""
+    validator = (7, datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc))
+    with patch.object(app_module, "DataVersion") as data_version, \
+            patch.object(app_module.card_service, "card_document_json", return_value=None):
+        data_version.return_value.card.return_value = validator
+        with pytest.raises(HTTPException) as error:
+            app_module.id_search(404, make_request("/card/404", accept_encoding), None)
+
+    assert error.value.status_code == 404
+    assert CompressedCache().stats()["bodies"] == 0
+
+
+def test_if_none_match_star_on_a_missing_card_is_a_404(app_module):
+    """"*" matches any current representation, and a missing card has none"""
+    validator = (7, datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc))
+    with patch.object(app_module, "DataVersion") as data_version, \
+            patch.object(app_module.card_service, "card_document_json", return_value=None):
+        data_version.return_value.card.return_value = validator
+        with pytest.raises(HTTPException) as error:
+            app_module.id_search(404, make_request("/card/404", if_none_match="*"), None)
+
+    assert error.value.status_code == 404
+
+
+def test_if_none_match_star_on_an_existing_card_is_a_304(app_module):
+    validator = (7, datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc))
+    with patch.object(app_module, "DataVersion") as data_version, \
+            patch.object(app_module.card_service, "card_document_json", return_value=b"{}"):
+        data_version.return_value.card.return_value = validator
+        response = app_module.id_search(3, make_request("/card/3", if_none_match="*"), None)
+
+    assert response.status_code == 304
+
+
+def test_filter_export_reports_a_failed_query_before_streaming(app_module):
+    """The status is still free when the query fails: no 200 with an empty body"""
+    with patch.object(app_module.card_service, "filter_export", return_value=None):
+        with pytest.raises(HTTPException) as error:
+            app_module.filter_export([], None)
+
+    assert error.value.status_code == 500
@@ -593,3 +593,22 @@ def test_show_card_does_not_modify_card():
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
+
+
+def test_show_card_with_fields_keeps_only_these_keys(complete_card_for_display):
+    """show_card with fields only returns them, with id_card"""
+    result = complete_card_for_display.show_card(["name", "mana_cost", "legalities"])
+
+    assert result == {
+        "id_card": 2,
+        "name": "Serra Angel",
+        "mana_cost": "{3}{W}{W}",
+        "legalities": complete_card_for_display.show_card()["legalities"]
+    }
+
+
+def test_show_card_with_fields_skips_missing_values(card_all_collections_initialized):
+    """A requested field without a value is left out, as without fields"""
+    result = card_all_collections_initialized.show_card(["colors", "text"])
+
+    assert result == {"id_card": 1}
@@ -1,6 +1,8 @@
 import unittest
 from unittest.mock import Mock, patch, MagicMock
-from dao.card_dao import CardDao
+from business_object.card import Card
+from dao.card_dao import EXPORT_ERROR, CardDao
+from utils.card_cache import CardCache
 
 
 class TestFilterDAO(unittest.TestCase):
@@ -331,5 +333,429 @@ class TestFilterDAO(unittest.TestCase):
         self.assertEqual(result, False)
 
 
+class FakeCursor:
+    """
+    Cursor recording the queries it receives. The get-or-create queries answer with one id
+    per value, the other queries with a row holding every id column.
+    """
+
+    def __init__(self):
+        self.queries = []
+        self.connection = Mock(encoding="UTF8")
+        self._rows = []
+
+    def execute(self, query, params=None, **kwargs):
+        self.queries.append(query)
+        if isinstance(params, dict) and "values" in params:
+            values = list(dict.fromkeys(params["values"]))
+            self._rows = [{"id": i, "value": value} for i, value in enumerate(values)]
+        elif isinstance(params, dict) and "count" in params:
+            self._rows = [{"idCard": 100 + i} for i in range(params["count"])]
+        elif isinstance(params, dict) and "ids" in params:
+            self._rows = [{"idCard": id_card} for id_card in params["ids"]]
+        else:
+            self._rows = [{"idCard": 7, "idLeadership": 0, "idLegality": 0}]
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return self._rows
+
+
+class TestCreateCardDAO(unittest.TestCase):
+
+    def test_insert_card_round_trips_do_not_grow_with_the_card(self):
+        """Each dimension and each link table costs one query, whatever the number of values"""
+        # GIVEN
+        card = Card(
+            id_card=None, layout="normal", name="Big card", type_line="Creature — Elf",
+            colors=["G", "W"], color_identity=["G", "W"], keywords=["Flying", "Trample"],
+            types=["Creature"], subtypes=["Elf"], supertypes=["Legendary"],
+            printings=[f"SET{i}" for i in range(40)], first_printing="SET0",
+            rulings=[{"date": "2020-01-01", "text": "A ruling."}] * 5,
+            foreign_data=[{"language": "French", "name": "Grosse carte"}] * 10
+        )
+        cursor = FakeCursor()
+
+        # WHEN
+        result = CardDao().insert_card(cursor, card, None, "[0]", "[0]")
+
+        # THEN
+        self.assertTrue(result)
+        self.assertLessEqual(len(cursor.queries), 20)
+        printings = [query for query in cursor.queries if 'INSERT INTO "Printings"' in query]
+        self.assertEqual(len(printings), 1)
+        self.assertEqual(printings[0].count("(%s, %s)"), 40)
+        # The ids come from identity columns, never from MAX()
+        self.assertFalse(any("MAX(" in query for query in cursor.queries))
+
+    @patch('dao.card_dao.DBConnection')
+    def test_create_card_queues_the_embeddings(self, mock_db_connection_class):
+        """The API does not wait for the embeddings, the EmbeddingWorker computes them later"""
+        cursor = FakeCursor()
+        connection = mock_db_connection_class.return_value.connection.__enter__.return_value
+        connection.cursor.return_value.__enter__.return_value = cursor
+        card = Card(id_card=None, layout="normal", name="New card", type_line="Creature")
+
+        with patch.object(CardDao, "get_embed") as mock_get_embed:
+            result = CardDao().create_card(card)
+
+        self.assertTrue(result)
+        mock_get_embed.assert_not_called()
+        jobs = [query for query in cursor.queries if 'INSERT INTO "EmbeddingJob"' in query]
+        self.assertEqual(len(jobs), 1)
+        # A job already queued is moved, so that a worker embedding the old text gives it up
+        self.assertIn('DO UPDATE SET "enqueuedAt" = now()', jobs[0])
+
+    def test_insert_cards_round_trips_do_not_grow_with_the_number_of_cards(self):
+        """One dimension-resolution pass and one multi-row insert per table for the batch"""
+        def cards(count):
+            return [
+                Card(id_card=None, layout="normal", name=f"Card {i}", type_line="Creature — Elf",
+                     colors=["G"], types=["Creature"], subtypes=["Elf"], printings=["SET"],
+                     rulings=[{"date": "2020-01-01", "text": "A ruling."}])
+                for i in range(count)
+            ]
+        small, big = FakeCursor(), FakeCursor()
+
+        CardDao().insert_cards(small, cards(2))
+        ids = CardDao().insert_cards(big, cards(50))
+
+        self.assertEqual(ids, list(range(100, 150)))
+        self.assertEqual(len(small.queries), len(big.queries))
+        self.assertTrue(any('INSERT INTO "EmbeddingJob"' in query for query in big.queries))
+
+    def test_insert_cards_with_their_embeddings(self):
+        """Cards synchronised from the .json come with embeddings and notify with the others"""
+        cursor = FakeCursor()
+        cards = [Card(id_card=None, layout="normal", name=f"Card {i}", type_line="Instant")
+                 for i in range(3)]
+
+        CardDao().insert_cards(
+            cursor, cards, embeddings=[("[1]", "[2]")] * 3, source_hashes=["a", "b", "c"],
+            notify=False
+        )
+
+        self.assertFalse(any('INSERT INTO "EmbeddingJob"' in query for query in cursor.queries))
+        self.assertFalse(any("pg_notify" in query for query in cursor.queries))
+
+    def test_update_cards_rows_round_trips_do_not_grow_with_the_number_of_cards(self):
+        """All the cards are written by one typed multi-row UPDATE and one insert per table"""
+        def cards(count):
+            return [
+                Card(id_card=i, layout="normal", name=f"Card {i}", type_line="Creature — Elf",
+                     colors=["G"], types=["Creature"], subtypes=["Elf"], printings=["SET"])
+                for i in range(count)
+            ]
+        small, big = FakeCursor(), FakeCursor()
+
+        CardDao().update_cards_rows(small, cards(2), [("[1]", "[2]")] * 2, notify=False)
+        CardDao().update_cards_rows(big, cards(50), [("[1]", "[2]")] * 50, notify=False)
+
+        self.assertEqual(len(small.queries), len(big.queries))
+        updates = [query for query in big.queries if query.startswith('UPDATE "Card"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn("FROM (VALUES (%s::int, %s::int, %s::varchar", updates[0])
+        self.assertIn('COALESCE(v."sourceHash", c."sourceHash")', updates[0])
+        self.assertFalse(any("pg_notify" in query for query in big.queries))
+        # The pending embedding jobs are kept, the documents are rebuilt rather than deleted
+        deletes = [query for query in big.queries if query.startswith("DELETE")]
+        self.assertFalse(any('"EmbeddingJob"' in query for query in deletes))
+        self.assertFalse(any('"CardDocument"' in query for query in deletes))
+        self.assertTrue(any('INSERT INTO "CardDocument"' in query for query in big.queries))
+
+    @patch('dao.card_dao.DBConnection')
+    def test_create_cards_reports_the_invalid_cards(self, mock_db_connection_class):
+        """When the batch fails, the cards are inserted one by one and only the bad one fails"""
+        cursor = FakeCursor()
+        connection = mock_db_connection_class.return_value.connection.__enter__.return_value
+        connection.cursor.return_value.__enter__.return_value = cursor
+        cards = [Card(id_card=None, layout="normal", name=name, type_line="Instant")
+                 for name in ("A", "B", "C")]
+
+        with patch.object(
+            CardDao, "insert_cards", side_effect=[Exception("batch"), [1], Exception("bad"), [3]]
+        ):
+            results = CardDao().create_cards(cards)
+
+        self.assertEqual([result["status"] for result in results], ["created", "error", "created"])
+        self.assertEqual([result["id_card"] for result in results], [1, None, 3])
+        self.assertEqual(results[1]["error"], "bad")
+        self.assertIn("ROLLBACK TO SAVEPOINT create_card", cursor.queries)
+        connection.commit.assert_called_once()
+
+    @patch('dao.card_dao.DBConnection')
+    def test_delete_cards_uses_a_single_statement(self, mock_db_connection_class):
+        """The linked rows and the favourites are removed by ON DELETE CASCADE"""
+        cursor = FakeCursor()
+        connection = mock_db_connection_class.return_value.connection.__enter__.return_value
+        connection.cursor.return_value.__enter__.return_value = cursor
+
+        results = CardDao().delete_cards([4, 5, 6])
+
+        self.assertEqual([result["status"] for result in results], ["deleted"] * 3)
+        deletes = [query for query in cursor.queries if query.startswith("DELETE")]
+        self.assertEqual(deletes, ['DELETE FROM "Card" WHERE "idCard" = ANY(%(ids)s) '
+                                   'RETURNING "idCard";'])
+        # The other workers evict the deleted cards from their caches once committed
+        self.assertIn("pg_notify", cursor.queries[-1])
+
+
+class TestExportDocumentsDAO(unittest.TestCase):
+
+    def _filter(self, variable_filtered, type_of_filtering, filtering_value):
+        mock_filter = Mock()
+        mock_filter.variable_filtered = variable_filtered
+        mock_filter.type_of_filtering = type_of_filtering
+        mock_filter.filtering_value = filtering_value
+        return mock_filter
+
+    @patch('dao.card_dao.DBConnection')
+    def test_export_streams_batches_from_a_server_side_cursor(self, mock_db_connection_class):
+        pool = mock_db_connection_class.return_value.pool
+        connection = pool.getconn.return_value
+        cursor = connection.cursor.return_value
+        cursor.fetchmany.side_effect = [
+            [{"document": '{"id_card": 1}'}, {"document": '{"id_card": 2}'}],
+            [{"document": '{"id_card": 3}'}],
+            []
+        ]
+        filters = [
+            self._filter("color", "positive", "G"), self._filter("manaValue", "lower_than", 3)
+        ]
+
+        chunks = CardDao().export_documents(filters, ["name"], batch_size=2)
+        # The query runs before the response starts, the rows are fetched as they are sent
+        cursor.execute.assert_called_once()
+        cursor.fetchmany.assert_not_called()
+
+        self.assertEqual(list(chunks), [
+            b'{"id_card": 1}\n{"id_card": 2}\n', b'{"id_card": 3}\n'
+        ])
+        connection.cursor.assert_called_once_with(name="card_export")
+        query, parameters = cursor.execute.call_args.args
+        # One query for all the filters
+        self.assertIn("INTERSECT", query.as_string(None))
+        self.assertEqual(parameters, [["name"], "%G%", 3])
+        cursor.fetchmany.assert_called_with(2)
+        pool.putconn.assert_called_once_with(connection)
+
+    @patch('dao.card_dao.DBConnection')
+    def test_export_gives_its_connection_back_when_the_client_leaves(self, mock_db_connection_class):
+        pool = mock_db_connection_class.return_value.pool
+        connection = pool.getconn.return_value
+        cursor = connection.cursor.return_value
+        cursor.fetchmany.return_value = [{"document": "{}"}]
+
+        chunks = CardDao().export_documents([self._filter("manaValue", "equal_to", 1)])
+        next(chunks)
+        chunks.close()
+
+        pool.putconn.assert_called_once_with(connection)
+        connection.commit.assert_not_called()
+
+    @patch('dao.card_dao.DBConnection')
+    def test_export_query_errors_are_known_before_streaming(self, mock_db_connection_class):
+        pool = mock_db_connection_class.return_value.pool
+        connection = pool.getconn.return_value
+        connection.cursor.return_value.execute.side_effect = Exception("syntax error")
+
+        chunks = CardDao().export_documents([self._filter("manaValue", "equal_to", 1)])
+
+        self.assertIsNone(chunks)
+        pool.putconn.assert_called_once_with(connection)
+
+    @patch('dao.card_dao.DBConnection')
+    def test_export_failing_midway_ends_with_an_error_line(self, mock_db_connection_class):
+        pool = mock_db_connection_class.return_value.pool
+        connection = pool.getconn.return_value
+        cursor = connection.cursor.return_value
+        cursor.fetchmany.side_effect = [[{"document": '{"id_card": 1}'}], Exception("lost")]
+
+        chunks = list(CardDao().export_documents([self._filter("manaValue", "equal_to", 1)]))
+
+        self.assertEqual(chunks, [b'{"id_card": 1}\n', EXPORT_ERROR])
+        connection.commit.assert_not_called()
+        pool.putconn.assert_called_once_with(connection)
+
+
+class TestIdSearchDAO(unittest.TestCase):
+
+    def setUp(self):
+        CardCache().clear()
+
+    def _cursor(self, mock_db_connection_class):
+        cursor = MagicMock()
+        card_row = dict.fromkeys([
+            "idCard", "asciiName", "convertedManaCost", "defense", "edhrecRank",
+            "edhrecSaltiness", "embed", "faceManaValue", "faceName", "hand",
+            "hasAlternativeDeckLimit", "isFunny", "isReserved", "life", "loyalty", "manaCost",
+            "manaValue", "name", "power", "shortEmbed", "side", "text", "toughness", "layout",
+            "type"
+        ])
+        card_row["idCard"] = 7
+        cursor.fetchone.side_effect = [card_row, None, None, None, None]
+        cursor.fetchall.return_value = []
+        connection = mock_db_connection_class.return_value.connection.__enter__.return_value
+        connection.cursor.return_value.__enter__.return_value = cursor
+        return cursor
+
+    @patch('dao.card_dao.DBConnection')
+    def test_id_search_round_trips(self, mock_db_connection_class):
+        """The search_path is set once per connection, not before every query"""
+        cursor = self._cursor(mock_db_connection_class)
+
+        CardDao().id_search(7)
+
+        queries = [call.args[0] for call in cursor.execute.call_args_list]
+        self.assertFalse(any("search_path" in query for query in queries))
+        self.assertEqual(len(queries), 16)
+
+    @patch('dao.card_dao.DBConnection')
+    def test_id_search_is_cached_until_the_card_is_deleted(self, mock_db_connection_class):
+        cursor = self._cursor(mock_db_connection_class)
+
+        first = CardDao().id_search(7)
+        second = CardDao().id_search(7)
+
+        self.assertEqual(cursor.execute.call_count, 16)
+        self.assertEqual(second.id_card, 7)
+        self.assertIsNot(first, second)
+
+        cursor.fetchall.return_value = [{"idCard": 7}]
+        self.assertTrue(CardDao().delete_card(7))
+        self.assertIsNone(CardCache().get(7))
+
+    @patch('dao.card_dao.DBConnection')
+    def test_id_search_with_fields_only_reads_what_they_need(self, mock_db_connection_class):
+        """Projected cards skip the linked tables they do not need and are not cached"""
+        cursor = self._cursor(mock_db_connection_class)
+
+        card = CardDao().id_search(7, ["name", "colors"])
+
+        queries = [call.args[0] for call in cursor.execute.call_args_list]
+        self.assertEqual(len(queries), 2)
+        self.assertIn('JOIN "Colors"', queries[1])
+        self.assertEqual(card.show_card(["name", "colors"]), {"id_card": 7, "name": None})
+        self.assertIsNone(CardCache().get(7))
+
+    @patch('dao.card_dao.DBConnection')
+    def test_find_by_embedding_goes_through_the_hash_index(self, mock_db_connection_class):
+        """The vectors are only compared on the rows whose embedHash matches"""
+        cursor = MagicMock()
+        cursor.fetchone.return_value = None
+        connection = mock_db_connection_class.return_value.connection.__enter__.return_value
+        connection.cursor.return_value.__enter__.return_value = cursor
+
+        self.assertIsNone(CardDao().find_by_embedding([0.5] * 1024))
+
+        query = cursor.execute.call_args.args[0]
+        self.assertIn('"embedHash" = hashtextextended(%(embed)s::text, 0)', query)
+        self.assertIn('"embed" = %(embed)s', query)
+
+
+class TestUpdateCardDAO(unittest.TestCase):
+
+    def _card(self, **changes):
+        values = dict(
+            id_card=3, layout="normal", name="Llanowar Elves", type_line="Creature — Elf Druid",
+            colors=["G"], color_identity=["G"], types=["Creature"], subtypes=["Elf", "Druid"],
+            printings=["LEA", "M19"], text="{T}: Add {G}.", edhrec_rank=120,
+            rulings=[{"date": "2004-10-04", "text": "A ruling."}]
+        )
+        values.update(changes)
+        return Card(**values)
+
+    def test_diff_card_only_returns_the_changes(self):
+        current = self._card()
+        card = self._card(edhrec_rank=121, printings=["M19", "DMU"], subtypes=["Druid", "Elf"])
+
+        changes = CardDao().diff_card(current, card)
+
+        self.assertEqual(changes, {"edhrec_rank": 121, "printings": (["DMU"], ["LEA"])})
+
+    def test_diff_card_ignores_how_rulings_are_stored(self):
+        """The database gives dates back as datetime.date, the API as strings"""
+        import datetime
+        current = self._card(rulings=[{"date": datetime.date(2004, 10, 4), "text": "A ruling."}])
+
+        self.assertEqual(CardDao().diff_card(current, self._card()), {})
+
+    @patch('dao.card_dao.DBConnection')
+    def test_update_card_keeps_the_embeddings_when_the_text_does_not_change(
+        self, mock_db_connection_class
+    ):
+        cursor = FakeCursor()
+        connection = mock_db_connection_class.return_value.connection.__enter__.return_value
+        connection.cursor.return_value.__enter__.return_value = cursor
+
+        with patch.object(CardDao, "read_card", return_value=self._card()), \
+                patch.object(CardDao, "get_embed") as mock_get_embed:
+            result = CardDao().update_card(self._card(edhrec_rank=121))
+
+        self.assertTrue(result)
+        mock_get_embed.assert_not_called()
+        updates = [query for query in cursor.queries if query.startswith('UPDATE "Card"')]
+        self.assertEqual(updates, ['UPDATE "Card" SET "edhrecRank" = %(edhrecRank)s '
+                                   'WHERE "idCard" = %(idCard)s'])
+        self.assertFalse(any("DELETE" in query for query in cursor.queries))
+
+    @patch('dao.card_dao.DBConnection')
+    def test_update_card_queues_the_embeddings_when_the_text_changes(
+        self, mock_db_connection_class
+    ):
+        cursor = FakeCursor()
+        connection = mock_db_connection_class.return_value.connection.__enter__.return_value
+        connection.cursor.return_value.__enter__.return_value = cursor
+
+        with patch.object(CardDao, "read_card", return_value=self._card()), \
+                patch.object(CardDao, "get_embed") as mock_get_embed:
+            result = CardDao().update_card(self._card(text="{T}: Add {G}{G}."))
+
+        self.assertTrue(result)
+        mock_get_embed.assert_not_called()
+        queued = [i for i, query in enumerate(cursor.queries) if '"EmbeddingJob"' in query]
+        updated = [i for i, query in enumerate(cursor.queries) if query.startswith('UPDATE "Card"')]
+        # The job is queued before the card row is locked
+        self.assertEqual(len(queued), 1)
+        self.assertLess(queued[0], updated[0])
+        self.assertIn('"embed" = %(embed)s', cursor.queries[updated[0]])
+
+    @patch('dao.card_dao.DBConnection')
+    def test_update_card_refreshes_the_document_in_the_same_transaction(
+        self, mock_db_connection_class
+    ):
+        cursor = FakeCursor()
+        connection = mock_db_connection_class.return_value.connection.__enter__.return_value
+        connection.cursor.return_value.__enter__.return_value = cursor
+
+        with patch.object(CardDao, "read_card", return_value=self._card()):
+            CardDao().update_card(self._card(subtypes=["Elf"]))
+
+        documents = [query for query in cursor.queries if '"CardDocument"' in query]
+        self.assertEqual(len(documents), 1)
+        self.assertIn('card_document("idCard")', documents[0])
+        self.assertEqual(connection.commit.call_count, 1)
+
+    @patch('dao.card_dao.DBConnection')
+    def test_update_card_diffs_against_the_database_not_the_cache(
+        self, mock_db_connection_class
+    ):
+        """A stale copy in the CardCache must not hide a change made by another process"""
+        cursor = FakeCursor()
+        connection = mock_db_connection_class.return_value.connection.__enter__.return_value
+        connection.cursor.return_value.__enter__.return_value = cursor
+
+        with patch.object(CardDao, "id_search", return_value=self._card(edhrec_rank=121)), \
+                patch.object(CardDao, "read_card", return_value=self._card()) as read_card:
+            CardDao().update_card(self._card(edhrec_rank=121))
+
+        read_card.assert_called_once_with(3, cursor=cursor)
+        updates = [query for query in cursor.queries if query.startswith('UPDATE "Card"')]
+        self.assertEqual(updates, ['UPDATE "Card" SET "edhrecRank" = %(edhrecRank)s '
+                                   'WHERE "idCard" = %(idCard)s'])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,72 @@
+import os
+import unittest
+from unittest.mock import MagicMock, patch
+
+import psycopg
+from psycopg.rows import dict_row
+
+import db_connection
+from db_connection import POOL_SIZE, Connection, DBConnection
+
+ENVIRONMENT = {
+    "POSTGRES_HOST": "localhost", "POSTGRES_PORT": "5432", "POSTGRES_DATABASE": "magic",
+    "POSTGRES_USER": "user", "POSTGRES_PASSWORD": "password", "POSTGRES_SCHEMA": "defaultschema"
+}
+
+
+@patch.dict(os.environ, ENVIRONMENT)
+class TestDBConnection(unittest.TestCase):
+
+    @patch.object(db_connection, "ConnectionPool")
+    def test_the_requests_share_a_pool_of_pool_size_connections(self, mock_pool_class):
+        # A new DBConnection instead of the singleton of the app
+        db = type.__call__(DBConnection)
+
+        pool = mock_pool_class.return_value
+        self.assertIs(db.pool, pool)
+        kwargs = mock_pool_class.call_args.kwargs
+        self.assertEqual(kwargs["max_size"], POOL_SIZE)
+        self.assertIs(kwargs["connection_class"], Connection)
+        self.assertEqual(kwargs["configure"], db.configure)
+        self.assertIs(kwargs["kwargs"]["row_factory"], dict_row)
+        self.assertEqual(
+            kwargs["kwargs"]["options"], "-c search_path=defaultschema,public"
+        )
+        # An unreachable database is reported at the start
+        pool.wait.assert_called_once()
+        # Each with block takes a connection of the pool and gives it back
+        self.assertIs(db.connection, pool.connection.return_value)
+
+    @patch.object(db_connection, "register_vector")
+    @patch.object(DBConnection, "new_pool")
+    def test_connections_are_configured_when_opened(self, mock_new_pool, mock_register_vector):
+        db = type.__call__(DBConnection)
+        connection = MagicMock()
+
+        db.configure(connection)
+
+        self.assertEqual(connection.prepared_max, 100)
+        mock_register_vector.assert_called_once_with(connection)
+        # Left idle, as the pool requires
+        connection.rollback.assert_called_once()
+
+        # Before the vector extension exists
+        mock_register_vector.side_effect = psycopg.ProgrammingError("no vector type")
+        connection = MagicMock()
+        db.configure(connection)
+        connection.rollback.assert_called_once()
+
+    @patch.object(DBConnection, "configure")
+    @patch.object(Connection, "connect")
+    @patch.object(DBConnection, "new_pool")
+    def test_a_new_connection_is_outside_the_pool(
+        self, mock_new_pool, mock_connect, mock_configure
+    ):
+        db = type.__call__(DBConnection)
+
+        connection = db.new_connection()
+
+        self.assertIs(connection, mock_connect.return_value)
+        self.assertEqual(mock_connect.call_args.kwargs, db.connection_kwargs())
+        mock_configure.assert_called_once_with(connection)
+        mock_new_pool.return_value.getconn.assert_not_called()
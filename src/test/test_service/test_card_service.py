@@ -1,9 +1,12 @@
 import pytest
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import Mock, patch
 
 from business_object.card import Card
 from business_object.filter import Filter
-from service.card_service import CardService
+from service.card_service import CardService, in_flight
 
 
 # Fixtures
@@ -154,6 +157,34 @@ def test_delete_card_db_exception(mock_dao, card_service, capsys):
     assert "Failed to delete card from DB" in captured.out
 
 
+# Tests for the bulk methods
+
+@patch('service.card_service.CardDao')
+def test_create_cards_success(mock_dao, card_service, sample_card):
+    """Test creation of several cards"""
+    report = [{"index": 0, "id_card": 7, "status": "created", "error": None}]
+    mock_dao.return_value.create_cards.return_value = report
+
+    assert card_service.create_cards([sample_card]) == report
+    mock_dao.return_value.create_cards.assert_called_once_with([sample_card])
+
+
+def test_create_cards_invalid_input(card_service, capsys):
+    """Test creation of several cards with an invalid card"""
+    result = card_service.create_cards(["not a card"])
+
+    assert result is None
+    assert "Invalid input: must be a list of Card" in capsys.readouterr().out
+
+
+def test_delete_cards_invalid_input(card_service, capsys):
+    """Test deletion of several cards with an invalid id"""
+    result = card_service.delete_cards([1, "not an int"])
+
+    assert result is None
+    assert "Invalid input: ids must be the ids" in capsys.readouterr().out
+
+
 # Tests for id_search
 
 @patch('service.card_service.CardDao')
@@ -167,7 +198,7 @@ def test_id_search_success(mock_dao, card_service, sample_card):
     result = card_service.id_search(1)
 
     assert result == sample_card
-    mock_dao_instance.id_search.assert_called_once_with(1)
+    mock_dao_instance.id_search.assert_called_once_with(1, None)
 
 
 def test_id_search_invalid_type(card_service, capsys):
@@ -231,6 +262,38 @@ def test_id_search_db_exception_fetch(mock_dao, card_service, capsys):
     assert "Failed to fetch card from DB" in captured.out
 
 
+# Tests for card_document
+
+@patch('service.card_service.CardDao')
+def test_card_document_returns_the_stored_document(mock_dao, card_service):
+    """The card is sent as stored, without rebuilding it from the tables"""
+    document = {"id_card": 1, "layout": "normal", "name": "Test Card"}
+    mock_dao_instance = Mock()
+    mock_dao_instance.get_document.return_value = document
+    mock_dao.return_value = mock_dao_instance
+
+    result = card_service.card_document(1)
+
+    assert result == document
+    mock_dao_instance.id_search.assert_not_called()
+
+
+@patch('service.card_service.CardDao')
+def test_card_document_without_document(mock_dao, card_service):
+    """Test fallback on id_search when the document is not built yet"""
+    mock_card = Mock()
+    mock_card.show_card.return_value = {"id_card": 1}
+    mock_dao_instance = Mock()
+    mock_dao_instance.get_document.return_value = None
+    mock_dao_instance.get_highest_id.return_value = 100
+    mock_dao_instance.id_search.return_value = mock_card
+    mock_dao.return_value = mock_dao_instance
+
+    result = card_service.card_document(1)
+
+    assert result == {"id_card": 1}
+
+
 # Tests for name_search
 
 @patch('service.card_service.CardDao')
@@ -243,7 +306,7 @@ def test_name_search_success(mock_dao, card_service, sample_card):
     result = card_service.name_search("Test Card")
 
     assert result == [sample_card]
-    mock_dao_instance.name_search.assert_called_once_with("Test Card")
+    mock_dao_instance.name_search.assert_called_once_with("Test Card", None)
 
 
 def test_name_search_invalid_type(card_service, capsys):
@@ -320,6 +383,90 @@ def test_semantic_search_short_embed_success(mock_embedding, mock_dao, card_serv
     mock_embedding.assert_called_once_with("Red dragon")
 
 
+# Tests for the coalescing of concurrent reads
+
+def run_concurrently(function, count):
+    """Calls function() from [count] threads started together, returns their results"""
+    barrier = threading.Barrier(count)
+
+    def call():
+        barrier.wait()
+        return function()
+
+    with ThreadPoolExecutor(count) as executor:
+        return list(executor.map(lambda _: call(), range(count)))
+
+
+def wait_for_waiters(count):
+    """Blocks until [count] calls wait for the one in flight, so that they all coalesce"""
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        if in_flight.stats()["waiting"] >= count:
+            return
+        time.sleep(0.001)
+
+
+@patch('service.card_service.CardDao')
+@patch('service.card_service.embedding')
+def test_concurrent_semantic_searches_share_one_computation(
+    mock_embedding, mock_dao, card_service, sample_card
+):
+    """20 identical searches at the same time call the embedding API and Postgres once"""
+    def slow_embedding(search):
+        if mock_embedding.call_count == 1:
+            wait_for_waiters(19)
+        return [0.1, 0.2, 0.3]
+    mock_embedding.side_effect = slow_embedding
+    mock_dao.return_value.get_similar_entries.return_value = [(1, 0.9), (2, 0.8)]
+    mock_dao.return_value.get_highest_id.return_value = 100
+    mock_dao.return_value.id_search.return_value = sample_card
+
+    results = run_concurrently(lambda: card_service.semantic_search("Blue bird"), 20)
+
+    assert all(result == results[0] for result in results)
+    assert len(results[0]) == 2
+    assert mock_embedding.call_count == 1
+    assert mock_dao.return_value.get_similar_entries.call_count == 1
+    assert mock_dao.return_value.id_search.call_count == 2
+
+    # Nothing is kept once the calls ended
+    card_service.semantic_search("Blue bird")
+    assert mock_embedding.call_count == 2
+
+
+@patch('service.card_service.CardDao')
+def test_concurrent_card_reads_share_one_query(mock_dao, card_service):
+    """Identical reads of a card coalesce, reads of other cards or fields do not"""
+    def slow_document(id, fields):
+        if id == 1 and fields is None:
+            wait_for_waiters(9)
+        return b'{"id_card": %d}' % id
+    mock_dao.return_value.get_document_json.side_effect = slow_document
+
+    results = run_concurrently(lambda: card_service.card_document_json(1), 10)
+
+    assert results == [b'{"id_card": 1}'] * 10
+    assert mock_dao.return_value.get_document_json.call_count == 1
+
+    card_service.card_document_json(1, ["name"])
+    card_service.card_document_json(2)
+    assert mock_dao.return_value.get_document_json.call_count == 3
+
+
+@patch('service.card_service.CardDao')
+def test_concurrent_reads_share_a_failed_read(mock_dao, card_service, capsys):
+    """Calls coalesced with a failing one get its result too"""
+    def failing_document(id, fields):
+        wait_for_waiters(4)
+        raise ConnectionError("database down")
+    mock_dao.return_value.get_document_json.side_effect = failing_document
+
+    results = run_concurrently(lambda: card_service.card_document_json(1), 5)
+
+    assert results == [None] * 5
+    assert mock_dao.return_value.get_document_json.call_count == 1
+
+
 # Tests for view_random_card
 
 @patch('service.card_service.CardDao')
@@ -371,6 +518,48 @@ def test_filter_search_success_first_page(mock_dao, card_service, sample_card):
     assert len(result["cards"]) == 50
 
 
+@patch('service.card_service.CardDao')
+def test_filter_search_with_fields(mock_dao, card_service):
+    """The fields are used to read and to show the cards"""
+    filter1 = Filter(
+        variable_filtered="manaValue",
+        type_of_filtering="equal_to",
+        filtering_value=3
+    )
+
+    mock_card = Mock()
+    mock_card.show_card.return_value = {"id_card": 1, "name": "Test Card"}
+
+    mock_dao_instance = Mock()
+    mock_dao_instance.filter_dao.return_value = [1]
+    mock_dao_instance.id_search.return_value = mock_card
+    mock_dao.return_value = mock_dao_instance
+
+    result = card_service.filter_search([filter1], page=1, fields=["name"])
+
+    assert result["cards"] == [{"id_card": 1, "name": "Test Card"}]
+    mock_dao_instance.id_search.assert_called_once_with(1, ["name"])
+    mock_card.show_card.assert_called_once_with(["name"])
+
+
+@patch('service.card_service.CardDao')
+def test_filter_export_checks_the_filters_first(mock_dao, card_service):
+    """Invalid filters are refused before the export starts"""
+    valid = Filter(variable_filtered="manaValue", type_of_filtering="equal_to", filtering_value=3)
+    invalid = Filter(variable_filtered="color", type_of_filtering="positive", filtering_value=3)
+
+    with pytest.raises(TypeError):
+        card_service.filter_export([valid, invalid])
+    with pytest.raises(ValueError):
+        card_service.filter_export([])
+    mock_dao.return_value.export_documents.assert_not_called()
+
+    result = card_service.filter_export([valid], ["name"])
+
+    assert result == mock_dao.return_value.export_documents.return_value
+    mock_dao.return_value.export_documents.assert_called_once_with([valid], ["name"])
+
+
 @patch('service.card_service.CardDao')
 def test_filter_search_success_second_page(mock_dao, card_service, sample_card):
     """Test paginated search - second page"""
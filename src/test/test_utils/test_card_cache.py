@@ -0,0 +1,80 @@
+import pickle
+
+from business_object.card import Card
+from utils.card_cache import CardCache
+
+
+def make_cache(max_bytes=1024 * 1024):
+    # A new cache for every test instead of the singleton of the app
+    return type.__call__(CardCache, max_bytes)
+
+
+def make_card(id_card, text="Draw a card."):
+    return Card(id_card=id_card, layout="normal", name=f"Card {id_card}",
+                type_line="Instant", text=text)
+
+
+def test_get_returns_a_copy_of_the_card():
+    cache = make_cache()
+    cache.put(1, make_card(1), cache.generation)
+
+    card = cache.get(1)
+    card.text = "Changed by a caller."
+
+    assert cache.get(1).text == "Draw a card."
+    assert cache.get(2) is None
+    assert (cache.hits, cache.misses) == (2, 1)
+    assert cache.hit_rate == 2 / 3
+
+
+def test_embeddings_are_not_cached():
+    """The vectors would make up most of the pickled card, and no reader needs them"""
+    cache = make_cache()
+    card = make_card(1)
+    card._embedded = card._short_embedded = [0.5] * 1024
+    cache.put(1, card, cache.generation)
+
+    cached = cache.get(1)
+
+    assert cached._embedded is None and cached._short_embedded is None
+    assert cached.text == "Draw a card."
+    assert card._embedded == [0.5] * 1024
+    assert cache.size < len(pickle.dumps(card))
+
+
+def test_least_recently_read_cards_are_evicted_first():
+    size = len(pickle.dumps(make_card(1), protocol=pickle.HIGHEST_PROTOCOL))
+    cache = make_cache(max_bytes=2 * size + size // 2)
+    cache.put(1, make_card(1), cache.generation)
+    cache.put(2, make_card(2), cache.generation)
+    cache.get(1)
+    cache.put(3, make_card(3), cache.generation)
+
+    assert list(cache.entries) == [1, 3]
+    assert cache.evictions == 1
+    assert cache.stats()["bytes"] <= cache.max_bytes
+
+
+def test_invalidated_cards_are_removed():
+    cache = make_cache()
+    cache.put(1, make_card(1), cache.generation)
+    cache.put(2, make_card(2), cache.generation)
+
+    cache.invalidate([1])
+
+    assert cache.get(1) is None
+    assert cache.get(2) is not None
+    cache.clear()
+    assert cache.stats()["cards"] == 0
+    assert cache.size == 0
+
+
+def test_a_read_older_than_an_invalidation_is_not_stored():
+    cache = make_cache()
+    generation = cache.generation
+    old_card = make_card(1)
+    # The card is changed while it was being read from the database
+    cache.invalidate([1])
+    cache.put(1, old_card, generation)
+
+    assert cache.get(1) is None
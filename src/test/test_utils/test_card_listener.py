@@ -0,0 +1,94 @@
+from unittest.mock import MagicMock, Mock, patch
+
+from utils.card_listener import ALL_CARDS, CardChangeListener, notify_cards_changed
+
+
+def make_listener():
+    # A new listener for every test instead of the singleton of the app
+    return type.__call__(CardChangeListener)
+
+
+def test_notifications_reach_every_subscribed_cache():
+    listener = make_listener()
+    evicted = []
+    listener.subscribe(evicted.append)
+
+    with patch("utils.card_listener.CardCache") as mock_cache:
+        listener.dispatch("12")
+        listener.dispatch(ALL_CARDS)
+
+    assert evicted == [[12], None]
+    mock_cache.return_value.invalidate.assert_called_once_with([12])
+    mock_cache.return_value.clear.assert_called_once_with()
+
+
+def test_a_failing_cache_does_not_stop_the_others():
+    listener = make_listener()
+    evicted = []
+    listener.callbacks = [Mock(side_effect=ValueError("broken")), evicted.append]
+
+    listener.dispatch("3")
+
+    assert evicted == [[3]]
+
+
+def test_listen_empties_the_caches_then_evicts_the_notified_cards():
+    listener = make_listener()
+    evicted = []
+    listener.callbacks = [evicted.append]
+    connection = MagicMock()
+
+    def notifies(timeout):
+        listener.stop_event.set()
+        return [Mock(payload="4"), Mock(payload="5")]
+    connection.notifies.side_effect = notifies
+
+    with patch("utils.card_listener.DBConnection") as mock_db_connection_class, \
+            patch("utils.card_listener.DataVersion") as mock_data_version:
+        mock_db_connection_class.return_value.new_connection.return_value = connection
+        listener.listen()
+
+    assert connection.execute.call_args_list[0].args == ("LISTEN card_changed",)
+    assert connection.autocommit is True
+    # The version is read once the notifications of the later versions are sure to arrive
+    mock_data_version.return_value.load.assert_called_once_with(connection)
+    # Notifications sent before LISTEN are lost: everything is evicted first
+    assert evicted == [None, [4]]
+    assert listener.received == 1
+
+
+def test_notify_sends_one_notification_per_card():
+    cursor = MagicMock()
+
+    notify_cards_changed(cursor, [1, 2])
+    notify_cards_changed(cursor, [])
+    notify_cards_changed(cursor, None)
+
+    assert cursor.execute.call_count == 2
+    assert cursor.execute.call_args_list[0].args[1] == {"channel": "card_changed", "ids": [1, 2]}
+    assert cursor.execute.call_args_list[1].args[1] == {"channel": "card_changed", "all": ALL_CARDS}
+    # Every notification bumps the version of the data in the same transaction
+    assert all('UPDATE "DataVersion"' in call.args[0] for call in cursor.execute.call_args_list)
+
+
+def test_notified_versions_reach_the_data_version():
+    listener = make_listener()
+    listener.callbacks = []
+
+    with patch("utils.card_listener.DataVersion") as mock_data_version:
+        listener.dispatch("12:1700000000000001")
+        listener.dispatch(f"{ALL_CARDS}:1700000000000002")
+        listener.dispatch("13")
+
+    assert mock_data_version.return_value.update.call_args_list == [
+        (([12], 1700000000000001),), ((None, 1700000000000002),)
+    ]
+
+
+def test_closing_the_listener_forgets_the_versions():
+    listener = make_listener()
+
+    with patch("utils.card_listener.DataVersion") as mock_data_version:
+        listener.close()
+
+    mock_data_version.return_value.forget.assert_called_once_with()
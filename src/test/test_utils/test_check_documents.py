@@ -0,0 +1,42 @@
+import datetime
+
+from business_object.card import Card
+from utils.check_documents import compare_document
+
+
+def make_card(**changes):
+    values = dict(
+        id_card=3, layout="normal", name="Llanowar Elves", type_line="Creature — Elf Druid",
+        colors=["G"], color_identity=["G"], color_indicator=[], types=["Creature"],
+        subtypes=["Druid", "Elf"], edhrec_rank=120,
+        rulings=[{"date": datetime.date(2004, 10, 4), "text": "A ruling."}]
+    )
+    values.update(changes)
+    return Card(**values)
+
+
+def test_a_document_equal_to_the_card_has_no_differences():
+    # As stored by card_document: lists sorted like read_card sorts them, dates as strings
+    document = {
+        "id_card": 3, "layout": "normal", "name": "Llanowar Elves",
+        "type_line": "Creature — Elf Druid", "colors": ["G"], "color_identity": ["G"],
+        "types": ["Creature"],
+        "subtypes": ["Druid", "Elf"], "edhrec_rank": 120,
+        "rulings": [{"date": "2004-10-04", "text": "A ruling."}]
+    }
+
+    assert compare_document(document, make_card().show_card()) == []
+
+
+def test_the_different_keys_are_reported():
+    document = make_card(edhrec_rank=121).show_card()
+    del document["subtypes"]
+
+    assert compare_document(document, make_card().show_card()) == ["edhrec_rank", "subtypes"]
+
+
+def test_lists_in_another_order_are_a_difference():
+    """/card/{id} and the other endpoints must send the lists in the same order"""
+    document = make_card(subtypes=["Elf", "Druid"]).show_card()
+
+    assert compare_document(document, make_card().show_card()) == ["subtypes"]
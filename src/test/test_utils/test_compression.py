@@ -0,0 +1,130 @@
+import asyncio
+import gzip
+import json
+from unittest.mock import patch
+
+from starlette.responses import Response, StreamingResponse
+
+from utils import compression
+from utils.compression import (
+    CompressedCache, CompressionMiddleware, CompressionStats, choose_encoding, compress
+)
+
+PAYLOAD = json.dumps(
+    [{"id_card": i, "name": "Llanowar Elves", "type_line": "Creature - Elf Druid"}
+     for i in range(100)]
+).encode("utf-8")
+
+
+def run(app, accept_encoding="gzip"):
+    """Sends a GET through the middleware, returns the start message and the body"""
+    scope = {
+        "type": "http", "asgi": {"spec_version": "2.4"}, "method": "GET", "path": "/",
+        "query_string": b"",
+        "headers": [(b"accept-encoding", accept_encoding.encode())] if accept_encoding else [],
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(CompressionMiddleware(app, minimum_size=500)(scope, receive, send))
+    start = messages[0]
+    body = b"".join(message.get("body", b"") for message in messages[1:])
+    return dict((key.decode(), value.decode()) for key, value in start["headers"]), body
+
+
+def test_choose_encoding():
+    with patch.object(compression, "zstandard", None), patch.object(compression, "brotli", None):
+        assert choose_encoding("gzip, deflate, br") == "gzip"
+        assert choose_encoding("br;q=1.0, gzip;q=0.5") == "gzip"
+        assert choose_encoding("gzip;q=0") is None
+        assert choose_encoding("*") == "gzip"
+        assert choose_encoding("identity") is None
+        assert choose_encoding(None) is None
+
+    with patch.object(compression, "zstandard", object()):
+        assert choose_encoding("gzip, zstd") == "zstd"
+
+
+def test_large_json_responses_are_compressed():
+    headers, body = run(Response(PAYLOAD, media_type="application/json"))
+
+    assert headers["content-encoding"] == "gzip"
+    assert headers["content-length"] == str(len(body))
+    assert headers["vary"] == "Accept-Encoding"
+    assert headers["server-timing"].startswith("compress;dur=")
+    assert gzip.decompress(body) == PAYLOAD
+    assert len(body) < len(PAYLOAD) / 5
+
+
+def test_responses_sent_as_they_are():
+    # Too small, not accepted, not JSON, already compressed or streamed
+    small = Response(b'{"id_card": 1}', media_type="application/json")
+    image = Response(PAYLOAD, media_type="image/png")
+    encoded = Response(
+        compress(PAYLOAD, "gzip"), media_type="application/json",
+        headers={"Content-Encoding": "gzip"}
+    )
+    streamed = StreamingResponse(iter([PAYLOAD, PAYLOAD]), media_type="application/x-ndjson")
+
+    assert run(small)[1] == b'{"id_card": 1}'
+    assert run(Response(PAYLOAD, media_type="application/json"), None)[1] == PAYLOAD
+    assert run(image)[1] == PAYLOAD
+    assert gzip.decompress(run(encoded)[1]) == PAYLOAD
+    assert run(streamed)[1] == PAYLOAD + PAYLOAD
+
+
+def test_responses_that_could_be_compressed_vary_on_accept_encoding():
+    """Uncompressed JSON varies too, so that a cache never gives it for a gzip request"""
+    small = Response(b'{"id_card": 1}', media_type="application/json")
+    large = Response(PAYLOAD, media_type="application/json")
+    image = Response(PAYLOAD, media_type="image/png")
+    streamed = StreamingResponse(iter([PAYLOAD, PAYLOAD]), media_type="application/x-ndjson")
+
+    assert run(small)[0]["vary"] == "Accept-Encoding"
+    assert run(large, None)[0]["vary"] == "Accept-Encoding"
+    assert "vary" not in run(image)[0]
+    assert "vary" not in run(streamed)[0]
+
+
+def test_compressed_cache_compresses_once_per_version():
+    cache = type.__call__(CompressedCache, 1024 * 1024)
+    loads = []
+
+    def load():
+        loads.append(1)
+        return PAYLOAD
+
+    first, compressed = cache.get_or_compress((1, ""), 100, "gzip", load)
+    second, _ = cache.get_or_compress((1, ""), 100, "gzip", load)
+    cache.get_or_compress((1, ""), 101, "gzip", load)
+
+    assert compressed
+    assert first == second
+    assert gzip.decompress(first) == PAYLOAD
+    assert len(loads) == 2
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["bodies"] == 1
+
+
+def test_compressed_cache_leaves_small_bodies():
+    cache = type.__call__(CompressedCache, 1024 * 1024)
+
+    assert cache.get_or_compress((1, ""), 100, "gzip", lambda: b"{}") == (b"{}", False)
+    assert cache.get_or_compress((2, ""), 100, "gzip", lambda: None) == (None, False)
+    assert cache.stats()["bodies"] == 0
+
+
+def test_stats():
+    stats = type.__call__(CompressionStats)
+    stats.record("gzip", 1000, 200, 0.002)
+    stats.record("gzip", 3000, 600, 0.004)
+
+    gzip_stats = stats.stats()["encodings"]["gzip"]
+    assert gzip_stats["ratio"] == 0.2
+    assert gzip_stats["bytes_on_wire_per_response"] == 400
+    assert round(gzip_stats["cpu_ms_per_response"], 6) == 3.0
@@ -0,0 +1,64 @@
+import datetime
+from unittest.mock import MagicMock
+
+from utils.data_version import DataVersion
+
+LOADED_AT = datetime.datetime(2024, 5, 1, 12, 0, tzinfo=datetime.timezone.utc)
+
+
+def make_data_version(version=100):
+    # A new DataVersion for every test instead of the singleton of the app
+    data_version = type.__call__(DataVersion)
+    connection = MagicMock()
+    connection.execute.return_value.fetchone.return_value = {
+        "version": version, "updatedAt": LOADED_AT
+    }
+    data_version.load(connection)
+    return data_version
+
+
+def test_nothing_is_known_before_the_load():
+    data_version = type.__call__(DataVersion)
+    data_version.update([1], 101)
+
+    assert data_version.card(1) is None
+    assert data_version.all_cards() is None
+
+
+def test_cards_have_the_version_loaded_until_they_change():
+    data_version = make_data_version()
+
+    assert data_version.card(1) == (100, LOADED_AT)
+    assert data_version.all_cards() == (100, LOADED_AT)
+
+    data_version.update([1], 101)
+
+    assert data_version.card(1)[0] == 101
+    assert data_version.card(2) == (100, LOADED_AT)
+    assert data_version.all_cards()[0] == 101
+
+
+def test_a_change_of_every_card_replaces_the_versions():
+    data_version = make_data_version()
+    data_version.update([1], 101)
+    data_version.update(None, 102)
+
+    assert data_version.card(1)[0] == 102
+    assert data_version.card(2)[0] == 102
+
+
+def test_an_older_notification_does_not_lower_the_latest_version():
+    data_version = make_data_version()
+    data_version.update([1], 103)
+    data_version.update([2], 99)
+
+    assert data_version.all_cards()[0] == 103
+    assert data_version.card(2)[0] == 99
+
+
+def test_forget():
+    data_version = make_data_version()
+    data_version.forget()
+
+    assert data_version.card(1) is None
+    assert data_version.all_cards() is None
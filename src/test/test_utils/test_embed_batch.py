@@ -0,0 +1,170 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utils import embed_batch
+from utils.embed_batch import AdaptiveBatchSize, EMBED_DIMENSION, embed_missing, embed_texts
+from utils.embed_cache import EmbeddingCache
+
+
+class StubEmbeddingHandler(BaseHTTPRequestHandler):
+    """Local stand-in for the embedding API: the embedding of "text <n>" is [n, n]"""
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        texts = body["input"]
+
+        with server.lock:
+            server.requests.append(len(texts))
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        time.sleep(server.delay)
+        with server.lock:
+            server.in_flight -= 1
+
+        if len(texts) > server.max_batch or any("poison" in text for text in texts):
+            self.send_response(500)
+            self.end_headers()
+            return
+        if any("garbage" in text for text in texts):
+            payload = b'{"error": "model overloaded"}'
+        else:
+            payload = json.dumps(
+                {"embeddings": [[float(text.split()[-1])] * 2 for text in texts]}
+            ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    """Starts the stub embedding server and points embed_batch at it"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubEmbeddingHandler)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.in_flight = 0
+    server.max_in_flight = 0
+    server.delay = 0.05
+    server.max_batch = 10_000
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(embed_batch, "url", f"http://127.0.0.1:{server.server_port}/api/embed")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def collect(texts, **kwargs):
+    """Runs embed_texts and rebuilds the results in order"""
+    results = {}
+
+    def on_result(start, embeddings):
+        for i, embed in enumerate(embeddings):
+            results[start + i] = embed
+
+    stats = embed_texts(texts, on_result, retry_delay=0, **kwargs)
+    return [results[i] for i in range(len(texts))], stats
+
+
+def test_embed_texts_keeps_several_requests_in_flight(stub_server):
+    """Batches are sent concurrently and results come back in the order of the texts"""
+    texts = [f"text {i}" for i in range(200)]
+
+    embeddings, stats = collect(texts, workers=4, sizer=AdaptiveBatchSize(initial=20))
+
+    assert embeddings == [[float(i)] * 2 for i in range(200)]
+    assert stats["texts"] == 200
+    assert stats["failed"] == 0
+    assert stats["texts_per_second"] > 0
+    assert stub_server.max_in_flight > 1
+
+
+def test_embed_texts_bisects_failed_batches(stub_server):
+    """Only the poisoned text gets a zero vector, its neighbours are still embedded"""
+    texts = [f"text {i}" for i in range(64)]
+    texts[37] = "poison 37"
+
+    embeddings, stats = collect(texts, workers=1, sizer=AdaptiveBatchSize(initial=64))
+
+    assert stats["failed"] == 1
+    assert embeddings[37] == [0] * EMBED_DIMENSION
+    assert all(embeddings[i] == [float(i)] * 2 for i in range(64) if i != 37)
+    # Bisection needs about log2(64) extra requests, not one request per text
+    assert len(stub_server.requests) < 20
+
+
+def test_bisection_does_not_shrink_the_batch_size(stub_server):
+    """A poisoned batch halves the batch size once, not once per bisection step"""
+    texts = [f"text {i}" for i in range(64)]
+    texts[5] = "poison 5"
+    sizer = AdaptiveBatchSize(initial=64, minimum=1)
+
+    collect(texts, workers=1, sizer=sizer)
+
+    assert sizer.value == 32
+
+
+def test_embed_texts_survives_malformed_responses(stub_server):
+    """A 200 answer without embeddings is a failed batch, not a crash of the run"""
+    texts = [f"text {i}" for i in range(16)]
+    texts[3] = "garbage 3"
+
+    embeddings, stats = collect(texts, workers=2, sizer=AdaptiveBatchSize(initial=8))
+
+    assert stats["failed"] == 1
+    assert embeddings[3] == [0] * EMBED_DIMENSION
+    assert embeddings[15] == [15.0, 15.0]
+
+
+def test_embed_texts_shrinks_batches_the_server_rejects(stub_server):
+    """A server refusing large batches makes the batch size shrink under its limit"""
+    stub_server.max_batch = 50
+    sizer = AdaptiveBatchSize(initial=400, minimum=10)
+
+    embeddings, stats = collect([f"text {i}" for i in range(1000)], workers=2, sizer=sizer)
+
+    assert stats["failed"] == 0
+    assert embeddings[999] == [999.0, 999.0]
+    assert sizer.value < 400
+
+
+def test_adaptive_batch_size_reacts_to_latency():
+    """The batch size grows on fast answers and is halved on slow answers or errors"""
+    sizer = AdaptiveBatchSize(initial=100, minimum=10, maximum=200, target_latency=1.0)
+
+    sizer.record_success(0.1)
+    assert sizer.value == 110
+    sizer.record_success(5.0)
+    assert sizer.value == 55
+    sizer.record_failure()
+    assert sizer.value == 27
+    for _ in range(5):
+        sizer.record_failure()
+    assert sizer.value == 10
+
+
+def test_embed_missing_only_sends_texts_absent_from_the_cache(stub_server, tmp_path):
+    """A second run over mostly unchanged texts only embeds the new ones"""
+    cache = EmbeddingCache("test-model", str(tmp_path / "cache.sqlite"))
+    # "text 0" would be embedded as a zero vector, which the cache treats as a failure
+    embed_missing([f"text {i}" for i in range(1, 101)], cache, workers=2)
+    sent_first_run = sum(stub_server.requests)
+
+    rerun = EmbeddingCache("test-model", str(tmp_path / "cache.sqlite"))
+    stats = embed_missing([f"text {i}" for i in range(1, 106)], rerun, workers=2)
+
+    assert sent_first_run == 100
+    assert sum(stub_server.requests) - sent_first_run == 5
+    assert stats["texts"] == 5
+    assert rerun.hits == 100
+    assert rerun.get_many(["text 105"]) == {"text 105": "[105.0, 105.0]"}
@@ -0,0 +1,31 @@
+from utils.embed_cache import EmbeddingCache
+
+
+def test_missing_counts_hits_and_misses(tmp_path):
+    """Texts already embedded are hits, the others are returned once each"""
+    cache = EmbeddingCache("bge-m3:latest", str(tmp_path / "cache.sqlite"))
+    cache.put_many(["a", "b"], [[0.1, 0.2], [0.3, 0.4]])
+
+    missing = cache.missing(["a", "c", "b", "c", "d"])
+
+    assert missing == ["c", "d"]
+    assert cache.hits == 2
+    assert cache.misses == 2
+    assert cache.hit_rate == 0.5
+
+
+def test_key_depends_on_the_model(tmp_path):
+    """An embedding computed by another model is never reused"""
+    path = str(tmp_path / "cache.sqlite")
+    EmbeddingCache("model-a", path).put_many(["a"], [[0.1]])
+
+    assert EmbeddingCache("model-a", path).get_many(["a"]) == {"a": "[0.1]"}
+    assert EmbeddingCache("model-b", path).missing(["a"]) == ["a"]
+
+
+def test_failed_embeddings_are_not_cached(tmp_path):
+    """Zero vectors stand for failed texts and must be computed again next time"""
+    cache = EmbeddingCache("bge-m3:latest", str(tmp_path / "cache.sqlite"))
+    cache.put_many(["ok", "failed"], [[0.5, 0.5], [0, 0]])
+
+    assert cache.missing(["ok", "failed"]) == ["failed"]
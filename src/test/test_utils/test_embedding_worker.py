@@ -0,0 +1,136 @@
+import datetime
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+
+from business_object.card import Card
+from utils.embedding_worker import EmbeddingWorker
+
+ENQUEUED = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+REQUEUED = ENQUEUED + datetime.timedelta(seconds=5)
+
+
+class JobCursor:
+    """
+    Cursor of the worker: the claim returns [claimed], the lock of the jobs before the write
+    returns [locked] ({idCard: enqueuedAt}, the claimed jobs by default)
+    """
+
+    def __init__(self, claimed, locked=None):
+        self.claimed = claimed
+        self.locked = claimed if locked is None else locked
+        self.queries = []
+        self.rows = []
+
+    def execute(self, query, params=None):
+        self.queries.append(query)
+        if "RETURNING" in query:
+            rows = self.claimed
+        elif "FOR UPDATE" in query:
+            rows = self.locked
+        else:
+            rows = {}
+        self.rows = [{"idCard": id_card, "enqueuedAt": at} for id_card, at in rows.items()]
+
+    def fetchall(self):
+        return self.rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+def make_worker(claimed, locked=None):
+    worker = EmbeddingWorker()
+    worker.connection = MagicMock(closed=False)
+    cursor = JobCursor(claimed, locked)
+    worker.connection.cursor.return_value = cursor
+    return worker, cursor
+
+
+CARDS = [Card(id_card=1, layout=None, name="A", type_line="Instant", text="Draw a card."),
+         Card(id_card=2, layout=None, name="B", type_line="Sorcery")]
+
+
+def test_run_once_embeds_the_batch_in_one_request_outside_of_a_transaction():
+    worker, cursor = make_worker({1: ENQUEUED, 2: ENQUEUED})
+    commits_before_the_call = []
+
+    def embed(texts):
+        commits_before_the_call.append(worker.connection.commit.call_count)
+        return [[1.0], [2.0], [3.0], [4.0]]
+
+    with patch("utils.embedding_worker.CardDao.get_cards_for_embedding", return_value=CARDS), \
+            patch("utils.embedding_worker.embedding_batch", side_effect=embed) as mock_batch, \
+            patch("utils.embedding_worker.execute_values") as mock_values:
+        assert worker.run_once() == 2
+
+    mock_batch.assert_called_once_with(
+        ["A | Instant | Draw a card.", "A: Draw a card.", "B | Sorcery", "B"]
+    )
+    # The claim is committed before the API is called
+    assert commits_before_the_call == [1]
+    assert worker.connection.commit.call_count == 2
+    rows = mock_values.call_args.args[2]
+    assert [row[0] for row in rows] == [1, 2]
+    assert [(row[1].tolist(), row[2].tolist()) for row in rows] == [([1.0], [2.0]), ([3.0], [4.0])]
+    assert rows[0][1].dtype == np.float32
+    assert "SKIP LOCKED" in cursor.queries[0]
+    assert cursor.queries[-1].startswith('DELETE FROM "EmbeddingJob"')
+
+
+def test_run_once_keeps_the_jobs_when_the_api_fails():
+    worker, cursor = make_worker({1: ENQUEUED})
+
+    with patch("utils.embedding_worker.CardDao.get_cards_for_embedding",
+               return_value=CARDS[:1]), \
+            patch("utils.embedding_worker.embedding_batch", return_value=None), \
+            patch("utils.embedding_worker.execute_values") as mock_values:
+        assert worker.run_once() == 0
+
+    mock_values.assert_not_called()
+    assert '"claimedAt" = NULL' in cursor.queries[-1]
+    assert not any(query.startswith("DELETE") for query in cursor.queries)
+
+
+def test_run_once_without_jobs_does_not_call_the_api():
+    worker, _ = make_worker({})
+
+    with patch("utils.embedding_worker.embedding_batch") as mock_batch:
+        assert worker.run_once() == 0
+
+    mock_batch.assert_not_called()
+
+
+def test_a_card_queued_again_during_the_call_keeps_its_job():
+    """The vectors of the old text are not written, and the job of the new text stays"""
+    worker, cursor = make_worker({1: ENQUEUED, 2: ENQUEUED}, {1: REQUEUED, 2: ENQUEUED})
+
+    with patch("utils.embedding_worker.CardDao.get_cards_for_embedding", return_value=CARDS), \
+            patch("utils.embedding_worker.embedding_batch",
+                  return_value=[[1.0], [2.0], [3.0], [4.0]]), \
+            patch("utils.embedding_worker.execute_values") as mock_values:
+        assert worker.run_once() == 1
+
+    assert [row[0] for row in mock_values.call_args.args[2]] == [2]
+    deletes = [query for query in cursor.queries if query.startswith("DELETE")]
+    assert len(deletes) == 1
+
+
+def test_a_card_whose_text_changed_is_not_written():
+    worker, cursor = make_worker({1: ENQUEUED})
+    changed = [Card(id_card=1, layout=None, name="A", type_line="Instant", text="Discard.")]
+
+    with patch("utils.embedding_worker.CardDao.get_cards_for_embedding",
+               side_effect=[CARDS[:1], changed]) as mock_cards, \
+            patch("utils.embedding_worker.embedding_batch", return_value=[[1.0], [2.0]]), \
+            patch("utils.embedding_worker.execute_values") as mock_values:
+        assert worker.run_once() == 0
+
+    # The cards are locked before their text is compared
+    assert mock_cards.call_args.kwargs == {"lock": True}
+    mock_values.assert_not_called()
+    assert not any(query.startswith("DELETE") for query in cursor.queries)
+    assert '"attempts" = "attempts" - 1' in cursor.queries[-1]
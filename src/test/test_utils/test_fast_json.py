@@ -0,0 +1,57 @@
+import datetime
+import json
+from unittest.mock import patch
+
+import pytest
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from utils import fast_json
+from utils.fast_json import FastJSONResponse, dumps
+
+PAGE = {
+    "count": 1, "page": 1, "total_pages": 1,
+    "cards": [{
+        "id_card": 3, "name": "Éclaireur", "mana_value": 1.0, "is_funny": False,
+        "rulings": [{"date": datetime.date(2004, 10, 4), "text": "A ruling."}]
+    }]
+}
+
+
+def test_the_body_is_the_same_as_with_fastapi():
+    expected = JSONResponse(jsonable_encoder(PAGE)).body
+
+    assert json.loads(FastJSONResponse(PAGE).body) == json.loads(expected)
+
+
+def test_the_json_module_is_used_without_orjson():
+    with patch.object(fast_json, "orjson", None):
+        body = dumps(PAGE)
+
+    assert body == JSONResponse(jsonable_encoder(PAGE)).body
+
+
+def test_orjson_and_the_json_module_write_the_same_bytes():
+    pytest.importorskip("orjson")
+    content = {
+        "name": "Æther Vial — 「霊気の薬瓶」 🜁", "flavor": '"Quoted"\n\ttext\\ \x01 \u2028',
+        "date": datetime.date(2004, 10, 4), "naive": datetime.datetime(2024, 1, 2, 3, 4, 5),
+        "at": datetime.datetime(2024, 1, 2, 3, 4, 5, 123456, tzinfo=datetime.timezone.utc),
+        "cards": PAGE["cards"]
+    }
+
+    with_orjson = dumps(content)
+    with patch.object(fast_json, "orjson", None):
+        with_json = dumps(content)
+
+    assert with_orjson == with_json
+
+
+def test_encoded_content_is_sent_as_is():
+    document = b'{"id_card": 3, "name": "Llanowar Elves"}'
+
+    response = FastJSONResponse(document)
+
+    assert response.body == document
+    assert response.media_type == "application/json"
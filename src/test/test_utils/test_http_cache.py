@@ -0,0 +1,90 @@
+import datetime
+from unittest.mock import Mock
+
+from utils.http_cache import cache_headers, conditional, is_fresh, make_etag
+
+MODIFIED = datetime.datetime(2024, 5, 1, 12, 0, 30, 500, tzinfo=datetime.timezone.utc)
+
+
+def make_request(headers=None, path="/card/1", query="", method="GET"):
+    return Mock(method=method, headers=headers or {}, url=Mock(path=path, query=query))
+
+
+def test_etag_changes_with_the_version_and_the_key():
+    etag = make_etag(100, "/card/1", "")
+
+    assert etag.startswith('W/"64-')
+    assert make_etag(100, "/card/1", "") == etag
+    assert make_etag(101, "/card/1", "") != etag
+    assert make_etag(100, "/card/1", "fields=name") != etag
+
+
+def test_headers_without_a_known_version():
+    assert cache_headers(None, "/card/1") == {"Cache-Control": "no-cache"}
+    assert not is_fresh({"if-none-match": "*"}, cache_headers(None, "/card/1"))
+
+
+def test_headers_with_a_version():
+    headers = cache_headers((100, MODIFIED), "/card/1")
+
+    assert headers["Last-Modified"] == "Wed, 01 May 2024 12:00:30 GMT"
+    assert "must-revalidate" in headers["Cache-Control"]
+
+
+def test_if_none_match():
+    headers = cache_headers((100, MODIFIED), "/card/1")
+    etag = headers["ETag"]
+
+    assert is_fresh({"if-none-match": etag}, headers)
+    assert is_fresh({"if-none-match": f'"other", {etag.removeprefix("W/")}'}, headers)
+    assert not is_fresh({"if-none-match": '"other"'}, headers)
+    assert is_fresh({"if-none-match": "*"}, headers)
+    # If-None-Match has priority over If-Modified-Since
+    assert not is_fresh(
+        {"if-none-match": '"other"', "if-modified-since": headers["Last-Modified"]}, headers
+    )
+
+
+def test_if_modified_since():
+    headers = cache_headers((100, MODIFIED), "/card/1")
+
+    assert is_fresh({"if-modified-since": "Wed, 01 May 2024 12:00:30 GMT"}, headers)
+    assert is_fresh({"if-modified-since": "Thu, 02 May 2024 08:00:00 GMT"}, headers)
+    assert not is_fresh({"if-modified-since": "Wed, 01 May 2024 12:00:29 GMT"}, headers)
+    assert not is_fresh({"if-modified-since": "yesterday"}, headers)
+
+
+def test_conditional_answers_304_to_a_current_copy():
+    headers, not_modified = conditional(make_request(), (100, MODIFIED))
+    assert not_modified is None
+
+    headers_again, not_modified = conditional(
+        make_request({"if-none-match": headers["ETag"]}), (100, MODIFIED)
+    )
+    assert headers_again == headers
+    assert not_modified.status_code == 304
+    assert not_modified.headers["etag"] == headers["ETag"]
+
+    _, not_modified = conditional(
+        make_request({"if-none-match": headers["ETag"]}), (101, MODIFIED)
+    )
+    assert not_modified is None
+
+
+def test_if_none_match_star_only_matches_an_existing_response():
+    headers = cache_headers((100, MODIFIED), "/card/1")
+    exists = Mock(return_value=False)
+
+    assert not is_fresh({"if-none-match": "*"}, headers, exists)
+    assert is_fresh({"if-none-match": "*"}, headers, Mock(return_value=True))
+    # Only read for "*"
+    assert is_fresh({"if-none-match": headers["ETag"]}, headers, exists)
+    assert exists.call_count == 1
+
+
+def test_conditional_only_answers_304_to_get_and_head():
+    headers, _ = conditional(make_request(), (100, MODIFIED))
+    current = {"if-none-match": headers["ETag"]}
+
+    assert conditional(make_request(current, method="HEAD"), (100, MODIFIED))[1] is not None
+    assert conditional(make_request(current, method="POST"), (100, MODIFIED))[1] is None
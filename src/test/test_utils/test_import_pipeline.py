@@ -0,0 +1,59 @@
+from benchmark.bench_import import synthetic_data
+from utils.import_pipeline import DimensionIds, ImportPipeline, copy_value, transform_card
+
+
+def test_dimension_ids_follow_first_occurrence():
+    ids = DimensionIds()
+
+    assert [ids.id_of(value) for value in ["G", "R", "G", "W"]] == [0, 1, 0, 2]
+    assert ids.rows() == [(0, "G"), (1, "R"), (2, "W")]
+
+
+def test_transform_card():
+    card = synthetic_data(1)["data"]["Card 0"][0]
+    card["hand"] = "-1"
+    card["legalities"] = {"modern": "Legal", "legacy": "Banned", "vintage": "Restricted"}
+
+    result = transform_card(card)
+
+    assert result["row"]["name"] == "Card 0"
+    assert result["row"]["hand"] == -1
+    assert result["row"]["defense"] is None
+    assert len(result["row"]["sourceHash"]) == 64
+    assert result["legalities"][:5] == (None, None, None, 1, 2)
+    assert result["legalities"][5] == 0
+    assert result["purchaseUrls"][0] == "https://example.com/0"
+
+
+def test_build_rows():
+    data = synthetic_data(50)
+    embed_cards = [{"embed_detailed": f"[{i}]", "embed_short": f"[-{i}]"} for i in range(50)]
+
+    rows = ImportPipeline(workers=1).build_rows(data, embed_cards)
+
+    columns, cards = rows["Card"]
+    assert len(cards) == 50
+    card = dict(zip(columns, cards[7]))
+    assert card["idCard"] == 7
+    assert card["embed"] == "[7]"
+    assert rows["Type"][1][card["type"]] == (card["type"], "Creature — Type7")
+    assert rows["Ruling"][1][0][0] == 0
+    assert {link[0] for link in rows["Printings"][1]} == set(range(50))
+
+
+def test_build_rows_does_not_depend_on_the_number_of_processes():
+    """The coordinator gives the ids, so the rows are the same with any number of processes"""
+    data = synthetic_data(2_500)
+    embed_cards = [{"embed_detailed": "[1]", "embed_short": "[2]"}] * 2_500
+
+    assert (
+        ImportPipeline(workers=2).build_rows(data, embed_cards)
+        == ImportPipeline(workers=1).build_rows(data, embed_cards)
+    )
+
+
+def test_copy_value():
+    assert copy_value(None) == "\\N"
+    assert copy_value(True) == "t"
+    assert copy_value(2.5) == "2.5"
+    assert copy_value("a\tb\nc\\d") == "a\\tb\\nc\\\\d"
@@ -0,0 +1,111 @@
+from unittest.mock import patch
+
+from business_object.card import Card
+from utils.reset_database import ResetDatabase, split_schema_sql
+
+
+class RecordingCursor:
+    """Cursor recording its queries, answering [rows] to the next fetch of each query"""
+
+    def __init__(self, answers):
+        self.queries = []
+        self.answers = answers
+        self.rows = []
+
+    def execute(self, query, params=None):
+        self.queries.append(query)
+        self.rows = next(
+            (rows for start, rows in self.answers.items() if query.startswith(start)), []
+        )
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+
+def test_split_schema_sql():
+    """Tables are created before the import, foreign keys and indexes after"""
+    schema_sql = (
+        'CREATE TABLE "Card" (\n  "idCard" int PRIMARY KEY\n);\n\n'
+        'ALTER TABLE "Favourite" ADD FOREIGN KEY ("idCard") REFERENCES "Card" ("idCard");\n'
+    )
+
+    tables, constraints = split_schema_sql(schema_sql)
+
+    assert tables.startswith('CREATE TABLE "Card"')
+    assert "ALTER TABLE" not in tables
+    assert constraints.startswith('ALTER TABLE "Favourite"')
+
+
+def test_split_schema_sql_without_constraints():
+    tables, constraints = split_schema_sql('CREATE TABLE "Card" ("idCard" int);\n')
+
+    assert tables == 'CREATE TABLE "Card" ("idCard" int);\n'
+    assert constraints == ""
+
+
+def test_expected_counts():
+    data = {"data": {
+        "Shock": [{"name": "Shock", "rulings": [{"date": "2020-01-01", "text": "..."}],
+                   "purchaseUrls": {"tcgplayer": "..."}}],
+        "Fire // Ice": [{"name": "Fire // Ice", "foreignData": [{}, {}]},
+                        {"name": "Fire // Ice"}]
+    }}
+
+    counts = ResetDatabase().expected_counts(data)
+
+    assert counts == {"Card": 3, "ForeignData": 2, "PurchaseURLs": 1, "Ruling": 1}
+
+
+def test_analyze_only_touches_the_shadow_schema():
+    """A plain ANALYZE would scan the live tables while the API is serving"""
+    cursor = RecordingCursor({"SELECT tablename": [{"tablename": "Card"},
+                                                   {"tablename": "CardDocument"}]})
+
+    ResetDatabase().analyze_schema(cursor, "defaultdb_shadow")
+
+    analyzes = [query for query in cursor.queries if query.startswith("ANALYZE")]
+    assert analyzes == ['ANALYZE defaultdb_shadow."Card";',
+                        'ANALYZE defaultdb_shadow."CardDocument";']
+
+
+@patch("utils.reset_database.CardDao")
+def test_swap_carries_the_cards_created_with_the_api_over(card_dao):
+    """The cards that are not in the .json, and their favourites, survive the swap"""
+    cursor = RecordingCursor({
+        "SELECT 1 FROM information_schema": [{"?column?": 1}],
+        'SELECT "idCard" FROM live."Card"': [{"idCard": 5}, {"idCard": 9}],
+        "SELECT current_setting": [{"path": "live, public"}],
+    })
+    embedded = Card(id_card=5, layout="normal", name="Homebrew", type_line="Instant",
+                    embedded=[0.1], short_embedded=[0.2])
+    pending = Card(id_card=9, layout="normal", name="Draft", type_line="Instant")
+    dao = card_dao.return_value
+    dao.read_card.side_effect = [embedded, pending]
+    dao.insert_cards.side_effect = [[101], [102]]
+
+    ResetDatabase().swap_schemas(cursor, "live", "live_shadow", "live_previous")
+
+    assert 'LOCK TABLE live."Card", live."User", live."Favourite"' in cursor.queries[1]
+    assert 'DELETE FROM live_shadow."Card" WHERE "sourceHash" IS NULL;' in cursor.queries
+    assert dao.insert_cards.call_args_list[0].kwargs["embeddings"] == [([0.1], [0.2])]
+    assert "embeddings" not in dao.insert_cards.call_args_list[1].kwargs
+    # Written in the shadow schema, then the search_path of the transaction is restored
+    paths = [query for query in cursor.queries if "search_path" in query]
+    assert paths[-2:] == ["SET LOCAL search_path TO live_shadow, public;",
+                          "SELECT set_config('search_path', %(path)s, true);"]
+    favourites = [query for query in cursor.queries if "unnest(%(old)s" in query]
+    assert len(favourites) == 1
+    assert cursor.queries[-1] == "ALTER SCHEMA live_shadow RENAME TO live;"
+
+
+def test_swap_without_api_cards_copies_no_card():
+    cursor = RecordingCursor({"SELECT 1 FROM information_schema": [{"?column?": 1}]})
+
+    with patch("utils.reset_database.CardDao") as card_dao:
+        ResetDatabase().swap_schemas(cursor, "live", "live_shadow", "live_previous")
+
+    card_dao.return_value.insert_cards.assert_not_called()
+    assert not any("unnest(%(old)s" in query for query in cursor.queries)
@@ -0,0 +1,86 @@
+import threading
+
+import pytest
+
+from utils.single_flight import SingleFlight
+
+
+def test_calls_one_after_the_other_each_compute():
+    flight = SingleFlight()
+    calls = []
+
+    assert flight.do("key", lambda: calls.append(1) or len(calls)) == 1
+    assert flight.do("key", lambda: calls.append(1) or len(calls)) == 2
+    assert flight.stats() == {"in_flight": 0, "waiting": 0, "computed": 2, "shared": 0}
+
+
+def test_concurrent_calls_share_the_result_of_the_first():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute(value):
+        calls.append(value)
+        started.set()
+        release.wait(5)
+        return [value]
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("key", compute, "a")))
+    leader.start()
+    started.wait(5)
+    followers = [
+        threading.Thread(target=lambda: results.append(flight.do("key", compute, "b")))
+        for _ in range(5)
+    ]
+    for follower in followers:
+        follower.start()
+    while flight.stats()["waiting"] < 5:
+        pass
+    assert flight.stats()["in_flight"] == 1
+    # Another key does not wait
+    assert flight.do("other", lambda: "other") == "other"
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert calls == ["a"]
+    assert results == [["a"]] * 6
+    assert all(result is results[0] for result in results)
+    assert flight.stats() == {"in_flight": 0, "waiting": 0, "computed": 2, "shared": 5}
+
+
+def test_concurrent_calls_get_the_exception():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def compute():
+        started.set()
+        release.wait(5)
+        raise ValueError("failed")
+
+    errors = []
+
+    def call():
+        try:
+            flight.do("key", compute)
+        except ValueError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=call)
+    follower.start()
+    while flight.stats()["waiting"] < 1:
+        pass
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert len(errors) == 2
+    assert errors[0] is errors[1]
+    with pytest.raises(KeyError):
+        flight.calls["key"]
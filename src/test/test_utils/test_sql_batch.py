@@ -0,0 +1,37 @@
+from unittest.mock import MagicMock
+
+from utils.sql_batch import execute_values
+
+
+def test_execute_values_sends_one_statement_per_page():
+    cursor = MagicMock()
+
+    execute_values(cursor, 'INSERT INTO "Types"("idCard", "idType") VALUES %s',
+                   [(1, 10), (1, 11), (2, 10)], page_size=2)
+
+    calls = cursor.execute.call_args_list
+    assert [call.args for call in calls] == [
+        ('INSERT INTO "Types"("idCard", "idType") VALUES (%s, %s), (%s, %s)', [1, 10, 1, 11]),
+        ('INSERT INTO "Types"("idCard", "idType") VALUES (%s, %s)', [2, 10]),
+    ]
+
+
+def test_execute_values_with_a_named_template():
+    cursor = MagicMock()
+
+    execute_values(cursor, 'INSERT INTO "Card"("idCard", "name") VALUES %s RETURNING 1',
+                   [{"name": "A", "idCard": 1}, {"name": "B", "idCard": 2}],
+                   template="(%(idCard)s, %(name)s)")
+
+    cursor.execute.assert_called_once_with(
+        'INSERT INTO "Card"("idCard", "name") VALUES (%s, %s), (%s, %s) RETURNING 1',
+        [1, "A", 2, "B"]
+    )
+
+
+def test_execute_values_without_rows_does_nothing():
+    cursor = MagicMock()
+
+    execute_values(cursor, 'INSERT INTO "Types"("idCard", "idType") VALUES %s', [])
+
+    cursor.execute.assert_not_called()
@@ -0,0 +1,103 @@
+from unittest.mock import patch
+
+from utils.import_pipeline import card_source_hash
+from utils.sync_database import SyncDatabase, card_keys, diff_cards, json_to_card
+
+
+def make_card(name, text="", side=None):
+    card = {"name": name, "layout": "normal", "type": "Instant", "types": ["Instant"],
+            "colorIdentity": [], "colors": [], "subtypes": [], "supertypes": [], "text": text}
+    if side:
+        card["side"] = side
+    return card
+
+
+def test_card_keys_separate_sides_and_homonyms():
+    """Two faces of a card and two cards with the same name get different keys"""
+    cards = [make_card("A", side="a"), make_card("A", side="b"), make_card("B"), make_card("B")]
+
+    assert card_keys(cards) == [("A", "a", 0), ("A", "b", 0), ("B", "", 0), ("B", "", 1)]
+
+
+def test_diff_cards():
+    """Only new, changed and removed cards are returned"""
+    unchanged = make_card("Unchanged", "Draw a card.")
+    changed = make_card("Changed", "Deal 3 damage.")
+    new = make_card("New")
+    new_cards = {
+        ("Unchanged", "", 0): unchanged,
+        ("Changed", "", 0): changed,
+        ("New", "", 0): new
+    }
+    current_cards = {
+        ("Unchanged", "", 0): {"idCard": 0, "sourceHash": card_source_hash(unchanged)},
+        ("Changed", "", 0): {"idCard": 1, "sourceHash": card_source_hash(make_card("Changed"))},
+        ("Removed", "", 0): {"idCard": 2, "sourceHash": "old hash"},
+        ("Created with the API", "", 0): {"idCard": 3, "sourceHash": None}
+    }
+
+    to_insert, to_update, to_delete, conflicts = diff_cards(new_cards, current_cards)
+
+    assert to_insert == [(new, card_source_hash(new))]
+    assert to_update == [(1, changed, card_source_hash(changed))]
+    assert to_delete == [2]
+    assert conflicts == []
+
+
+def test_diff_cards_never_overwrites_cards_created_with_the_api():
+    """A card of the .json with the key of a card created through the API is a conflict"""
+    card = make_card("Homebrew", "Win the game.")
+    current_cards = {("Homebrew", "", 0): {"idCard": 4, "sourceHash": None}}
+
+    to_insert, to_update, to_delete, conflicts = diff_cards(
+        {("Homebrew", "", 0): card}, current_cards
+    )
+
+    assert (to_insert, to_update, to_delete) == ([], [], [])
+    assert conflicts == [4]
+
+
+@patch("utils.sync_database.CardCache")
+@patch("utils.sync_database.notify_cards_changed")
+@patch("utils.sync_database.DBConnection")
+@patch("utils.sync_database.CardDao")
+def test_apply_writes_batches_and_notifies_once(card_dao, db_connection, notify, card_cache):
+    """The cards are written by the batched methods, and the change is notified once"""
+    dao = card_dao.return_value
+    dao.delete_cards_rows.return_value = [2]
+    dao.insert_cards.return_value = [10, 11]
+    to_insert = [(make_card("New 1"), "h1"), (make_card("New 2"), "h2")]
+    to_update = [(1, make_card("Changed", "Deal 3 damage."), "h3")]
+
+    SyncDatabase().apply(to_insert, to_update, [2], {})
+
+    dao.delete_cards_rows.assert_called_once()
+    assert dao.delete_cards_rows.call_args.kwargs["notify"] is False
+    dao.update_cards_rows.assert_called_once()
+    assert dao.update_cards_rows.call_args.kwargs["notify"] is False
+    dao.insert_cards.assert_called_once()
+    assert dao.insert_cards.call_args.kwargs["source_hashes"] == ["h1", "h2"]
+    assert dao.insert_cards.call_args.kwargs["notify"] is False
+    notify.assert_called_once()
+    assert sorted(notify.call_args.args[1]) == [1, 2, 10, 11]
+
+
+def test_source_hash_ignores_key_order():
+    """The hash only depends on the content of the card"""
+    assert card_source_hash({"a": 1, "b": 2}) == card_source_hash({"b": 2, "a": 1})
+    assert card_source_hash({"a": 1}) != card_source_hash({"a": 2})
+
+
+def test_json_to_card():
+    card = make_card("Shock", "Shock deals 2 damage to any target.")
+    card["defense"] = "4"
+    card["legalities"] = {"modern": "Legal"}
+
+    result = json_to_card(card, 12)
+
+    assert result.id_card == 12
+    assert result.name == "Shock"
+    assert result.type_line == "Instant"
+    assert result.defense == 4
+    assert result.legalities == {"modern": "Legal"}
+    assert result.hand is None
@@ -0,0 +1,125 @@
+import copy
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+from utils.singleton import Singleton
+
+MAX_BYTES = int(os.getenv("CARD_CACHE_BYTES", str(64 * 1024 * 1024)))  # 0 disables the cache
+
+
+class CardCache(metaclass=Singleton):
+    """
+    Process-local cache of the cards built by CardDao.id_search, keyed by idCard.
+
+    Cards are stored pickled: every read gets its own copy (a caller changing the Card it
+    got cannot change the cache) and the memory used is known exactly. When the pickled cards
+    go over max_bytes, the least recently read ones are evicted. The embeddings are not
+    stored (two vectors of 1024 floats are most of a pickled card, and no reader of the cache
+    uses them): the cached cards have None instead.
+
+    The writes of CardDao invalidate the cards they changed once they are committed. A read
+    that started before an invalidation does not store its result: it may come from before
+    the write.
+
+    Attributes
+    ----------
+    hits : int
+        Number of cards found in the cache
+    misses : int
+        Number of cards that had to be read from the database
+    evictions : int
+        Number of cards evicted to stay under max_bytes
+    generation : int
+        Incremented by every invalidation, see put
+    """
+
+    def __init__(self, max_bytes: int = MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def get(self, id_card: int):
+        """Returns a copy of the cached card, None if it is not in the cache"""
+        with self.lock:
+            data = self.entries.get(id_card)
+            if data is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(id_card)
+            self.hits += 1
+        return pickle.loads(data)
+
+    def put(self, id_card: int, card, generation: int) -> None:
+        """
+        Stores a card read from the database
+
+        Parameters
+        ----------
+        id_card : int
+            The id of the card
+        card : Card
+            The card
+        generation : int
+            The value of self.generation before the card was read: if a card was invalidated
+            since, the card may be out of date and is not stored
+        """
+        card = copy.copy(card)
+        card._embedded = card._short_embedded = None
+        data = pickle.dumps(card, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+        with self.lock:
+            if generation != self.generation:
+                return
+            self._remove(id_card)
+            self.entries[id_card] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def invalidate(self, ids: list[int]) -> None:
+        """Removes cards from the cache, after they were changed or deleted"""
+        with self.lock:
+            self.generation += 1
+            for id_card in ids:
+                self._remove(id_card)
+
+    def clear(self) -> None:
+        """Empties the cache, after a reset or a sync of the whole database"""
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+            self.size = 0
+
+    def _remove(self, id_card: int) -> None:
+        data = self.entries.pop(id_card, None)
+        if data is not None:
+            self.size -= len(data)
+
+    @property
+    def hit_rate(self) -> float:
+        """Share of the reads served by the cache"""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        """Number of cached cards, memory used and hit rate"""
+        with self.lock:
+            return {
+                "cards": len(self.entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hit_rate
+            }
@@ -0,0 +1,151 @@
+import logging
+import os
+import threading
+
+from db_connection import DBConnection
+from utils.card_cache import CardCache
+from utils.data_version import DataVersion
+from utils.singleton import Singleton
+
+CHANNEL = "card_changed"
+ALL_CARDS = "*"  # Payload sent when any card may have changed (reset of the database)
+POLL_INTERVAL = 1.0  # Longest wait (s) before the listener checks if it must stop
+RECONNECT_DELAY = float(os.getenv("CARD_LISTENER_RECONNECT", "5"))
+
+
+# Bumps the version of the data (see DataVersion): it only goes up, even after a reset or a
+# rollback of the schema, since it is at least the current time in microseconds. The row stays
+# locked until the commit, so the versions are committed, and notified, in order.
+BUMP_VERSION = """
+    UPDATE "DataVersion" SET
+        "version" = GREATEST(
+            "version" + 1, (extract(epoch FROM clock_timestamp()) * 1000000)::bigint
+        ),
+        "updatedAt" = now()
+    RETURNING "version"
+"""
+
+
+def notify_cards_changed(cursor, ids: list[int] | None) -> None:
+    """
+    Tells every process of the API that cards changed, with a NOTIFY card_changed per card
+    whose payload is "<idCard>:<version>", and bumps the version of the data.
+    Postgres only delivers the notifications once the transaction of the cursor is committed,
+    and drops them with a rolled back transaction or savepoint.
+
+    Parameters
+    ----------
+    cursor : cursor
+        The cursor of the transaction writing the cards
+    ids : list[int] | None
+        The ids of the changed or deleted cards, None when any card may have changed
+    """
+    if ids is None:
+        cursor.execute(
+            f"WITH v AS ({BUMP_VERSION}) "
+            "SELECT pg_notify(%(channel)s, %(all)s || ':' || v.\"version\") FROM v",
+            {"channel": CHANNEL, "all": ALL_CARDS}
+        )
+    elif ids:
+        cursor.execute(
+            f"WITH v AS ({BUMP_VERSION}) "
+            "SELECT pg_notify(%(channel)s, id::text || ':' || v.\"version\") "
+            "FROM v, unnest(%(ids)s::int[]) AS id",
+            {"channel": CHANNEL, "ids": list(ids)}
+        )
+
+
+def evict_card_cache(ids: list[int] | None) -> None:
+    """Removes the changed cards from the CardCache of this process"""
+    if ids is None:
+        CardCache().clear()
+    else:
+        CardCache().invalidate(ids)
+
+
+class CardChangeListener(metaclass=Singleton):
+    """
+    Listens to the card_changed channel in a background thread, on its own connection, and
+    evicts the changed cards from the caches of this process: every uvicorn worker runs one,
+    so a write made through any of them reaches all the others.
+
+    The caches to evict from are callbacks, given the list of changed ids, or None when any
+    card may have changed; the CardCache is always one of them, other caches use subscribe.
+    Notifications sent while the listener is disconnected are lost: the caches are emptied
+    every time it (re)connects.
+
+    The versions of the notifications are given to DataVersion, which the HTTP cache headers
+    of the card endpoints come from.
+    """
+
+    def __init__(self):
+        self.callbacks = [evict_card_cache]
+        self.connection = None
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.received = 0
+
+    def subscribe(self, callback) -> None:
+        """Adds a cache to evict from, see the class docstring"""
+        if callback not in self.callbacks:
+            self.callbacks.append(callback)
+
+    def dispatch(self, payload: str) -> None:
+        """Calls every callback for the payload of a notification"""
+        card, _, version = payload.partition(":")
+        ids = None if card == ALL_CARDS else [int(card)]
+        for callback in self.callbacks:
+            try:
+                callback(ids)
+            except Exception as e:
+                logging.error(f"Card cache eviction error: {e}")
+        if version:
+            DataVersion().update(ids, int(version))
+
+    def listen(self) -> None:
+        """Listens to the channel and dispatches the notifications until stop is called"""
+        self.connection = DBConnection().new_connection()
+        # LISTEN takes effect on commit, and the notifications arrive between transactions
+        self.connection.autocommit = True
+        self.connection.execute(f"LISTEN {CHANNEL}")
+        # Read after LISTEN: every later version is notified
+        DataVersion().load(self.connection)
+        self.dispatch(ALL_CARDS)
+        while not self.stop_event.is_set():
+            for notify in self.connection.notifies(timeout=POLL_INTERVAL):
+                self.received += 1
+                self.dispatch(notify.payload)
+                if self.stop_event.is_set():
+                    break
+
+    def loop(self) -> None:
+        while not self.stop_event.is_set():
+            try:
+                self.listen()
+            except Exception as e:
+                logging.error(f"Card listener error: {e}")
+                self.close()
+                self.stop_event.wait(RECONNECT_DELAY)
+        self.close()
+
+    def close(self) -> None:
+        # Without the notifications, the versions known are not up to date anymore
+        DataVersion().forget()
+        if self.connection is not None and not self.connection.closed:
+            self.connection.close()
+        self.connection = None
+
+    def start(self) -> None:
+        """Starts listening in a background thread"""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.loop, name="card-listener", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Stops listening, within POLL_INTERVAL seconds"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
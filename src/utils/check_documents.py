@@ -0,0 +1,94 @@
+import datetime
+import random
+import sys
+
+from dao.card_dao import CardDao
+from db_connection import DBConnection
+from utils.singleton import Singleton
+
+MAX_REPORTED = 20  # Number of different cards printed in full
+
+
+def normalize(value):
+    """
+    Puts a card as JSON in a comparable form: dates as strings. The lists are compared as
+    they are: the documents and CardDao.read_card sort them the same way.
+    """
+    if isinstance(value, dict):
+        return {key: normalize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [normalize(item) for item in value]
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return value
+
+
+def compare_document(document: dict, card: dict) -> list[str]:
+    """
+    Compares a document of "CardDocument" with the same card built by Card.show_card
+
+    Returns
+    -------
+    list[str]
+        The keys whose values are different, empty if the document is right
+    """
+    document = normalize(document)
+    card = normalize(card)
+    return sorted(
+        key for key in document.keys() | card.keys() if document.get(key) != card.get(key)
+    )
+
+
+class CheckDocuments(metaclass=Singleton):
+    """
+    Consistency check of "CardDocument": every document must be equal to the card built from
+    the tables by CardDao.read_card then Card.show_card
+    """
+    def start(self, sample: int = None) -> dict:
+        """
+        Compares the documents with the cards
+
+        Parameters:
+        -----------
+        sample : int
+            Number of cards picked at random, None to check all of them
+
+        Returns
+        -------
+        dict
+            Number of checked cards, missing documents and different documents
+        """
+        with DBConnection().connection as connection:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT "idCard" FROM "Card" ORDER BY "idCard" ASC')
+                ids = [row["idCard"] for row in cursor.fetchall()]
+        if sample is not None and sample < len(ids):
+            ids = sorted(random.sample(ids, sample))
+
+        card_dao = CardDao()
+        missing = []
+        different = {}
+        for id_card in ids:
+            document = card_dao.get_document(id_card)
+            card = card_dao.read_card(id_card)
+            if card is None:
+                continue
+            if document is None:
+                missing.append(id_card)
+                continue
+            keys = compare_document(document, card.show_card())
+            if keys:
+                different[id_card] = keys
+
+        for id_card, keys in list(different.items())[:MAX_REPORTED]:
+            print(f"Card {id_card}: {', '.join(keys)} differ")
+        report = {"checked": len(ids), "missing": len(missing), "different": len(different)}
+        print(report)
+        return report
+
+
+if __name__ == "__main__":
+    # python check_documents.py [number of cards picked at random]
+    sample = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    report = CheckDocuments().start(sample)
+    sys.exit(1 if report["missing"] or report["different"] else 0)
@@ -0,0 +1,262 @@
+import gzip
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from utils.singleton import Singleton
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional: without it, zstd is not offered
+    zstandard = None
+try:
+    import brotli
+except ImportError:  # brotli is optional: without it, br is not offered
+    brotli = None
+
+MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))  # Smaller bodies are sent as they are
+CACHE_BYTES = int(os.getenv("COMPRESSED_CACHE_BYTES", str(16 * 1024 * 1024)))  # 0 disables it
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+# Levels used for every response, and for the bodies compressed once then cached
+LEVELS = {"zstd": 3, "br": 4, "gzip": 6}
+BEST_LEVELS = {"zstd": 19, "br": 11, "gzip": 9}
+
+
+def available_encodings() -> list[str]:
+    """The encodings this process can send, from the most to the least preferred"""
+    encodings = []
+    if zstandard is not None:
+        encodings.append("zstd")
+    if brotli is not None:
+        encodings.append("br")
+    encodings.append("gzip")
+    return encodings
+
+
+def choose_encoding(accept_encoding: str | None) -> str | None:
+    """
+    The encoding to use for a request, from its Accept-Encoding header: the preferred one of
+    available_encodings among those accepted (q > 0), None to send the body as it is
+    """
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in available_encodings():
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(data: bytes, encoding: str, best: bool = False) -> bytes:
+    """Compresses [data] with [encoding], at the level of BEST_LEVELS if [best]"""
+    level = (BEST_LEVELS if best else LEVELS)[encoding]
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    if encoding == "br":
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+class CompressionStats(metaclass=Singleton):
+    """
+    Bytes before and after compression (on the wire) and CPU time spent compressing, by
+    encoding. The responses served by the CompressedCache count without CPU time.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.encodings = {}
+        self.uncompressed = 0  # Responses sent as they are (too small or not accepted)
+
+    def record(self, encoding: str, size: int, compressed_size: int, cpu: float) -> None:
+        with self.lock:
+            stats = self.encodings.setdefault(
+                encoding, {"responses": 0, "bytes": 0, "bytes_on_wire": 0, "cpu_seconds": 0.0}
+            )
+            stats["responses"] += 1
+            stats["bytes"] += size
+            stats["bytes_on_wire"] += compressed_size
+            stats["cpu_seconds"] += cpu
+
+    def record_uncompressed(self) -> None:
+        with self.lock:
+            self.uncompressed += 1
+
+    def stats(self) -> dict:
+        """Totals, compression ratio and mean cost per response of every encoding"""
+        with self.lock:
+            encodings = {}
+            for encoding, stats in self.encodings.items():
+                encodings[encoding] = {
+                    **stats,
+                    "ratio": stats["bytes_on_wire"] / stats["bytes"] if stats["bytes"] else 0.0,
+                    "bytes_on_wire_per_response": stats["bytes_on_wire"] / stats["responses"],
+                    "cpu_ms_per_response": 1000 * stats["cpu_seconds"] / stats["responses"],
+                }
+            return {"uncompressed_responses": self.uncompressed, "encodings": encodings}
+
+
+class CompressedCache(metaclass=Singleton):
+    """
+    Compressed bodies of the responses that depend on a version of the data (see DataVersion),
+    compressed once at BEST_LEVELS: they are only compressed again once their version changed.
+    The least recently used bodies are evicted over max_bytes.
+    """
+
+    def __init__(self, max_bytes: int = CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get_or_compress(
+        self, key: tuple, version: int, encoding: str, load
+    ) -> tuple[bytes, bool]:
+        """
+        The body of a response, compressed with [encoding] if it is large enough
+
+        Parameters
+        ----------
+        key : tuple
+            What identifies the response
+        version : int
+            The version of the data of the response: a body cached for another version is not
+            used
+        encoding : str
+            The encoding accepted by the client, see choose_encoding
+        load : function
+            Returns the uncompressed body (bytes, or None which is returned as it is), called
+            when the body is not in the cache
+
+        Returns
+        -------
+        tuple[bytes, bool]
+            The body, and True if it is compressed with [encoding]
+        """
+        entry_key = (key, encoding)
+        with self.lock:
+            entry = self.entries.get(entry_key)
+            if entry is not None and entry[0] == version:
+                self.entries.move_to_end(entry_key)
+                self.hits += 1
+                CompressionStats().record(encoding, entry[2], len(entry[1]), 0.0)
+                return entry[1], True
+            self.misses += 1
+
+        data = load()
+        if data is None or len(data) < MIN_SIZE:
+            CompressionStats().record_uncompressed()
+            return data, False
+        start = time.thread_time()
+        body = compress(data, encoding, best=True)
+        CompressionStats().record(encoding, len(data), len(body), time.thread_time() - start)
+
+        if len(body) <= self.max_bytes:
+            with self.lock:
+                previous = self.entries.pop(entry_key, None)
+                if previous is not None:
+                    self.size -= len(previous[1])
+                self.entries[entry_key] = (version, body, len(data))
+                self.size += len(body)
+                while self.size > self.max_bytes:
+                    _, evicted = self.entries.popitem(last=False)
+                    self.size -= len(evicted[1])
+        return body, True
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        """Number of cached bodies, memory used, hits and misses"""
+        with self.lock:
+            return {
+                "bodies": len(self.entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing the JSON and text responses of at least minimum_size bytes
+    with the encoding chosen from the Accept-Encoding of the request. Responses that already
+    have a Content-Encoding (see CompressedCache) and streamed responses are sent as they are.
+    The other JSON and text responses get Vary: Accept-Encoding, even when they are sent
+    uncompressed (too small, or not accepted by the client), so that a shared cache keeps
+    the variants apart. Compressed responses get a Server-Timing header with the time spent
+    compressing.
+    """
+
+    def __init__(self, app, minimum_size: int = MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding"))
+
+        start_message = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            # First part of the body: the whole body unless more_body is set
+            passthrough = True
+            headers = MutableHeaders(raw=start_message["headers"])
+            body = message.get("body", b"")
+            content_type = headers.get("content-type", "")
+            if (
+                message.get("more_body", False)
+                or "content-encoding" in headers
+                or not content_type.startswith(COMPRESSIBLE_TYPES)
+            ):
+                await send(start_message)
+                await send(message)
+                return
+            headers.add_vary_header("Accept-Encoding")
+            if encoding is None or len(body) < self.minimum_size:
+                CompressionStats().record_uncompressed()
+                await send(start_message)
+                await send(message)
+                return
+
+            start = time.thread_time()
+            compressed = compress(body, encoding)
+            cpu = time.thread_time() - start
+            CompressionStats().record(encoding, len(body), len(compressed), cpu)
+
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            headers.append("Server-Timing", f"compress;dur={1000 * cpu:.3f}")
+            await send(start_message)
+            await send({**message, "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
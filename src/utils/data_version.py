@@ -0,0 +1,76 @@
+import datetime
+import threading
+
+from utils.singleton import Singleton
+
+
+class DataVersion(metaclass=Singleton):
+    """
+    Versions of the cards known by this process, which the ETag and Last-Modified headers of
+    the card endpoints are built from.
+
+    Every write to the cards bumps the row of the "DataVersion" table in its transaction and
+    notifies the new version with the ids of the cards (see notify_cards_changed). The
+    CardChangeListener loads the row when it connects, then gives every notified version to
+    update: checking that the copy of a client is current never reads the database.
+
+    The version of a card is the version of its last change notified since the load, or the
+    version loaded. It is not the same in every process, but two different contents of a card
+    never get the same version. While the listener is not connected, no version is known.
+    Modification times are those of the row loaded, then of the notifications received.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loaded = None  # (version, modified) when the listener connected
+        self.latest = None  # (version, modified) of the last change of any card
+        self.cards = {}  # idCard -> (version, modified), for the cards changed since the load
+
+    def load(self, connection) -> None:
+        """Reads the version of the data, with the connection of the listener"""
+        row = connection.execute('SELECT "version", "updatedAt" FROM "DataVersion"').fetchone()
+        with self.lock:
+            self.cards.clear()
+            self.loaded = self.latest = (row["version"], row["updatedAt"]) if row else None
+
+    def update(self, ids: list[int] | None, version: int) -> None:
+        """
+        Records a notified change
+
+        Parameters
+        ----------
+        ids : list[int] | None
+            The ids of the changed cards, None when any card may have changed
+        version : int
+            The version of the data written by the change
+        """
+        modified = datetime.datetime.now(datetime.timezone.utc)
+        with self.lock:
+            if self.loaded is None:
+                return
+            if ids is None:
+                self.cards.clear()
+                self.loaded = (version, modified)
+            else:
+                for id_card in ids:
+                    self.cards[id_card] = (version, modified)
+            if version >= self.latest[0]:
+                self.latest = (version, modified)
+
+    def forget(self) -> None:
+        """Forgets the versions, when the notifications stop arriving"""
+        with self.lock:
+            self.cards.clear()
+            self.loaded = self.latest = None
+
+    def card(self, id_card: int) -> tuple | None:
+        """(version, modified) of a card, None if unknown"""
+        with self.lock:
+            if self.loaded is None:
+                return None
+            return self.cards.get(id_card, self.loaded)
+
+    def all_cards(self) -> tuple | None:
+        """(version, modified) of the responses built from any card (searches), None if unknown"""
+        with self.lock:
+            return self.latest
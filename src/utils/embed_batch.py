@@ -3,17 +3,29 @@ import csv
 import requests
 import os
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from utils.embed_cache import EmbeddingCache
 
 token = os.getenv("API_TOKEN")
 
-url = "https://llm.lab.sspcloud.fr/ollama/api/embed"
+url = os.getenv("EMBED_API_URL", "https://llm.lab.sspcloud.fr/ollama/api/embed")
 headers = {
     "Authorization": f"Bearer {token}",
     "Content-type": "application/json"
 }
 
+MODEL = "bge-m3:latest"
+EMBED_DIMENSION = 1024
 
-BATCH_SIZE = 1_000  # Nombre de cartes à traiter en une seule requête
+BATCH_SIZE = 1_000  # Taille initiale d'un batch (nombre de textes par requête)
+MIN_BATCH_SIZE = 16
+MAX_BATCH_SIZE = 4_000
+MAX_WORKERS = int(os.getenv("EMBED_WORKERS", "4"))  # Nombre de requêtes en vol en même temps
+TARGET_LATENCY = 30.0  # Au-delà (en secondes), on réduit la taille des batchs
+RETRY_DELAY = 0.5  # Pause avant de renvoyer les deux moitiés d'un batch échoué
+CSV_CHUNK_SIZE = 1_000  # Nombre de cartes relues dans le cache à la fois pour écrire le .csv
 
 
 def embedding_batch(texts: list[str]) -> list[list]:
@@ -21,7 +33,7 @@ def embedding_batch(texts: list[str]) -> list[list]:
     Envoie plusieurs textes à l'API en une seule requête
     """
     data = {
-        "model": "bge-m3:latest",
+        "model": MODEL,
         "input": texts
     }
 
@@ -35,6 +47,171 @@ def embedding_batch(texts: list[str]) -> list[list]:
     return json_response["embeddings"]
 
 
+class AdaptiveBatchSize:
+    """
+    Taille de batch partagée entre les workers, ajustée selon la latence et les erreurs
+    observées : elle augmente petit à petit tant que les requêtes sont rapides, et elle est
+    divisée par deux dès qu'une requête échoue ou dépasse la latence cible.
+    """
+
+    def __init__(
+        self,
+        initial: int = BATCH_SIZE,
+        minimum: int = MIN_BATCH_SIZE,
+        maximum: int = MAX_BATCH_SIZE,
+        target_latency: float = TARGET_LATENCY
+    ):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self._step = max(1, initial // 10)
+        self._value = min(max(initial, minimum), maximum)
+        self._lock = threading.Lock()
+
+    @property
+    def value(self) -> int:
+        with self._lock:
+            return self._value
+
+    def record_success(self, latency: float) -> None:
+        """Un batch a réussi en [latency] secondes"""
+        with self._lock:
+            if latency > self.target_latency:
+                self._value = max(self.minimum, self._value // 2)
+            else:
+                self._value = min(self.maximum, self._value + self._step)
+
+    def record_failure(self) -> None:
+        """Un batch a échoué (erreur HTTP, timeout, réponse incomplète)"""
+        with self._lock:
+            self._value = max(self.minimum, self._value // 2)
+
+
+def embed_with_bisection(
+    texts: list[str], sizer: AdaptiveBatchSize | None, retry_delay: float = RETRY_DELAY
+) -> tuple[list[list], int]:
+    """
+    Calcule les embeddings d'un batch. Si la requête échoue, le batch est coupé en deux et
+    chaque moitié est renvoyée, jusqu'à isoler les textes qui posent problème : ceux-là
+    reçoivent un vecteur nul, comme avant.
+
+    Seul le batch de départ est compté dans [sizer] : les moitiés renvoyées sont appelées avec
+    sizer=None, pour qu'un texte en erreur ne divise pas la taille des batchs à chaque coupe.
+
+    Returns:
+    --------
+    tuple[list[list], int]
+        Les embeddings, dans l'ordre de [texts], et le nombre de textes en échec
+    """
+    start = time.perf_counter()
+    try:
+        embeddings = embedding_batch(texts)
+    except (requests.RequestException, ValueError, KeyError) as e:
+        # ValueError / KeyError : réponse 200 dont le JSON est invalide ou incomplet
+        print(f"Erreur sur un batch de {len(texts)} textes : {e!r}")
+        embeddings = None
+
+    if embeddings is not None and len(embeddings) == len(texts):
+        if sizer is not None:
+            sizer.record_success(time.perf_counter() - start)
+        return embeddings, 0
+
+    if sizer is not None:
+        sizer.record_failure()
+    if len(texts) == 1:
+        return [[0] * EMBED_DIMENSION], 1
+
+    time.sleep(retry_delay)
+    middle = len(texts) // 2
+    first_half, first_failed = embed_with_bisection(texts[:middle], None, retry_delay)
+    second_half, second_failed = embed_with_bisection(texts[middle:], None, retry_delay)
+    return first_half + second_half, first_failed + second_failed
+
+
+def embed_texts(
+    texts: list[str],
+    on_result,
+    workers: int = MAX_WORKERS,
+    sizer: AdaptiveBatchSize = None,
+    retry_delay: float = RETRY_DELAY
+) -> dict:
+    """
+    Calcule les embeddings de [texts] en gardant [workers] requêtes en vol en même temps.
+    La taille de chaque nouveau batch est lue dans [sizer] au moment de son envoi.
+
+    Parameters:
+    -----------
+    texts: list[str]
+        Les textes à transformer en embeddings
+    on_result: Callable[[int, list[list]], None]
+        Appelée (depuis le thread appelant) à chaque batch terminé, avec l'indice dans [texts]
+        du premier texte du batch et ses embeddings. Les batchs peuvent finir dans le désordre.
+    workers: int
+        Nombre maximal de requêtes simultanées
+
+    Returns:
+    --------
+    dict
+        Statistiques du run : nombre de textes, textes en échec, durée et débit
+    """
+    sizer = sizer or AdaptiveBatchSize()
+    start_time = time.perf_counter()
+    position = 0
+    done = 0
+    failed = 0
+    in_flight = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while position < len(texts) or in_flight:
+            while position < len(texts) and len(in_flight) < workers:
+                batch = texts[position:position + sizer.value]
+                future = executor.submit(embed_with_bisection, batch, sizer, retry_delay)
+                in_flight[future] = position
+                position += len(batch)
+
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                batch_start = in_flight.pop(future)
+                embeddings, batch_failed = future.result()
+                failed += batch_failed
+                done += len(embeddings)
+                on_result(batch_start, embeddings)
+
+            elapsed = time.perf_counter() - start_time
+            print(
+                f"   {done / len(texts) * 100:.1f}% - {done}/{len(texts)} textes "
+                f"({done / elapsed:.1f} textes/s, batch de {sizer.value})"
+            )
+
+    elapsed = time.perf_counter() - start_time
+    return {
+        "texts": len(texts),
+        "failed": failed,
+        "seconds": elapsed,
+        "texts_per_second": len(texts) / elapsed if elapsed else 0.0
+    }
+
+
+def embed_missing(texts: list[str], cache: EmbeddingCache, workers: int = MAX_WORKERS) -> dict:
+    """
+    Calcule uniquement les embeddings des textes absents de [cache], et les y ajoute au fur et
+    à mesure que les batchs se terminent
+
+    Returns:
+    --------
+    dict
+        Statistiques du run (voir embed_texts), pour les seuls textes recalculés
+    """
+    missing = cache.missing(texts)
+    if not missing:
+        return {"texts": 0, "failed": 0, "seconds": 0.0, "texts_per_second": 0.0}
+
+    def store(start, embeddings):
+        cache.put_many(missing[start:start + len(embeddings)], embeddings)
+
+    return embed_texts(missing, store, workers=workers)
+
+
 def card_to_text_short(card: dict) -> str:
     """
     Convertit une carte en texte court : [name] : [description]
@@ -110,78 +287,39 @@ if __name__ == "__main__":
     print(f"{len(cards)} cartes chargées")
     print("FO1a : Génération de deux embeddings par carte (short + detailed)")
 
+    # Les textes sont rangés par paires (short, detailed) pour chaque carte
+    texts = []
+    for card in cards:
+        texts.append(card_to_text_short(card))
+        texts.append(card_to_text_detailed(card))
+
+    start_time = time.perf_counter()
+    cache = EmbeddingCache(MODEL)
+    stats = embed_missing(texts, cache)
+    print(
+        f"Cache : {cache.hits} textes réutilisés, {cache.misses} textes calculés "
+        f"({cache.hit_rate:.1%} de hits), {stats['failed']} textes en échec"
+    )
+
+    # Tous les embeddings sont maintenant dans le cache : on les relit par morceaux
+    zero_embedding = json.dumps([0] * EMBED_DIMENSION)
     with open("cards_with_embeddings.csv", "w", newline="", encoding="utf-8") as f:
         writer = csv.writer(f)
         writer.writerow(["id", "embed_short", "embed_detailed"])
 
-        idCard = 0
-        total_batches = (len(cards) + BATCH_SIZE - 1) // BATCH_SIZE
-
-        for batch_num in range(total_batches):
-            start_idx = batch_num * BATCH_SIZE
-            end_idx = min(start_idx + BATCH_SIZE, len(cards))
-            batch_cards = cards[start_idx:end_idx]
-
-            # Convertir toutes les cartes du batch en textes (short and detailed)
-            batch_texts = []
-            for card in batch_cards:
-                batch_texts.append(card_to_text_short(card))      # Texte court
-                batch_texts.append(card_to_text_detailed(card))   # Texte détaillé
-
-            try:
-                batch_embeddings = embedding_batch(batch_texts)
-
-                if batch_embeddings:
-                    # Écrire les embeddings par paires (short, detailed)
-                    for i in range(len(batch_cards)):
-                        embed_short = batch_embeddings[i * 2]      # Indices pairs
-                        embed_detailed = batch_embeddings[i * 2 + 1]  # Indices impairs
-                        writer.writerow([
-                            idCard,
-                            json.dumps(embed_short),
-                            json.dumps(embed_detailed)
-                        ])
-                        idCard += 1
-                else:
-                    # Si le batch échoue, traiter carte par carte (fallback)
-                    print(f"Batch {batch_num+1}/{total_batches} échoué, traitement individuel...")
-                    for card in batch_cards:
-                        text_short = card_to_text_short(card)
-                        text_detailed = card_to_text_detailed(card)
-                        emb = embedding_batch([text_short, text_detailed])
-                        if emb and len(emb) == 2:
-                            writer.writerow([idCard, json.dumps(emb[0]), json.dumps(emb[1])])
-                        else:
-                            writer.writerow(
-                                [idCard, json.dumps([0] * 1024), json.dumps([0] * 1024)]
-                            )
-                        idCard += 1
-                        time.sleep(0.5)
-
-            except Exception as e:
-                print(f"Erreur batch {batch_num+1}/{total_batches}: {e}")
-                # Fallback individuel
-                for card in batch_cards:
-                    try:
-                        text_short = card_to_text_short(card)
-                        text_detailed = card_to_text_detailed(card)
-                        emb = embedding_batch([text_short, text_detailed])
-                        if emb and len(emb) == 2:
-                            writer.writerow([idCard, json.dumps(emb[0]), json.dumps(emb[1])])
-                        else:
-                            writer.writerow(
-                                [idCard, json.dumps([0] * 1024), json.dumps([0] * 1024)]
-                            )
-                    except Exception:
-                        writer.writerow([idCard, json.dumps([0] * 1024), json.dumps([0] * 1024)])
-                    idCard += 1
-                    time.sleep(0.5)
-
-            # Afficher la progression
-            if (batch_num + 1) % 10 == 0 or batch_num == total_batches - 1:
-                progress = (batch_num + 1) / total_batches * 100
-                print(f"   {progress:.1f}% - {idCard}/{len(cards)} cartes traitées")
-
-            time.sleep(0.5)  # Petit délai entre les batches
-
-    print(f"\nTerminé ! {idCard} cartes avec 2 embeddings chacune dans cards_with_embeddings.csv")
+        for first_card in range(0, len(cards), CSV_CHUNK_SIZE):
+            chunk_texts = texts[2 * first_card:2 * (first_card + CSV_CHUNK_SIZE)]
+            embeddings = cache.get_many(chunk_texts)
+            for i in range(0, len(chunk_texts), 2):
+                writer.writerow([
+                    first_card + i // 2,
+                    embeddings.get(chunk_texts[i], zero_embedding),
+                    embeddings.get(chunk_texts[i + 1], zero_embedding)
+                ])
+    cache.close()
+
+    elapsed = time.perf_counter() - start_time
+    print(
+        f"\nTerminé ! {len(cards)} cartes avec 2 embeddings chacune dans "
+        f"cards_with_embeddings.csv en {elapsed:.1f}s ({len(cards) / elapsed:.1f} cartes/s)"
+    )
@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import sqlite3
+
+CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "embeddings_cache.sqlite")
+CHUNK_SIZE = 500  # Nombre de clés par requête SQLite (limite des paramètres)
+
+
+class EmbeddingCache:
+    """
+    Cache persistant des embeddings déjà calculés.
+    La clé est un hash du texte exact envoyé à l'API et du nom du modèle : un texte qui n'a pas
+    changé entre deux versions de AtomicCards.json n'est donc jamais recalculé.
+
+    Attributes
+    ----------
+    hits : int
+        Nombre de textes trouvés dans le cache depuis la création de l'objet
+    misses : int
+        Nombre de textes absents du cache depuis la création de l'objet
+    """
+
+    def __init__(self, model: str, path: str = CACHE_PATH):
+        self.model = model
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS embedding (key TEXT PRIMARY KEY, embedding TEXT NOT NULL)"
+        )
+
+    def key(self, text: str) -> str:
+        """Clé du cache pour [text] avec le modèle du cache"""
+        return hashlib.sha256(f"{self.model}\n{text}".encode("utf-8")).hexdigest()
+
+    def _select(self, texts: list[str]) -> dict:
+        """Renvoie {texte: embedding en JSON} pour les textes présents dans le cache"""
+        keys = {}
+        for text in texts:
+            keys[self.key(text)] = text
+
+        found = {}
+        key_list = list(keys)
+        for start in range(0, len(key_list), CHUNK_SIZE):
+            chunk = key_list[start:start + CHUNK_SIZE]
+            placeholders = ", ".join("?" * len(chunk))
+            rows = self.connection.execute(
+                f"SELECT key, embedding FROM embedding WHERE key IN ({placeholders})", chunk
+            )
+            for key, embedding in rows:
+                found[keys[key]] = embedding
+        return found
+
+    def missing(self, texts: list[str]) -> list[str]:
+        """
+        Renvoie les textes (sans doublons, dans l'ordre) qui ne sont pas encore dans le cache,
+        et met à jour les compteurs hits/misses
+
+        Parameters:
+        -----------
+        texts: list[str]
+            Les textes dont on veut les embeddings
+        """
+        unique_texts = list(dict.fromkeys(texts))
+        found = self._select(unique_texts)
+        missing = [text for text in unique_texts if text not in found]
+        self.hits += len(unique_texts) - len(missing)
+        self.misses += len(missing)
+        return missing
+
+    def get_many(self, texts: list[str]) -> dict:
+        """
+        Renvoie {texte: embedding en JSON} pour les textes de [texts] présents dans le cache
+        """
+        return self._select(list(dict.fromkeys(texts)))
+
+    def put_many(self, texts: list[str], embeddings: list[list]) -> None:
+        """
+        Ajoute les embeddings calculés au cache. Les vecteurs nuls (textes en échec) ne sont
+        pas gardés, pour qu'ils soient recalculés au prochain run.
+        """
+        rows = [
+            (self.key(text), json.dumps(embed))
+            for text, embed in zip(texts, embeddings)
+            if any(embed)
+        ]
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO embedding (key, embedding) VALUES (?, ?)", rows
+        )
+        self.connection.commit()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def close(self) -> None:
+        self.connection.close()
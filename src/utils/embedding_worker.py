@@ -0,0 +1,221 @@
+import logging
+import os
+import threading
+
+import numpy as np
+
+from business_object.card import Card
+from dao.card_dao import CardDao
+from db_connection import DBConnection
+from utils.card_cache import CardCache
+from utils.card_listener import notify_cards_changed
+from utils.embed_batch import embedding_batch
+from utils.singleton import Singleton
+from utils.sql_batch import execute_values
+
+BATCH_SIZE = int(os.getenv("EMBEDDING_JOB_BATCH", "64"))  # Cartes traitées par requête à l'API
+INTERVAL = float(os.getenv("EMBEDDING_JOB_INTERVAL", "2"))  # Pause (s) quand la file est vide
+MAX_ATTEMPTS = 5  # Au-delà, le job reste dans la table mais n'est plus repris
+# Durée (s) pendant laquelle un job pris par un worker n'est pas repris par un autre, au-delà
+# du timeout de l'API (le worker qui l'a pris s'est sans doute arrêté en route)
+CLAIM_TIMEOUT = float(os.getenv("EMBEDDING_JOB_CLAIM_TIMEOUT", "600"))
+
+
+class EmbeddingWorker(metaclass=Singleton):
+    """
+    Calcule en arrière-plan les embeddings des cartes créées ou modifiées par l'API.
+
+    Les écritures de CardDao ne font plus d'appel à l'API d'embeddings : elles laissent
+    "embed" et "shortEmbed" à NULL et ajoutent la carte à la table "EmbeddingJob", dans la
+    même transaction. Un lot est traité en trois temps, l'appel à l'API ayant lieu hors de
+    toute transaction :
+
+    - le worker réserve des jobs ("claimedAt") avec FOR UPDATE SKIP LOCKED (plusieurs workers
+      peuvent donc tourner en même temps), lit leur "enqueuedAt" et le texte des cartes ;
+    - il envoie une seule requête à l'API pour tout le lot ;
+    - il verrouille les jobs puis les cartes, et n'écrit les embeddings (et ne supprime le job)
+      que des cartes dont le job a toujours le même "enqueuedAt" et dont le texte n'a pas
+      changé. Une carte modifiée entre-temps a été remise dans la file (voir
+      CardDao.enqueue_embedding) : son job reste, pour le nouveau texte.
+    """
+
+    def __init__(self):
+        self.connection = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def run_once(self, batch_size: int = BATCH_SIZE) -> int:
+        """
+        Traite un lot de jobs
+
+        Parameters:
+        -----------
+        batch_size : int
+            Nombre maximal de cartes du lot
+
+        Returns
+        -------
+        int
+            Nombre de cartes dont les embeddings ont été écrits
+        """
+        if self.connection is None or self.connection.closed:
+            self.connection = DBConnection().new_connection()
+
+        card_dao = CardDao()
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute(
+                    """
+                    UPDATE "EmbeddingJob" j
+                    SET "claimedAt" = now(), "attempts" = j."attempts" + 1
+                    FROM (
+                        SELECT "idCard" FROM "EmbeddingJob"
+                        WHERE "attempts" < %(max)s
+                          AND ("claimedAt" IS NULL
+                               OR "claimedAt" < now() - %(timeout)s * interval '1 second')
+                        ORDER BY "enqueuedAt" LIMIT %(limit)s
+                        FOR UPDATE SKIP LOCKED
+                    ) picked
+                    WHERE j."idCard" = picked."idCard"
+                    RETURNING j."idCard", j."enqueuedAt"
+                    """,
+                    {"max": MAX_ATTEMPTS, "timeout": CLAIM_TIMEOUT, "limit": batch_size}
+                )
+                claimed = {row["idCard"]: row["enqueuedAt"] for row in cursor.fetchall()}
+                cards = card_dao.get_cards_for_embedding(cursor, list(claimed)) if claimed else []
+            # Les jobs sont réservés : l'appel à l'API se fait hors transaction
+            self.connection.commit()
+            if not claimed:
+                return 0
+
+            texts = []
+            for card in cards:
+                texts.extend(card_dao.get_embed_texts(card))
+            embeddings = embedding_batch(texts) if texts else []
+
+            with self.connection.cursor() as cursor:
+                if embeddings is None or len(embeddings) != len(texts):
+                    logging.error(f"Embedding of {len(claimed)} queued cards failed")
+                    # La tentative est déjà comptée : les jobs peuvent être repris
+                    cursor.execute(
+                        'UPDATE "EmbeddingJob" SET "claimedAt" = NULL '
+                        'WHERE "idCard" = ANY(%(ids)s)',
+                        {"ids": list(claimed)}
+                    )
+                    self.connection.commit()
+                    return 0
+
+                written = self.write_embeddings(cursor, claimed, cards, embeddings)
+            self.connection.commit()
+            # Les cartes en cache n'ont pas encore leurs embeddings
+            CardCache().invalidate(written)
+            return len(written)
+        except Exception as e:
+            self.connection.rollback()
+            logging.error(f"Embedding worker error: {e}")
+            return 0
+
+    def write_embeddings(
+        self, cursor, claimed: dict, cards: list[Card], embeddings: list
+    ) -> list[int]:
+        """
+        Écrit les embeddings calculés, dans la transaction de [cursor], des seules cartes qui
+        n'ont pas changé depuis la réservation de leur job, et supprime ces jobs. Les jobs
+        sont verrouillés avant les cartes, dans le même ordre que CardDao.update_card_changes.
+
+        Parameters:
+        -----------
+        claimed : dict
+            {idCard: "enqueuedAt"} des jobs réservés
+        cards : list[Card]
+            Les cartes, avec le texte envoyé à l'API
+        embeddings : list
+            Les embeddings détaillé et court de chaque carte, dans l'ordre de [cards]
+
+        Returns
+        -------
+        list[int]
+            Les ids des cartes dont les embeddings ont été écrits
+        """
+        card_dao = CardDao()
+        ids = sorted(claimed)
+        cursor.execute(
+            'SELECT "idCard", "enqueuedAt" FROM "EmbeddingJob" WHERE "idCard" = ANY(%(ids)s) '
+            'ORDER BY "idCard" FOR UPDATE',
+            {"ids": ids}
+        )
+        jobs = {row["idCard"]: row["enqueuedAt"] for row in cursor.fetchall()}
+        current_texts = {
+            card.id_card: card_dao.get_embed_texts(card)
+            for card in card_dao.get_cards_for_embedding(cursor, ids, lock=True)
+        }
+
+        # Les vecteurs sont envoyés au format binaire de pgvector
+        rows = []
+        stale = []
+        for i, card in enumerate(cards):
+            if jobs.get(card.id_card) != claimed[card.id_card]:
+                # Remise dans la file (ou supprimée) entre-temps : le job n'est plus le nôtre
+                continue
+            if current_texts.get(card.id_card) != card_dao.get_embed_texts(card):
+                stale.append(card.id_card)
+                continue
+            rows.append((
+                card.id_card, np.asarray(embeddings[2 * i], dtype=np.float32),
+                np.asarray(embeddings[2 * i + 1], dtype=np.float32)
+            ))
+        written = [row[0] for row in rows]
+        if rows:
+            execute_values(
+                cursor,
+                'UPDATE "Card" c SET "embed" = v.embed, "shortEmbed" = v.short_embed '
+                'FROM (VALUES %s) AS v("idCard", embed, short_embed) '
+                'WHERE c."idCard" = v."idCard"',
+                rows
+            )
+            notify_cards_changed(cursor, written)
+            cursor.execute(
+                'DELETE FROM "EmbeddingJob" WHERE "idCard" = ANY(%(ids)s)', {"ids": written}
+            )
+        if stale:
+            # Texte changé sans nouveau job : le job est rendu, sans compter la tentative
+            cursor.execute(
+                'UPDATE "EmbeddingJob" SET "claimedAt" = NULL, "attempts" = "attempts" - 1 '
+                'WHERE "idCard" = ANY(%(ids)s)',
+                {"ids": stale}
+            )
+        return written
+
+    def pending(self) -> int:
+        """Nombre de cartes dont les embeddings n'ont pas encore été calculés"""
+        if self.connection is None or self.connection.closed:
+            self.connection = DBConnection().new_connection()
+        with self.connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) AS "count" FROM "EmbeddingJob"')
+            count = cursor.fetchone()["count"]
+        self.connection.commit()
+        return count
+
+    def loop(self) -> None:
+        while not self.stop_event.is_set():
+            # Un lot plein laisse penser qu'il reste des jobs : on enchaîne sans attendre
+            if self.run_once() < BATCH_SIZE:
+                self.stop_event.wait(INTERVAL)
+
+    def start(self) -> None:
+        """Lance le worker dans un thread en arrière-plan"""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.loop, name="embedding-worker", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Arrête le worker après le lot en cours"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+        if self.connection is not None and not self.connection.closed:
+            self.connection.close()
+        self.connection = None
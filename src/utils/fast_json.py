@@ -0,0 +1,43 @@
+import datetime
+import json
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # without orjson, the json module of python writes the same bytes
+    orjson = None
+
+
+def _default(value):
+    """Values json cannot write by itself (orjson writes them natively)"""
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    """
+    Encodes [content] as compact UTF-8 JSON, with orjson when it is installed. Dates are
+    written as ISO 8601 strings, like FastAPI does.
+    """
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(
+        content, ensure_ascii=False, separators=(",", ":"), default=_default
+    ).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    """
+    JSON response for the card endpoints, to return instead of the content: FastAPI then
+    skips jsonable_encoder, which walks the whole content before the json module encodes it
+    again. Content already encoded as bytes (e.g. a document of "CardDocument") is sent
+    as is.
+    """
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
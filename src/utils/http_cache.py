@@ -0,0 +1,97 @@
+import datetime
+import hashlib
+import os
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi.responses import Response
+
+MAX_AGE = int(os.getenv("CARD_HTTP_MAX_AGE", "0"))  # Seconds a copy is used without revalidation
+
+
+def make_etag(version: int, *key) -> str:
+    """
+    Weak ETag of a response: the version of the data it was built from, and a hash of what
+    identifies the response (path, query, body...)
+    """
+    digest = hashlib.blake2b("\x1f".join(map(str, key)).encode(), digest_size=8).hexdigest()
+    return f'W/"{version:x}-{digest}"'
+
+
+def cache_headers(validator: tuple | None, *key) -> dict:
+    """
+    Cache-Control, ETag and Last-Modified headers of a response
+
+    Parameters
+    ----------
+    validator : tuple | None
+        (version, modified) of the data of the response (see DataVersion), None if unknown:
+        the response then has no validator and must not be reused
+    key
+        What identifies the response, see make_etag
+    """
+    if validator is None:
+        return {"Cache-Control": "no-cache"}
+    version, modified = validator
+    return {
+        "Cache-Control": f"public, max-age={MAX_AGE}, must-revalidate",
+        "ETag": make_etag(version, *key),
+        "Last-Modified": format_datetime(
+            modified.astimezone(datetime.timezone.utc), usegmt=True
+        ),
+    }
+
+
+def is_fresh(request_headers, headers: dict, exists=None) -> bool:
+    """
+    True if the copy of the client is current: If-None-Match has the ETag of the response
+    (weak comparison) or "*" while the response exists or, without If-None-Match,
+    If-Modified-Since is not before its Last-Modified
+
+    Parameters
+    ----------
+    request_headers
+        Headers of the request
+    headers : dict
+        Cache headers of the response, see cache_headers
+    exists : callable, optional
+        Called without arguments, only for "*": True if the response exists (e.g. the card is
+        not missing). None if it always exists
+    """
+    if "ETag" not in headers:
+        return False
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        if headers["ETag"].removeprefix("W/") in tags:
+            return True
+        return "*" in tags and (exists is None or exists())
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        return False
+    return parsedate_to_datetime(headers["Last-Modified"]) <= since
+
+
+def conditional(
+    request, validator: tuple | None, *key, exists=None
+) -> tuple[dict, Response | None]:
+    """
+    Cache headers of the response to a request (identified by its path, query and [key]),
+    and the 304 Not Modified response to send instead if the copy of the client is current.
+    Only a GET or HEAD request gets a 304: for the other methods, If-None-Match is not a cache
+    validation.
+
+    Returns
+    -------
+    tuple[dict, Response | None]
+        The headers, and the 304 response or None
+    """
+    headers = cache_headers(validator, request.url.path, request.url.query, *key)
+    if request.method in ("GET", "HEAD") and is_fresh(request.headers, headers, exists):
+        return headers, Response(status_code=304, headers=headers)
+    return headers, None
@@ -0,0 +1,349 @@
+import hashlib
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from db_connection import DBConnection
+
+CHUNK_SIZE = 1_000  # Number of cards sent to a worker process at once
+COPY_CHUNK_SIZE = 10_000  # Number of rows sent to the database in a single COPY
+WORKERS = int(os.getenv("IMPORT_WORKERS", str(os.cpu_count() or 1)))
+LOADERS = int(os.getenv("IMPORT_LOADERS", "4"))  # Number of tables copied at the same time
+
+CARD_COLUMNS = ['layout', 'name', 'type', 'embed', 'shortEmbed', 'asciiName',
+                'convertedManaCost', 'defense', 'edhrecRank', 'edhrecSaltiness',
+                'faceManaValue', 'faceName', 'firstPrinting', 'hand',
+                'hasAlternativeDeckLimit', 'isFunny', 'isReserved', 'leadershipSkills',
+                'legalities', 'life', 'loyalty', 'manaCost', 'manaValue', 'power', 'side',
+                'text', 'toughness', 'sourceHash']
+COLUMNS_WITH_NA = ['asciiName', 'convertedManaCost', 'edhrecRank', 'edhrecSaltiness',
+                   'faceManaValue', 'faceName', 'hasAlternativeDeckLimit', 'isFunny',
+                   'isReserved', 'loyalty', 'manaCost', 'manaValue', 'power', 'side',
+                   'text', 'toughness']
+LEGALITY_COLUMNS = ['commander', 'oathbreaker', 'duel', 'legacy', 'vintage', 'modern',
+                    'penny', 'timeless', 'brawl', 'historic', 'gladiator', 'pioneer',
+                    'predh', 'paupercommander', 'pauper', 'premodern', 'future',
+                    'standardbrawl', 'standard', 'alchemy', 'oldschool']
+URL_COLUMNS = ['tcgplayer', 'cardKingdom', 'cardmarket', 'cardKingdomFoil',
+               'cardKingdomEtched', 'tcgplayerEtched']
+FOREIGN_DATA_COLUMNS = ['language', 'name', 'faceName', 'flavorText', 'text', 'type']
+LEADERSHIP_SKILLS = [{'brawl': True, 'commander': True, 'oathbreaker': True},
+                     {'brawl': False, 'commander': True, 'oathbreaker': True},
+                     {'brawl': True, 'commander': False, 'oathbreaker': True},
+                     {'brawl': True, 'commander': True, 'oathbreaker': False},
+                     {'brawl': False, 'commander': False, 'oathbreaker': True},
+                     {'brawl': False, 'commander': True, 'oathbreaker': False},
+                     {'brawl': True, 'commander': False, 'oathbreaker': False},
+                     {'brawl': False, 'commander': False, 'oathbreaker': False}]
+# Tables linking a card to the values of a dimension, with the column of the dimension id
+LINK_TABLES = {"Colors": "idColor", "ColorIdentity": "idColor", "ColorIndicator": "idColor",
+               "Keywords": "idKeyword", "Printings": "idSet", "Subtypes": "idSubtype",
+               "Supertypes": "idSupertype", "Types": "idType"}
+
+# Identity columns, filled with explicit ids by the import
+IDENTITY_COLUMNS = {"Card": "idCard", "User": "idUser", "Color": "idColor",
+                    "ForeignData": "idForeign", "Keyword": "idKeyword", "Set": "idSet",
+                    "Layout": "idLayout", "LeadershipSkills": "idLeadership",
+                    "Legality": "idLegality", "PurchaseURLs": "idPurchaseURLs",
+                    "Ruling": "idRuling", "Subtype": "idSubtype", "Supertype": "idSupertype",
+                    "Type": "idType"}
+
+
+def reset_identities(cursor) -> None:
+    """
+    Moves the identity of every table after its highest id, so that the rows created later
+    by the DAOs do not collide with the ids given by the import
+    """
+    for table, column in IDENTITY_COLUMNS.items():
+        cursor.execute(
+            f"""SELECT setval(pg_get_serial_sequence('"{table}"', '{column}'),
+            COALESCE(MAX("{column}"), 0) + 1, false) FROM "{table}";"""
+        )
+
+
+def card_source_hash(card: dict) -> str:
+    """
+    Hash of a card exactly as it is in AtomicCards.json, used to find the cards that changed
+    between two versions of the file
+    """
+    card_as_json = json.dumps(card, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(card_as_json.encode("utf-8")).hexdigest()
+
+
+def transform_card(card: dict) -> dict:
+    """
+    Converts a card of the .json into the values of its rows, without any id. Only depends on
+    the card, so it can run in any process.
+    """
+    row = {column: card.get(column) for column in COLUMNS_WITH_NA}
+    row["name"] = card["name"]
+    for column in ("defense", "hand", "life"):
+        row[column] = int(card[column]) if column in card else None
+    row["sourceHash"] = card_source_hash(card)
+
+    legalities = None
+    if 'legalities' in card:
+        status = {}
+        for legality, value in card['legalities'].items():
+            if value == "Legal":
+                status[legality] = 0
+            elif value == "Banned":
+                status[legality] = 1
+            else:
+                status[legality] = 2
+        legalities = tuple(status.get(column) for column in LEGALITY_COLUMNS)
+
+    leadership_skills = None
+    if 'leadershipSkills' in card:
+        leadership_skills = LEADERSHIP_SKILLS.index(card['leadershipSkills'])
+
+    purchase_urls = None
+    if 'purchaseUrls' in card:
+        purchase_urls = tuple(card['purchaseUrls'].get(url) for url in URL_COLUMNS)
+
+    return {
+        "row": row,
+        "colorIdentity": card['colorIdentity'],
+        "colors": card['colors'],
+        "colorIndicator": card.get('colorIndicator', []),
+        "foreignData": [
+            tuple(foreign.get(column) for column in FOREIGN_DATA_COLUMNS)
+            for foreign in card.get('foreignData', [])
+        ],
+        "keywords": card.get('keywords', []),
+        "layout": card['layout'],
+        "leadershipSkills": leadership_skills,
+        "legalities": legalities,
+        "printings": card.get('printings', []),
+        "firstPrinting": card.get('firstPrinting'),
+        "purchaseUrls": purchase_urls,
+        "rulings": [(ruling['date'], ruling['text']) for ruling in card.get('rulings', [])],
+        "subtypes": card['subtypes'],
+        "supertypes": card['supertypes'],
+        "type": card['type'],
+        "types": card['types'],
+    }
+
+
+def transform_chunk(cards: list) -> list:
+    """Runs transform_card on a chunk of cards, in a worker process"""
+    return [transform_card(card) for card in cards]
+
+
+def copy_value(value) -> str:
+    """Formats a value for the text format of COPY"""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+class DimensionIds:
+    """
+    Gives ids to the values of a dimension table (colors, sets, types...) in the order they
+    are first seen. Only the coordinator uses it, so the ids do not depend on the number of
+    worker processes.
+    """
+
+    def __init__(self):
+        self.ids = {}
+
+    def id_of(self, value) -> int:
+        if value not in self.ids:
+            self.ids[value] = len(self.ids)
+        return self.ids[value]
+
+    def rows(self) -> list[tuple]:
+        return [(id_value, value) for value, id_value in self.ids.items()]
+
+
+class ImportPipeline:
+    """
+    Import of the .json in three steps:
+    - worker processes transform chunks of cards into rows without ids
+    - the coordinator (this process) gives the ids, in the order of the .json
+    - several connections COPY the tables at the same time
+
+    Attributes
+    ----------
+    workers : int
+        Number of processes transforming the cards, 1 to do everything in this process
+    loaders : int
+        Number of tables copied at the same time
+    """
+
+    def __init__(self, workers: int = WORKERS, loaders: int = LOADERS):
+        self.workers = max(1, workers)
+        self.loaders = max(1, loaders)
+
+    def transform(self, cards: list) -> list:
+        """Transforms all the cards, in the order of [cards]"""
+        chunks = [cards[i:i + CHUNK_SIZE] for i in range(0, len(cards), CHUNK_SIZE)]
+        if self.workers == 1:
+            return [card for chunk in chunks for card in transform_chunk(chunk)]
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            return [card for chunk in executor.map(transform_chunk, chunks) for card in chunk]
+
+    def build_rows(self, data, embed_cards: list) -> dict:
+        """
+        Builds the rows of every table
+
+        Parameters:
+        -----------
+        data : dict
+            The data directly extracted from the .json
+        embed_cards : list
+            The embeddings of the cards, in the same order as the .json
+
+        Returns:
+        --------
+        dict
+            {table name: (columns, list of rows)}
+        """
+        cards = [card for i in data['data'] for card in data['data'][i]]
+        transformed = self.transform(cards)
+
+        colors = DimensionIds()
+        keywords = DimensionIds()
+        layouts = DimensionIds()
+        legalities = DimensionIds()
+        sets = DimensionIds()
+        subtypes = DimensionIds()
+        supertypes = DimensionIds()
+        types = DimensionIds()
+
+        links = {table: [] for table in LINK_TABLES}
+        card_rows = []
+        foreign_data_rows = []
+        purchase_url_rows = []
+        ruling_rows = []
+
+        for id_card, card in enumerate(transformed):
+            for color in card["colorIdentity"]:
+                links["ColorIdentity"].append((id_card, colors.id_of(color)))
+            for color in card["colors"]:
+                links["Colors"].append((id_card, colors.id_of(color)))
+            for color in card["colorIndicator"]:
+                links["ColorIndicator"].append((id_card, colors.id_of(color)))
+            for keyword in card["keywords"]:
+                links["Keywords"].append((id_card, keywords.id_of(keyword)))
+            for printing in card["printings"]:
+                links["Printings"].append((id_card, sets.id_of(printing)))
+            for subtype in card["subtypes"]:
+                links["Subtypes"].append((id_card, subtypes.id_of(subtype)))
+            for supertype in card["supertypes"]:
+                links["Supertypes"].append((id_card, supertypes.id_of(supertype)))
+
+            row = card["row"]
+            row["layout"] = layouts.id_of(card["layout"])
+            row["type"] = types.id_of(card["type"])
+            for type_ in card["types"]:  # type already means something in python, hence the _
+                links["Types"].append((id_card, types.id_of(type_)))
+            row["firstPrinting"] = (
+                sets.id_of(card["firstPrinting"]) if card["firstPrinting"] else None
+            )
+            row["leadershipSkills"] = card["leadershipSkills"]
+            row["legalities"] = (
+                legalities.id_of(card["legalities"]) if card["legalities"] else None
+            )
+            row["embed"] = embed_cards[id_card]["embed_detailed"]
+            row["shortEmbed"] = embed_cards[id_card]["embed_short"]
+            card_rows.append((id_card,) + tuple(row[column] for column in CARD_COLUMNS))
+
+            for foreign in card["foreignData"]:
+                foreign_data_rows.append((len(foreign_data_rows), id_card) + foreign)
+            if card["purchaseUrls"]:
+                purchase_url_rows.append((len(purchase_url_rows), id_card) + card["purchaseUrls"])
+            for date, text in card["rulings"]:
+                ruling_rows.append((len(ruling_rows), id_card, date, text))
+
+        rows = {
+            "Color": (["idColor", "colorName"], colors.rows()),
+            "Keyword": (["idKeyword", "name"], keywords.rows()),
+            "Layout": (["idLayout", "name"], layouts.rows()),
+            "Set": (["idSet", "name"], sets.rows()),
+            "Subtype": (["idSubtype", "name"], subtypes.rows()),
+            "Supertype": (["idSupertype", "name"], supertypes.rows()),
+            "Type": (["idType", "name"], types.rows()),
+            "LeadershipSkills": (
+                ["idLeadership", "brawl", "commander", "oathbreaker"],
+                [
+                    (i, skills["brawl"], skills["commander"], skills["oathbreaker"])
+                    for i, skills in enumerate(LEADERSHIP_SKILLS)
+                ]
+            ),
+            "LegalityType": (
+                ["idLegalityType", "type"], [(0, "Legal"), (1, "Banned"), (2, "Restricted")]
+            ),
+            "Legality": (
+                ["idLegality"] + LEGALITY_COLUMNS,
+                [(id_legality,) + values for values, id_legality in legalities.ids.items()]
+            ),
+            "Card": (["idCard"] + CARD_COLUMNS, card_rows),
+            "PurchaseURLs": (["idPurchaseURLs", "idCard"] + URL_COLUMNS, purchase_url_rows),
+            "ForeignData": (
+                ["idForeign", "idCard"] + FOREIGN_DATA_COLUMNS, foreign_data_rows
+            ),
+            "Ruling": (["idRuling", "idCard", "date", "text"], ruling_rows),
+            "User": (["idUser", "username", "password", "isAdmin"], [(1, "nono", "nono", True)]),
+        }
+        for table, table_rows in links.items():
+            rows[table] = (["idCard", LINK_TABLES[table]], table_rows)
+        return rows
+
+    def load(self, rows: dict, schema: str) -> None:
+        """
+        Copies every table with its own connection, [loaders] tables at a time, biggest
+        first. The tables must not have their foreign keys yet, since they are filled in
+        any order.
+        """
+        tables = sorted(rows, key=lambda table: len(rows[table][1]), reverse=True)
+
+        def load_table(table):
+            columns, table_rows = rows[table]
+            connection = DBConnection().new_connection()
+            try:
+                with connection:
+                    with connection.cursor() as cursor:
+                        cursor.execute(f'SET LOCAL search_path TO {schema}, public;')
+                        self.copy_rows(cursor, table, columns, table_rows)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.loaders) as executor:
+            for future in [executor.submit(load_table, table) for table in tables]:
+                future.result()
+
+    def copy_rows(self, cursor, table: str, columns: list[str], rows: list[tuple]) -> None:
+        """Sends [rows] with a single COPY, written COPY_CHUNK_SIZE rows at a time"""
+        column_list = ", ".join(f'"{column}"' for column in columns)
+        with cursor.copy(f'COPY "{table}"({column_list}) FROM STDIN') as copy:
+            for start in range(0, len(rows), COPY_CHUNK_SIZE):
+                buffer = io.StringIO()
+                for row in rows[start:start + COPY_CHUNK_SIZE]:
+                    buffer.write("\t".join(copy_value(value) for value in row))
+                    buffer.write("\n")
+                copy.write(buffer.getvalue())
+
+    def run(self, data, embed_cards: list, schema: str) -> None:
+        start = time.perf_counter()
+        rows = self.build_rows(data, embed_cards)
+        print(f"Rows built with {self.workers} processes in {time.perf_counter() - start:.1f}s")
+        self.load(rows, schema)
+        print(f"Tables copied with {self.loaders} connections in "
+              f"{time.perf_counter() - start:.1f}s")
+
+        with DBConnection().connection as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(f'SET LOCAL search_path TO {schema}, public;')
+                reset_identities(cursor)
@@ -0,0 +1,38 @@
+import time
+
+import psycopg
+
+
+class CountingCursor(psycopg.Cursor):
+    """
+    Cursor that counts the statements it sends to the database and the time spent waiting
+    for them, to measure the round trips of a DAO method :
+
+        with CountingCursor(connection) as cursor:
+            CardDao().insert_card(cursor, card, None, embed, short_embed)
+            print(cursor.queries, cursor.seconds)
+
+    Set it as the cursor_factory of a connection to count every query made through it.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.queries = 0
+        self.seconds = 0.0
+
+    def execute(self, query, params=None, **kwargs):
+        self.queries += 1
+        start = time.perf_counter()
+        try:
+            return super().execute(query, params, **kwargs)
+        finally:
+            self.seconds += time.perf_counter() - start
+
+    def executemany(self, query, params_seq, **kwargs):
+        params_seq = list(params_seq)
+        self.queries += len(params_seq)
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, params_seq, **kwargs)
+        finally:
+            self.seconds += time.perf_counter() - start
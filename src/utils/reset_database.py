@@ -1,12 +1,30 @@
 import os
+import sys
+import time
 import dotenv
 import json
 import csv
 
 from unittest import mock
 
+from dao.card_dao import CardDao
 from utils.singleton import Singleton
+from utils.card_cache import CardCache
+from utils.card_listener import notify_cards_changed
 from db_connection import DBConnection
+from utils.import_pipeline import ImportPipeline
+
+
+def split_schema_sql(schema_sql: str) -> tuple[str, str]:
+    """
+    Splits data/Untitled.sql in two: the creation of the tables, and everything after them
+    (foreign keys, indexes...), which is faster to build once the tables are filled
+    """
+    lines = schema_sql.splitlines(keepends=True)
+    for i, line in enumerate(lines):
+        if line.startswith("ALTER TABLE") or line.startswith("CREATE INDEX"):
+            return "".join(lines[:i]), "".join(lines[i:])
+    return schema_sql, ""
 
 
 class ResetDatabase(metaclass=Singleton):
@@ -33,385 +51,293 @@ class ResetDatabase(metaclass=Singleton):
         print(os.getcwd())
 
         init_db = open("data/Untitled.sql", encoding="utf-8")
-        init_db_as_string = init_db.read()
+        tables_sql, constraints_sql = split_schema_sql(init_db.read())
         init_db.close()
 
         try:
             with DBConnection().connection as connection:
                 with connection.cursor() as cursor:
-                    cursor.execute('SET search_path TO defaultdb, public;')
+                    cursor.execute('SET LOCAL search_path TO defaultdb, public;')
                     cursor.execute('CREATE EXTENSION IF NOT EXISTS vector;')
                     cursor.execute(create_schema)
-                    cursor.execute(init_db_as_string)
+                    cursor.execute(f'SET LOCAL search_path TO {schema}, public;')
+                    cursor.execute(tables_sql)
         except Exception:
             raise
 
-        self.import_database(data)
+        self.import_database(data, schema)
 
-    def import_database(self, data) -> None:
+        with DBConnection().connection as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(f'SET LOCAL search_path TO {schema}, public;')
+                cursor.execute(constraints_sql)
+                # After the constraints: the documents are read through their indexes
+                CardDao().refresh_documents(cursor)
+                notify_cards_changed(cursor, None)
+        CardCache().clear()
+
+    def rebuild(self, data, schema: str = "defaultdb") -> None:
         """
-        Import the entire database from .json into the SQL database
+        Rebuilds the database without downtime: everything is imported in a shadow schema while
+        the API keeps using the live one, then the two are swapped in a single transaction.
+        The live schema is kept as [schema]_previous, see rollback. The users, favourites and
+        cards created through the API are carried over to the new schema, see swap_schemas.
 
         Parameters:
         -----------
         data : dict
             The data directly extracted from the .json
+        schema : str
+            The live schema
         """
-        color_list = []
-        colors = []
-        colorIdentities = []
-        colorIndicators = []
-        foreignDatas = []
-        keyword_list = []
-        keywords = []
-        layouts = []
-        sets = []
-        printings = []
-        subtype_list = []
-        subtypes = []
-        supertype_list = []
-        supertypes = []
-        type_list = []
-        types = []
-        legalities = []
-        cards = []
-        purchaseUrls = []
-        rulings = []
-        leadershipSkills_values = [{'brawl': True, 'commander': True, 'oathbreaker': True},
-                                   {'brawl': False, 'commander': True, 'oathbreaker': True},
-                                   {'brawl': True, 'commander': False, 'oathbreaker': True},
-                                   {'brawl': True, 'commander': True, 'oathbreaker': False},
-                                   {'brawl': False, 'commander': False, 'oathbreaker': True},
-                                   {'brawl': False, 'commander': True, 'oathbreaker': False},
-                                   {'brawl': True, 'commander': False, 'oathbreaker': False},
-                                   {'brawl': False, 'commander': False, 'oathbreaker': False}]
+        shadow = f"{schema}_shadow"
+        start = time.perf_counter()
 
-        embed_cards = []
+        with open("data/Untitled.sql", encoding="utf-8") as init_db:
+            tables_sql, constraints_sql = split_schema_sql(init_db.read())
 
-        with open("cards_with_embeddings.csv", newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                embed_cards.append(row)
+        with DBConnection().connection as connection:
+            with connection.cursor() as cursor:
+                cursor.execute('CREATE EXTENSION IF NOT EXISTS vector;')
+                cursor.execute(f"DROP SCHEMA IF EXISTS {shadow} CASCADE; CREATE SCHEMA {shadow};")
+                cursor.execute(f'SET LOCAL search_path TO {shadow}, public;')
+                cursor.execute(tables_sql)
 
-        idCard = 0
-        idRuling = 0
-        column_with_na = ['asciiName', 'convertedManaCost', 'edhrecRank', 'edhrecSaltiness',
-                          'faceManaValue', 'faceName', 'hasAlternativeDeckLimit', 'isFunny',
-                          'isReserved', 'loyalty', 'manaCost', 'manaValue', 'power', 'side',
-                          'text', 'toughness']
-        url_list = ['tcgplayer', 'cardKingdom', 'cardmarket', 'cardKingdomFoil',
-                    'cardKingdomEtched', 'tcgplayerEtched']
-        foreignData_columns_with_na = ['faceName', 'flavorText', 'text', 'type']
+        self.import_database(data, shadow)
+        print(f"Data loaded in {shadow} after {time.perf_counter() - start:.1f}s")
 
-        for i in data['data']:
-            for card in data['data'][i]:
-                card_dic = {}
-
-                for color in card['colorIdentity']:
-                    if color not in color_list:
-                        color_list.append(color)
-                    colorIdentities.append((idCard, color_list.index(color)))
-
-                for color in card['colors']:
-                    colors.append((idCard, color_list.index(color)))
-
-                if 'colorIndicator' in card:
-                    for color in card['colors']:
-                        colorIndicators.append((idCard, color_list.index(color)))
-
-                if 'defense' in card:
-                    card_dic["defense"] = int(card["defense"])
-
-                if 'foreignData' in card:
-                    for foreignData in card['foreignData']:
-                        foreignData_dic = {}
-                        foreignData_dic['idCard'] = idCard
-                        foreignData_dic['language'] = foreignData['language']
-                        foreignData_dic['name'] = foreignData['name']
-                        for column in foreignData_columns_with_na:
-                            if column in foreignData:
-                                foreignData_dic[column] = foreignData[column]
-                        foreignDatas.append(foreignData_dic)
-
-                if 'hand' in card:
-                    card_dic["hand"] = int(card["hand"])
-
-                if 'keywords' in card:
-                    for keyword in card['keywords']:
-                        if keyword not in keyword_list:
-                            keyword_list.append(keyword)
-                        keywords.append((idCard, keyword_list.index(keyword)))
-
-                if card['layout'] not in layouts:
-                    layouts.append(card['layout'])
-                card_dic["layout"] = layouts.index(card["layout"])
-
-                if 'leadershipSkills' in card:
-                    card_dic["leadershipSkills"] = leadershipSkills_values.index(
-                        card["leadershipSkills"]
-                    )
-
-                if 'legalities' in card:
-                    legality_dic = {}
-                    for legality in card['legalities']:
-                        if card['legalities'][legality] == "Legal":
-                            legality_dic[legality] = 0
-                        elif card['legalities'][legality] == "Banned":
-                            legality_dic[legality] = 1
-                        else:
-                            legality_dic[legality] = 2
-                    if legality_dic not in legalities:
-                        legalities.append(legality_dic)
-                    card_dic["legalities"] = legalities.index(legality_dic)
-
-                if 'life' in card:
-                    card_dic["life"] = int(card["life"])
-
-                card_dic["name"] = card["name"]
-
-                if 'printings' in card:
-                    for printing in card['printings']:
-                        if printing not in sets:
-                            sets.append(printing)
-                        printings.append((idCard, sets.index(printing)))
-
-                if 'firstPrinting' in card:
-                    if card["firstPrinting"] not in sets:
-                        sets.append(card["firstPrinting"])
-                    card_dic["firstPrinting"] = sets.index(card["firstPrinting"])
-
-                if 'purchaseUrls' in card:
-                    purchaseUrls_dic = {}
-                    purchaseUrls_dic['idCard'] = idCard
-                    for url in url_list:
-                        if url in card['purchaseUrls']:
-                            purchaseUrls_dic[url] = card['purchaseUrls'][url]
-                    purchaseUrls.append(purchaseUrls_dic)
-
-                if 'rulings' in card:
-                    for ruling in card['rulings']:
-                        rulings.append((idRuling, idCard, ruling['date'], ruling['text']))
-                        idRuling += 1
-
-                for subtype in card['subtypes']:
-                    if subtype not in subtype_list:
-                        subtype_list.append(subtype)
-                    subtypes.append((idCard, subtype_list.index(subtype)))
-
-                for supertype in card['supertypes']:
-                    if supertype not in supertype_list:
-                        supertype_list.append(supertype)
-                    supertypes.append((idCard, supertype_list.index(supertype)))
-
-                if card['type'] not in type_list:
-                    type_list.append(card['type'])
-                card_dic["type"] = type_list.index(card["type"])
-
-                for type_ in card['types']:  # type already means something in python, hence the _
-                    if type_ not in type_list:
-                        type_list.append(type_)
-                    types.append((idCard, type_list.index(type_)))
-
-                for column in column_with_na:
-                    self.add_value_that_could_be_na(card, column, card_dic)
-
-                card_dic["embed"] = embed_cards[idCard]["embed_detailed"]
-                card_dic["shortEmbed"] = embed_cards[idCard]["embed_short"]
-
-                cards.append(card_dic)
-                idCard += 1
-
-        color_values = [(i, color_list[i]) for i in range(len(color_list))]
-        keyword_values = [(i, keyword_list[i]) for i in range(len(keyword_list))]
-        layout_values = [(i, layouts[i]) for i in range(len(layouts))]
-        set_values = [(i, sets[i]) for i in range(len(sets))]
-        subtype_values = [(i, subtype_list[i]) for i in range(len(subtype_list))]
-        supertype_values = [(i, supertype_list[i]) for i in range(len(supertype_list))]
-        type_values = [(i, type_list[i]) for i in range(len(type_list))]
-
-        legality_columns = ['commander', 'oathbreaker', 'duel', 'legacy', 'vintage', 'modern',
-                            'penny', 'timeless', 'brawl', 'historic', 'gladiator', 'pioneer',
-                            'predh', 'paupercommander', 'pauper', 'premodern', 'future',
-                            'standardbrawl', 'standard', 'alchemy', 'oldschool']
-        card_columns = ['layout', 'name', 'type', 'embed', 'shortEmbed', 'asciiName',
-                        'convertedManaCost', 'defense', 'edhrecRank', 'edhrecSaltiness',
-                        'faceManaValue', 'faceName', 'firstPrinting', 'hand',
-                        'hasAlternativeDeckLimit', 'isFunny', 'isReserved', 'leadershipSkills',
-                        'legalities', 'life', 'loyalty', 'manaCost', 'manaValue', 'power', 'side',
-                        'text', 'toughness']
-        purhcaseUrls_columns = ['idCard', 'tcgplayer', 'cardKingdom', 'cardmarket',
-                                'cardKingdomFoil', 'cardKingdomEtched', 'tcgplayerEtched']
-        foreignData_columns = ['idCard', 'language', 'name', 'faceName', 'flavorText', 'text',
-                               'type']
-        legality_values = self.fill_table_with_na_values(legality_columns, legalities)
-        card_values = self.fill_table_with_na_values(card_columns, cards)
-        purchaseUrls_values = self.fill_table_with_na_values(purhcaseUrls_columns, purchaseUrls)
-        foreignData_values = self.fill_table_with_na_values(foreignData_columns, foreignDatas)
+        with DBConnection().connection as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(f'SET LOCAL search_path TO {shadow}, public;')
+                cursor.execute(constraints_sql)
+                CardDao().refresh_documents(cursor)
+                self.analyze_schema(cursor, shadow)
+                expected = self.expected_counts(data)
+                self.validate(cursor, {**expected, "CardDocument": expected["Card"]})
+        print(
+            "Constraints and documents built, counts checked after "
+            f"{time.perf_counter() - start:.1f}s"
+        )
+
+        with DBConnection().connection as connection:
+            with connection.cursor() as cursor:
+                self.swap_schemas(cursor, schema, shadow, f"{schema}_previous")
+                notify_cards_changed(cursor, None)
+        CardCache().clear()
+        print(f"{shadow} is now live as {schema} after {time.perf_counter() - start:.1f}s")
 
+    def rollback(self, schema: str = "defaultdb") -> None:
+        """
+        Puts [schema]_previous back live after a rebuild. The users, favourites and cards
+        created through the API are copied back, and the rebuilt schema becomes
+        [schema]_previous, so calling it again rolls forward.
+        """
+        previous = f"{schema}_previous"
+        rolled_back = f"{schema}_rollback"
         with DBConnection().connection as connection:
             with connection.cursor() as cursor:
-                cursor.executemany(
-                    'INSERT INTO "Color"("idColor", "colorName") VALUES (%s, %s)',
-                    color_values
-                )
-                cursor.executemany(
-                    'INSERT INTO "Keyword"("idKeyword", "name") VALUES (%s, %s)',
-                    keyword_values
-                )
-                cursor.executemany(
-                    'INSERT INTO "Layout"("idLayout", "name") VALUES (%s, %s)',
-                    layout_values
-                )
-                cursor.executemany(
-                    'INSERT INTO "Set"("idSet", "name") VALUES (%s, %s)',
-                    set_values
-                )
-                cursor.executemany(
-                    'INSERT INTO "Subtype"("idSubtype", "name") VALUES (%s, %s)',
-                    subtype_values
-                )
-                cursor.executemany(
-                    'INSERT INTO "Supertype"("idSupertype", "name") VALUES (%s, %s)',
-                    supertype_values
-                )
-                cursor.executemany(
-                    'INSERT INTO "Type"("idType", "name") VALUES (%s, %s)',
-                    type_values
-                )
-                cursor.execute(
-                    'INSERT INTO "LeadershipSkills"("idLeadership", "brawl", "commander", '
-                    '"oathbreaker") VALUES'
-                    '(0, True, True, True),'
-                    '(1, True, True, False),'
-                    '(2, True, False, True),'
-                    '(3, False, True, True),'
-                    '(4, False, False, True),'
-                    '(5, False, True, False),'
-                    '(6, True, False, False),'
-                    '(7, False, False, False);'
-                )
-                cursor.execute(
-                    'INSERT INTO "LegalityType"("idLegalityType", "type") VALUES'
-                    '(0, %(Legal)s),'
-                    '(1, %(Banned)s),'
-                    '(2, %(Restricted)s);',
-                    {
-                        "Legal": "Legal",
-                        "Banned": "Banned",
-                        "Restricted": "Restricted",
-                    },
-                )
-                cursor.executemany(
-                    'INSERT INTO "Legality"("idLegality", "commander", "oathbreaker", "duel", '
-                    '"legacy", "vintage", "modern", "penny", "timeless", "brawl", "historic", '
-                    '"gladiator", "pioneer", "predh", "paupercommander", "pauper", "premodern", '
-                    '"future", "standardbrawl", "standard", "alchemy", "oldschool") VALUES (%s, '
-                    '%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, '
-                    '%s, %s)',
-                    legality_values
-                )
-                cursor.executemany(
-                    'INSERT INTO "Card"("idCard", "layout", "name", "type", "embed", "shortEmbed", '
-                    '"asciiName", "convertedManaCost", "defense", "edhrecRank", '
-                    '"edhrecSaltiness", "faceManaValue", "faceName", "firstPrinting", "hand", '
-                    '"hasAlternativeDeckLimit", "isFunny", "isReserved", "leadershipSkills", '
-                    '"legalities", "life", "loyalty", "manaCost", "manaValue", "power", "side", '
-                    '"text", "toughness") VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, '
-                    '%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)',
-                    card_values
-                )
-                cursor.executemany(
-                    'INSERT INTO "Colors"("idCard", "idColor") VALUES (%s, %s)',
-                    colors
-                )
-                cursor.executemany(
-                    'INSERT INTO "ColorIndicator"("idCard", "idColor") VALUES (%s, %s)',
-                    colorIndicators
-                )
-                cursor.executemany(
-                    'INSERT INTO "ColorIdentity"("idCard", "idColor") VALUES (%s, %s)',
-                    colorIdentities
-                )
-                cursor.executemany(
-                    'INSERT INTO "Keywords"("idCard", "idKeyword") VALUES (%s, %s)',
-                    keywords
-                )
-                cursor.executemany(
-                    'INSERT INTO "Printings"("idCard", "idSet") VALUES (%s, %s)',
-                    printings
-                )
-                cursor.executemany(
-                    'INSERT INTO "Types"("idCard", "idType") VALUES (%s, %s)',
-                    types
-                )
-                cursor.executemany(
-                    'INSERT INTO "Supertypes"("idCard", "idSupertype") VALUES (%s, %s)',
-                    supertypes
-                )
-                cursor.executemany(
-                    'INSERT INTO "Subtypes"("idCard", "idSubtype") VALUES (%s, %s)',
-                    subtypes
-                )
-                cursor.executemany(
-                    'INSERT INTO "PurchaseURLs"("idPurchaseURLs", "idCard", "tcgplayer", '
-                    '"cardKingdom", "cardmarket", "cardKingdomFoil", "cardKingdomEtched", '
-                    '"tcgplayerEtched") VALUES (%s, %s, %s, %s, %s, %s, %s, %s)',
-                    purchaseUrls_values
-                )
-                cursor.executemany(
-                    'INSERT INTO "ForeignData"("idForeign", "idCard", "language", "name", '
-                    '"faceName", "flavorText", "text", "type") VALUES (%s, %s, %s, %s, %s, %s, %s, '
-                    '%s)',
-                    foreignData_values
-                )
-                cursor.executemany(
-                    'INSERT INTO "Ruling"("idRuling", "idCard", "date", "text") VALUES (%s, %s, %s,'
-                    ' %s)',
-                    rulings
-                )
-                cursor.execute(
-                    'INSERT INTO "User"("idUser", "username", "password", "isAdmin") VALUES (1, '
-                    '"nono", "nono", true)'
-                )
-            connection.commit()
-
-    def fill_table_with_na_values(self, columns: list[str], values: list[dict]) -> list[tuple]:
+                if not self.schema_exists(cursor, previous):
+                    raise ValueError(f"There is no schema {previous} to roll back to")
+                cursor.execute(f"DROP SCHEMA IF EXISTS {rolled_back} CASCADE;")
+                cursor.execute(f"ALTER SCHEMA {previous} RENAME TO {rolled_back};")
+                self.swap_schemas(cursor, schema, rolled_back, previous)
+                notify_cards_changed(cursor, None)
+        CardCache().clear()
+
+    def swap_schemas(self, cursor, schema: str, replacement: str, previous: str) -> None:
+        """
+        Makes [replacement] live under the name [schema], and keeps the old live schema as
+        [previous]. The cards created through the API, the users and the favourites written in
+        the live schema until now are copied first (see copy_api_cards and copy_user_data),
+        while their tables are locked against writes (reads keep working).
+        Must run in a single transaction so that the API never sees a missing schema.
+        """
+        if self.schema_exists(cursor, schema):
+            cursor.execute(
+                f'LOCK TABLE {schema}."Card", {schema}."User", {schema}."Favourite" '
+                'IN SHARE ROW EXCLUSIVE MODE;'
+            )
+            card_ids = self.copy_api_cards(cursor, schema, replacement)
+            self.copy_user_data(cursor, schema, replacement, card_ids)
+            cursor.execute(f"DROP SCHEMA IF EXISTS {previous} CASCADE;")
+            cursor.execute(f"ALTER SCHEMA {schema} RENAME TO {previous};")
+        cursor.execute(f"ALTER SCHEMA {replacement} RENAME TO {schema};")
+
+    def copy_api_cards(self, cursor, source: str, target: str) -> dict:
+        """
+        Replaces the cards created through the API (without a source hash) in [target] with
+        the ones of [source]: they are not in the .json, and would be lost by the swap
+        otherwise. They are read and written with CardDao, the ids of their dimension values
+        differing between the two schemas. Their embeddings are copied, or computed again by
+        the EmbeddingWorker when they were still pending.
+
+        Returns
+        -------
+        dict
+            {id in [source]: id in [target]} of the copied cards
         """
-        Allows to fill the na values with None in a table, to make importing into SQL easier
+        cursor.execute(
+            f'SELECT "idCard" FROM {source}."Card" WHERE "sourceHash" IS NULL ORDER BY "idCard";'
+        )
+        ids = [row["idCard"] for row in cursor.fetchall()]
+        cursor.execute(f'DELETE FROM {target}."Card" WHERE "sourceHash" IS NULL;')
+        if not ids:
+            return {}
+        print(f"{len(ids)} cards created through the API copied to {target}")
+
+        card_dao = CardDao()
+        cursor.execute("SELECT current_setting('search_path') AS \"path\";")
+        search_path = cursor.fetchone()["path"]
+        cursor.execute(f"SET LOCAL search_path TO {source}, public;")
+        cards = [card_dao.read_card(id_card, cursor=cursor) for id_card in ids]
+        cursor.execute(f"SET LOCAL search_path TO {target}, public;")
+
+        embedded = [card for card in cards if card._embedded is not None]
+        pending = [card for card in cards if card._embedded is None]
+        embeddings = [(card._embedded, card._short_embedded) for card in embedded]
+        new_ids = card_dao.insert_cards(
+            cursor, embedded, embeddings=embeddings, notify=False
+        ) + card_dao.insert_cards(cursor, pending, notify=False)
+        cursor.execute("SELECT set_config('search_path', %(path)s, true);", {"path": search_path})
+        return {
+            card.id_card: new_id for card, new_id in zip(embedded + pending, new_ids)
+        }
+
+    def copy_user_data(
+        self, cursor, source: str, target: str, card_ids: dict = None
+    ) -> None:
+        """
+        Replaces the users and favourites of [target] with the ones of [source]. The ids of the
+        cards can differ between two imports, so favourites of the imported cards are matched
+        on the name and side of the card, like in sync_database.py, and the ones of the cards
+        created through the API with [card_ids] (see copy_api_cards).
+        """
+        cursor.execute(f'TRUNCATE {target}."Favourite", {target}."User";')
+        cursor.execute(f'INSERT INTO {target}."User" SELECT * FROM {source}."User";')
+
+        # The ids were copied: the identity must continue after the highest one
+        cursor.execute(
+            f"""SELECT setval(pg_get_serial_sequence('{target}."User"', 'idUser'),
+            COALESCE(MAX("idUser"), 0) + 1, false) FROM {target}."User";"""
+        )
+
+        card_keys = """
+            SELECT "idCard", "name", COALESCE("side", '') AS "side",
+                   ROW_NUMBER() OVER (
+                       PARTITION BY "name", COALESCE("side", '') ORDER BY "idCard"
+                   ) AS "occurrence"
+            FROM {}."Card"
+            WHERE "sourceHash" IS NOT NULL
+        """
+        cursor.execute(
+            f"""
+            INSERT INTO {target}."Favourite"("idUser", "idCard")
+            SELECT f."idUser", new_card."idCard"
+            FROM {source}."Favourite" f
+            JOIN ({card_keys.format(source)}) old_card ON old_card."idCard" = f."idCard"
+            JOIN ({card_keys.format(target)}) new_card
+              ON new_card."name" = old_card."name"
+             AND new_card."side" = old_card."side"
+             AND new_card."occurrence" = old_card."occurrence";
+            """
+        )
+        if card_ids:
+            cursor.execute(
+                f"""
+                INSERT INTO {target}."Favourite"("idUser", "idCard")
+                SELECT f."idUser", ids."new"
+                FROM {source}."Favourite" f
+                JOIN unnest(%(old)s::int[], %(new)s::int[]) AS ids("old", "new")
+                  ON ids."old" = f."idCard";
+                """,
+                {"old": list(card_ids), "new": list(card_ids.values())}
+            )
+
+    def analyze_schema(self, cursor, schema: str) -> None:
+        """
+        Updates the statistics of the tables of [schema] only: a plain ANALYZE would scan every
+        table of the database, the live schema included
+        """
+        cursor.execute(
+            "SELECT tablename FROM pg_tables WHERE schemaname = %(schema)s ORDER BY tablename;",
+            {"schema": schema}
+        )
+        for row in cursor.fetchall():
+            cursor.execute(f'ANALYZE {schema}."{row["tablename"]}";')
+
+    def schema_exists(self, cursor, schema: str) -> bool:
+        cursor.execute(
+            "SELECT 1 FROM information_schema.schemata WHERE schema_name = %(schema)s;",
+            {"schema": schema}
+        )
+        return cursor.fetchone() is not None
+
+    def expected_counts(self, data) -> dict:
+        """
+        Number of rows the import must create in the main tables, computed from the .json
+        """
+        counts = {"Card": 0, "ForeignData": 0, "PurchaseURLs": 0, "Ruling": 0}
+        for i in data['data']:
+            for card in data['data'][i]:
+                counts["Card"] += 1
+                counts["ForeignData"] += len(card.get('foreignData', []))
+                counts["PurchaseURLs"] += 'purchaseUrls' in card
+                counts["Ruling"] += len(card.get('rulings', []))
+        return counts
 
-        Parameters:
-        -----------
-        columns: list[str]
-            The list containing all the columns' name
-        values: list[dict]
-            The list of all values of the table in a dictionnary form
-
-        Returns:
-        --------
-        list[tuple]
-            The list of all values, with None is the empty columns
+    def validate(self, cursor, expected: dict) -> None:
         """
-        values_as_tuple = []
-        for i in range(len(values)):
-            legality = [i]
-            for j in columns:
-                if j in values[i]:
-                    legality.append(values[i][j])
-                else:
-                    legality.append(None)
-            values_as_tuple.append(tuple(legality))
-
-        return values_as_tuple
-
-    def add_value_that_could_be_na(self, card: dict, column_name: str, card_dic: dict) -> None:
+        Checks the row counts of the imported tables before they go live
+
+        Raises
+        ------
+        ValueError
+            If a table does not have the expected number of rows
         """
-        Allows to add in card_dic the value of the column in column_name if the card has it
+        errors = []
+        for table, count in expected.items():
+            cursor.execute(f'SELECT COUNT(*) AS "count" FROM "{table}";')
+            found = cursor.fetchone()["count"]
+            if found != count:
+                errors.append(f"{table}: {found} rows instead of {count}")
+        if expected["Card"] == 0:
+            errors.append("Card: the .json has no cards")
+        if errors:
+            raise ValueError("The rebuilt schema is not valid: " + ", ".join(errors))
+
+    def import_database(self, data, schema: str = "defaultdb") -> None:
         """
-        if column_name in card:
-            card_dic[column_name] = card[column_name]
+        Import the entire database from .json into the SQL database, with an ImportPipeline.
+        The tables must be created without their foreign keys, which are added afterwards.
+
+        Parameters:
+        -----------
+        data : dict
+            The data directly extracted from the .json
+        schema : str
+            The schema the tables were created in
+        """
+        embed_cards = []
+
+        with open("cards_with_embeddings.csv", newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                embed_cards.append(row)
+
+        ImportPipeline().run(data, embed_cards, schema)
 
 
 if __name__ == "__main__":
-    with open('AtomicCards.json', 'r') as file:
-        data = json.load(file)
-    ResetDatabase().start(data)
+    # python reset_database.py           : drops and reimports the database
+    # python reset_database.py rebuild   : reimports in a shadow schema and swaps it live
+    # python reset_database.py rollback  : puts the schema replaced by the last rebuild back
+    mode = sys.argv[1] if len(sys.argv) > 1 else "reset"
+    if mode == "rollback":
+        ResetDatabase().rollback()
+    else:
+        with open('AtomicCards.json', 'r') as file:
+            data = json.load(file)
+        if mode == "rebuild":
+            ResetDatabase().rebuild(data)
+        else:
+            ResetDatabase().start(data)
@@ -0,0 +1,80 @@
+import threading
+
+
+class Call:
+    """A computation in flight, and its result once it is done"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0  # Calls waiting for this one
+
+
+class SingleFlight:
+    """
+    Coalesces identical calls running at the same time: the first call with a key computes
+    the result, and the calls with the same key made before it ends wait for it and get the
+    same result (or exception), instead of computing it again. Once a call ended, the next
+    one computes again: nothing is cached.
+
+    The callers share the result object: it must not be modified.
+
+    Attributes
+    ----------
+    computed : int
+        Number of calls that computed their result
+    shared : int
+        Number of calls that got the result of another one
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.computed = 0
+        self.shared = 0
+
+    def do(self, key, function, *args, **kwargs):
+        """
+        Returns function(*args, **kwargs), computed once for all the concurrent calls with
+        [key] (hashable)
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            if call is None:
+                call = self.calls[key] = Call()
+                self.computed += 1
+                leader = True
+            else:
+                call.waiters += 1
+                self.shared += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self) -> dict:
+        """
+        Calls in flight, calls waiting for one of them, and the counters since the start
+        """
+        with self.lock:
+            return {
+                "in_flight": len(self.calls),
+                "waiting": sum(call.waiters for call in self.calls.values()),
+                "computed": self.computed,
+                "shared": self.shared
+            }
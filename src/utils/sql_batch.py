@@ -0,0 +1,43 @@
+import re
+
+PAGE_SIZE = 100  # Rows sent in each statement
+
+
+def execute_values(cursor, query: str, rows, template: str = None, page_size: int = PAGE_SIZE):
+    """
+    Executes [query] with all the [rows] in a multi-row VALUES list, [page_size] rows per
+    statement, like psycopg2.extras.execute_values did :
+
+        execute_values(cursor, 'INSERT INTO "Types"("idCard", "idType") VALUES %s', rows)
+
+    Parameters
+    ----------
+    cursor : cursor
+        The cursor for the database
+    query : str
+        The query, with a single %s where the VALUES list goes
+    rows : list
+        The rows, as tuples, or as dicts when [template] uses named placeholders
+    template : str
+        The placeholders of one row, by default "(%s, %s, ...)" with one %s per value
+    page_size : int
+        Maximum number of rows in a statement
+    """
+    rows = list(rows)
+    if not rows:
+        return
+    before, after = query.split("%s", 1)
+
+    names = re.findall(r"%\((\w+)\)s", template) if template else []
+    if names:
+        template = re.sub(r"%\(\w+\)s", "%s", template)
+
+    for start in range(0, len(rows), page_size):
+        page = rows[start:start + page_size]
+        row_template = template or "(" + ", ".join(["%s"] * len(page[0])) + ")"
+        params = [
+            value
+            for row in page
+            for value in ([row[name] for name in names] if names else row)
+        ]
+        cursor.execute(before + ", ".join([row_template] * len(page)) + after, params)
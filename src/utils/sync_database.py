@@ -0,0 +1,269 @@
+import json
+import time
+
+from business_object.card import Card
+from dao.card_dao import CardDao
+from db_connection import DBConnection
+from utils.embed_batch import (
+    EMBED_DIMENSION, MODEL, card_to_text_detailed, card_to_text_short, embed_missing
+)
+from utils.card_cache import CardCache
+from utils.card_listener import notify_cards_changed
+from utils.embed_cache import EmbeddingCache
+from utils.import_pipeline import card_source_hash
+from utils.singleton import Singleton
+
+WRITE_BATCH = 1_000  # Cards written per batch, with a progress message after each one
+
+
+def card_keys(cards: list) -> list[tuple]:
+    """
+    Gives every card a stable key (name, side, occurrence). The occurrence counts the previous
+    cards with the same name and side, for the few names shared by several cards.
+
+    Parameters
+    ----------
+    cards : list
+        Cards as dicts, either from the .json or rows of the "Card" table
+
+    Returns
+    -------
+    list[tuple]
+        The key of every card, in the same order
+    """
+    seen = {}
+    keys = []
+    for card in cards:
+        base = (card["name"], card.get("side") or "")
+        occurrence = seen.get(base, 0)
+        seen[base] = occurrence + 1
+        keys.append(base + (occurrence,))
+    return keys
+
+
+def diff_cards(new_cards: dict, current_cards: dict) -> tuple[list, list, list, list]:
+    """
+    Compares the cards of the .json with the ones in the database
+
+    Parameters
+    ----------
+    new_cards : dict
+        {key: card as in the .json}
+    current_cards : dict
+        {key: {"idCard": ..., "sourceHash": ...}} for the cards in the database
+
+    Returns
+    -------
+    tuple[list, list, list, list]
+        - the cards to insert, as (card, source_hash)
+        - the cards to update, as (idCard, card, source_hash)
+        - the ids of the cards to delete
+        - the ids of the conflicts: cards created through the API (without a source hash)
+          with the key of a card of the .json. They are left as they are.
+        Only the cards imported from the .json (with a source hash) are updated or deleted,
+        never the ones created through the API.
+    """
+    to_insert = []
+    to_update = []
+    conflicts = []
+    for key, card in new_cards.items():
+        source_hash = card_source_hash(card)
+        current = current_cards.get(key)
+        if current is None:
+            to_insert.append((card, source_hash))
+        elif current["sourceHash"] is None:
+            conflicts.append(current["idCard"])
+        elif current["sourceHash"] != source_hash:
+            to_update.append((current["idCard"], card, source_hash))
+
+    to_delete = [
+        current["idCard"]
+        for key, current in current_cards.items()
+        if key not in new_cards and current["sourceHash"] is not None
+    ]
+    return to_insert, to_update, to_delete, conflicts
+
+
+def json_to_card(card: dict, id_card: int) -> Card:
+    """
+    Converts a card from the .json into a Card
+    """
+    return Card(
+        id_card=id_card,
+        layout=card["layout"],
+        name=card["name"],
+        type_line=card["type"],
+        ascii_name=card.get("asciiName"),
+        color_identity=card.get("colorIdentity"),
+        color_indicator=card.get("colorIndicator"),
+        colors=card.get("colors"),
+        converted_mana_cost=card.get("convertedManaCost"),
+        defense=int(card["defense"]) if "defense" in card else None,
+        edhrec_rank=card.get("edhrecRank"),
+        edhrec_saltiness=card.get("edhrecSaltiness"),
+        face_mana_value=card.get("faceManaValue"),
+        face_name=card.get("faceName"),
+        first_printing=card.get("firstPrinting"),
+        foreign_data=card.get("foreignData"),
+        hand=int(card["hand"]) if "hand" in card else None,
+        has_alternative_deck_limit=card.get("hasAlternativeDeckLimit"),
+        is_funny=card.get("isFunny"),
+        is_reserved=card.get("isReserved"),
+        keywords=card.get("keywords"),
+        leadership_skills=card.get("leadershipSkills"),
+        legalities=card.get("legalities"),
+        life=int(card["life"]) if "life" in card else None,
+        loyalty=card.get("loyalty"),
+        mana_cost=card.get("manaCost"),
+        mana_value=card.get("manaValue"),
+        power=card.get("power"),
+        printings=card.get("printings"),
+        purchase_urls=card.get("purchaseUrls"),
+        rulings=card.get("rulings"),
+        side=card.get("side"),
+        subtypes=card.get("subtypes"),
+        supertypes=card.get("supertypes"),
+        text=card.get("text"),
+        toughness=card.get("toughness"),
+        types=card.get("types")
+    )
+
+
+class SyncDatabase(metaclass=Singleton):
+    """
+    Incremental update of the database from a new AtomicCards.json: only the cards that were
+    added, changed or removed since the last import are written, and only the changed texts
+    are embedded again
+    """
+    def start(self, data) -> dict:
+        """
+        Synchronises the database with the .json
+
+        Parameters:
+        -----------
+        data : dict
+            The data directly extracted from the .json
+
+        Returns
+        -------
+        dict
+            Number of inserted, updated, deleted, unchanged and conflicting cards, number of
+            embedded texts, embedding cache hit rate and duration in seconds
+        """
+        start = time.perf_counter()
+
+        cards = [card for name in data["data"] for card in data["data"][name]]
+        new_cards = dict(zip(card_keys(cards), cards))
+        current_cards = self.current_cards()
+
+        to_insert, to_update, to_delete, conflicts = diff_cards(new_cards, current_cards)
+        print(
+            f"{len(to_insert)} new, {len(to_update)} changed and {len(to_delete)} removed "
+            f"cards out of {len(new_cards)}"
+        )
+        if conflicts:
+            print(
+                f"{len(conflicts)} cards created through the API have the name of a card of "
+                f"the .json and are kept as they are: {conflicts}"
+            )
+
+        changed_cards = [card for card, _ in to_insert] + [card for _, card, _ in to_update]
+        texts = []
+        for card in changed_cards:
+            texts.append(card_to_text_detailed(card))
+            texts.append(card_to_text_short(card))
+
+        cache = EmbeddingCache(MODEL)
+        try:
+            embed_stats = embed_missing(texts, cache)
+            embeddings = cache.get_many(texts)
+            hit_rate = cache.hit_rate
+        finally:
+            cache.close()
+
+        self.apply(to_insert, to_update, to_delete, embeddings)
+
+        report = {
+            "inserted": len(to_insert),
+            "updated": len(to_update),
+            "deleted": len(to_delete),
+            "unchanged": len(new_cards) - len(to_insert) - len(to_update) - len(conflicts),
+            "conflicts": len(conflicts),
+            "embedded_texts": embed_stats["texts"],
+            "cache_hit_rate": hit_rate,
+            "seconds": time.perf_counter() - start
+        }
+        print(report)
+        return report
+
+    def current_cards(self) -> dict:
+        """
+        Returns {key: {"idCard": ..., "sourceHash": ...}} for all the cards in the database
+        """
+        with DBConnection().connection as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT "idCard", "name", "side", "sourceHash" FROM "Card" '
+                    'ORDER BY "idCard" ASC'
+                )
+                rows = cursor.fetchall()
+        return dict(zip(card_keys(rows), rows))
+
+    def apply(self, to_insert: list, to_update: list, to_delete: list, embeddings: dict):
+        """
+        Writes the changes in a single transaction: if anything fails, the database is left
+        as it was before the sync. The cards are written WRITE_BATCH at a time with the
+        batched methods of CardDao, and the change of all of them is notified once at the end.
+        """
+        card_dao = CardDao()
+        # A text whose embedding failed is stored with a zero vector, like in the import
+        zero = json.dumps([0.0] * EMBED_DIMENSION)
+
+        def embeddings_of(card):
+            return (
+                embeddings.get(card_to_text_detailed(card), zero),
+                embeddings.get(card_to_text_short(card), zero)
+            )
+
+        changed = []
+        with DBConnection().connection as connection:
+            with connection.cursor() as cursor:
+
+                changed += card_dao.delete_cards_rows(cursor, to_delete, notify=False)
+
+                written = 0
+                for start in range(0, len(to_update), WRITE_BATCH):
+                    batch = to_update[start:start + WRITE_BATCH]
+                    card_dao.update_cards_rows(
+                        cursor,
+                        [json_to_card(card, id_card) for id_card, card, _ in batch],
+                        [embeddings_of(card) for _, card, _ in batch],
+                        [source_hash for _, _, source_hash in batch],
+                        notify=False
+                    )
+                    changed += [id_card for id_card, _, _ in batch]
+                    written += len(batch)
+                    print(f"{written} cards written")
+
+                for start in range(0, len(to_insert), WRITE_BATCH):
+                    batch = to_insert[start:start + WRITE_BATCH]
+                    changed += card_dao.insert_cards(
+                        cursor,
+                        [json_to_card(card, None) for card, _ in batch],
+                        embeddings=[embeddings_of(card) for card, _ in batch],
+                        source_hashes=[source_hash for _, source_hash in batch],
+                        notify=False
+                    )
+                    written += len(batch)
+                    print(f"{written} cards written")
+
+                if changed:
+                    notify_cards_changed(cursor, changed)
+            connection.commit()
+        CardCache().invalidate(to_delete + [id_card for id_card, _, _ in to_update])
+
+
+if __name__ == "__main__":
+    with open('AtomicCards.json', 'r') as file:
+        data = json.load(file)
+    SyncDatabase().start(data)